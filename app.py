@@ -2,13 +2,21 @@ import ast
 import os
 import json
 
-from flask import Flask
-from flask_restx import Api, Resource, reqparse
+from flask import Flask, Response, request
+from flask_restx import Api, Resource, inputs, reqparse
 
-from domain.config import load_config
+from dbs.database import engines
+from domain.config import Settings, get_settings, settings_store
 from domain.enums import EModels
+from domain.errors import PayloadError, QueueFullError
+from domain.metrics import metrics
+from model.parameters import read_params, write_params
+from model.cache import prediction_cache, preprocessing_cache
+from model.registry import registry
+from scripts.calc import apply_settings, batch_job, configure_cache, model_catalog, predict_job, run_calc, search_job, \
+    to_batch, to_search, train_job, warm_models
 from scripts.excel_import import import_data
-from scripts.calc import run_calc
+from scripts.jobs import job_manager, jobs
 
 
 app = Flask(__name__)
@@ -29,69 +37,144 @@ class Data(Resource):
     pass
 
 
+@api.route('/db_pool', endpoint='db_pool', methods=['GET'])
+class DatabasePool(Resource):
+
+    @staticmethod
+    @api.response(200, 'OK')
+    def get():
+        return engines.stats(), 200
+
+
+def service_gauges() -> dict:
+    pools = [({'database': database, 'stat': k}, v) for database, stats in engines.stats().items()
+             for k, v in stats.items() if isinstance(v, (int, float)) and not isinstance(v, bool)]
+    registry_stats = registry.stats()
+    registry_stats['models'] = len(registry_stats['models'])
+    statuses = {}
+    for job in job_manager().list():
+        statuses[job['status']] = statuses.get(job['status'], 0) + 1
+    return {
+        'db_pool': ('Database pool counters and sizes', pools),
+        'model_registry': ('Loaded model registry', [({'stat': k}, v) for k, v in registry_stats.items()]),
+        'preprocessing_cache': ('In-process preprocessing cache',
+                                [({'stat': k}, v) for k, v in preprocessing_cache.stats().items()]),
+        'prediction_cache': ('In-process prediction result cache',
+                             [({'stat': k}, v) for k, v in prediction_cache.stats().items()]),
+        'jobs': ('Known jobs by status', [({'status': k}, v) for k, v in sorted(statuses.items())])
+    }
+
+
+@api.route('/metrics', endpoint='metrics', methods=['GET'])
+class Metrics(Resource):
+
+    @staticmethod
+    @api.doc(
+        description='Prometheus text format: wall-clock and CPU seconds, calls and rows per pipeline stage (app '
+                    'and finished jobs), peak RSS, database pool, model registry, preprocessing and prediction caches '
+                    'and jobs.',
+        responses={
+            200: 'OK'
+        })
+    def get():
+        return Response(metrics.collect().render(service_gauges()), mimetype='text/plain; version=0.0.4')
+
+
 estimated_models_parser_1 = reqparse.RequestParser()
 estimated_models_parser_1.add_argument('model', type=str, help='Model key (for more info check out available models)',
                                        required=True, location='args', choices=list(EModels.name_values_dict().keys()))
+estimated_models_parser_1.add_argument('train_split', type=str, help='Stored train split file to reuse',
+                                       required=False, location='args')
+estimated_models_parser_1.add_argument('test_split', type=str, help='Stored test split file to reuse',
+                                       required=False, location='args')
+estimated_models_parser_1.add_argument('n_alphas', type=int, help='Fit a regularization path with this many alphas',
+                                       required=False, location='args')
+estimated_models_parser_1.add_argument('streaming', type=inputs.boolean, default=False,
+                                       help='Fit from database chunks with bounded memory', required=False,
+                                       location='args')
 
 estimated_models_parser_2 = reqparse.RequestParser()
 estimated_models_parser_2.add_argument('model', type=str, help='Model file name to delete', required=True,
                                        location='args')
 
+estimated_models_parser_3 = reqparse.RequestParser()
+estimated_models_parser_3.add_argument('model', type=str, help='Only list models of this type', required=False,
+                                       location='args', choices=list(EModels.name_values_dict().keys()))
+estimated_models_parser_3.add_argument('latest', type=inputs.boolean, default=False,
+                                       help='Only return the newest model', required=False, location='args')
+estimated_models_parser_3.add_argument('limit', type=inputs.positive, help='Max number of models to list',
+                                       required=False, location='args')
+
 
 @api.route('/estimated_models', endpoint='estimated_models', methods=['GET', 'POST', 'DELETE'])
 class EstimatedModels(Resource):
     api: Api
-    data_path: str
-    estimated_models_path: str
-    params_path: str
-    storage_path: str
+    settings: Settings
 
     def __init__(self, appi: Api = api):
         self.api = appi
-        if cfg['ESTIMATED_MODELS_PATH']:
-            self.estimated_models_path = cfg['ESTIMATED_MODELS_PATH']
-        else:
-            self.estimated_models_path = os.getcwd() + '/res/estimated_models'
-
-        if cfg['MODEL_PARAMETERS_PATH']:
-            self.params_path = cfg['MODEL_PARAMETERS_PATH']
-        else:
-            self.params_path = os.getcwd() + '/data/parameters'
-
-        if cfg['STORAGE_PATH']:
-            self.storage_path = cfg['STORAGE_PATH']
-        else:
-            self.storage_path = os.getcwd() + '/res/split_storage'
+        self.settings = get_settings()
         super().__init__(self.api)
 
+    @api.expect(estimated_models_parser_3)
     @api.doc(
+        params={
+            'model': 'Only list models of this type',
+            'latest': 'Only return the newest model',
+            'limit': 'Max number of models to list'
+        },
         responses={
-            200: 'OK'
+            200: 'OK',
+            404: 'No model of this type.'
         })
     def get(self):
-        return json.dumps({'Estimated models': os.listdir(self.estimated_models_path)}), 200
+        args = estimated_models_parser_3.parse_args()
+        models = model_catalog(self.settings).list(args['model'], 1 if args['latest'] else args['limit'])
+        if args['latest'] and not models:
+            return 'No estimated model found.', 404
+        return json.dumps({'Estimated models': [m['file'] for m in models], 'Catalog': models}), 200
 
     @api.expect(estimated_models_parser_1)
     @api.doc(
         params={
-            'model': 'Model key (for more info check out available models)'
+            'model': 'Model key (for more info check out available models)',
+            'train_split': 'Stored train split file to reuse (instead of querying the database)',
+            'test_split': 'Stored test split file to reuse (instead of querying the database)',
+            'n_alphas': 'Fit the whole regularization path (LASSO_REGRESSION and RIDGE_REGRESSION only)',
+            'streaming': 'Fit from database chunks with bounded memory (saves a slim artifact only)'
         },
         responses={
-            200: 'OK'
+            202: 'Training job submitted.',
+            400: 'Model has no regularization path or streaming is combined with n_alphas or split files.',
+            404: 'Split file not found.',
+            429: 'Too many training jobs.'
         })
     def post(self):
         args = estimated_models_parser_1.parse_args()
-        model = args['model'].replace('_', '').title()
-        path = self.params_path + '/' + model + '_parameters.json'
-        with open(path, 'r') as f:
-            params = dict(json.load(f))
+        if args['n_alphas'] is not None and (args['n_alphas'] < 2 or args['model'] == EModels.LINEAR_REGRESSION.name):
+            return 'n_alphas must be >= 2 and is only available for LASSO_REGRESSION and RIDGE_REGRESSION.', 400
+        if args['streaming'] and (args['n_alphas'] is not None or args['train_split'] or args['test_split']):
+            return 'streaming can not be combined with n_alphas or stored split files.', 400
+        params = read_params(self.settings.params_path, args['model'])
         kwargs = {
-            'storage_path': self.storage_path,
+            'storage_path': self.settings.storage_path,
             'model_id': EModels.get_value_by_name(args['model']),
-            'model_params': params
+            'model_params': params,
+            'models_path': self.settings.estimated_models_path,
+            'slim_artifact': self.settings['SLIM_ARTIFACT'],
+            'n_alphas': args['n_alphas'],
+            'streaming': args['streaming']
         }
-        run_calc(cfg=cfg, mode=1, kwargs=kwargs)
-        return 'Model training completed', 200
+        if args['train_split'] or args['test_split']:
+            split = (args['train_split'], args['test_split'])
+            if not all(f and os.path.isfile(self.settings.storage_path + '/' + f) for f in split):
+                return 'Given split files not found. Check filenames and try again.', 404
+            kwargs['split'] = split
+        try:
+            job = job_manager().enqueue(train_job, self.settings, kwargs)
+        except QueueFullError as e:
+            return str(e), 429
+        return job, 202
 
     @api.expect(estimated_models_parser_2)
     @api.doc(
@@ -104,14 +187,101 @@ class EstimatedModels(Resource):
         })
     def delete(self):
         args = estimated_models_parser_2.parse_args()
-        path = self.estimated_models_path + '/' + args['model']
+        path = self.settings.estimated_models_path + '/' + args['model']
+        registry.drop(path)
+        prediction_cache.forget(path)
+        model_catalog(self.settings).remove(args['model'])
         try:
             os.remove(path)
         except FileNotFoundError:
             return 'Given file not found. Check path and filename and try again.', 404
+        if path.endswith('.json') and os.path.exists(path[:-len('.json')] + '.npz'):
+            os.remove(path[:-len('.json')] + '.npz')
         return 'Completed', 204
 
 
+@api.route('/estimated_models/batch', endpoint='estimated_models_batch', methods=['POST'])
+class BatchEstimatedModels(Resource):
+    api: Api
+    settings: Settings
+
+    def __init__(self, appi: Api = api):
+        self.api = appi
+        self.settings = get_settings()
+        super().__init__(self.api)
+
+    @api.doc(
+        description='Body: {"models": [{"model": model key, "params": {...}}, ...]}. Empty body trains every model '
+                    'with default parameters. Fetches and splits the data once and fits the models in parallel.',
+        responses={
+            202: 'Training job submitted.',
+            400: 'Invalid payload.',
+            429: 'Too many training jobs.'
+        })
+    def post(self):
+        try:
+            models = to_batch(self.api.payload if request.get_data() else None)
+        except PayloadError as e:
+            return str(e), 400
+        kwargs = {
+            'storage_path': self.settings.storage_path,
+            'models': models,
+            'models_path': self.settings.estimated_models_path,
+            'slim_artifact': self.settings['SLIM_ARTIFACT']
+        }
+        try:
+            job = job_manager().enqueue(batch_job, self.settings, kwargs)
+        except QueueFullError as e:
+            return str(e), 429
+        return job, 202
+
+
+@api.route('/training_jobs', endpoint='training_jobs', methods=['GET'])
+class TrainingJobs(Resource):
+
+    @staticmethod
+    @api.response(200, 'OK')
+    def get():
+        return {'Training jobs': job_manager().list()}, 200
+
+
+@api.route('/training_jobs/<string:job_id>', endpoint='training_job', methods=['GET', 'DELETE'])
+class TrainingJob(Resource):
+
+    @staticmethod
+    @api.doc(
+        params={
+            'job_id': 'Training job id'
+        },
+        responses={
+            200: 'OK',
+            404: 'Job not found.'
+        })
+    def get(job_id: str):
+        job = job_manager().describe(job_id)
+        if job is None:
+            return 'Job not found', 404
+        return job, 200
+
+    @staticmethod
+    @api.doc(
+        params={
+            'job_id': 'Training job id'
+        },
+        responses={
+            200: 'Job cancelled.',
+            404: 'Job not found.',
+            409: 'Job can not be cancelled.'
+        })
+    def delete(job_id: str):
+        manager = job_manager()
+        if manager.describe(job_id) is None:
+            return 'Job not found', 404
+        if not manager.cancel(job_id):
+            return 'Job can not be cancelled', 409
+        return manager.describe(job_id), 200
+
+
 params_parser_1 = reqparse.RequestParser()
 params_parser_1.add_argument('model', type=str, help='Model key (for more info check out available models)',
                              required=True, location='args', choices=list(EModels.name_values_dict().keys()))
@@ -126,14 +296,11 @@ params_parser_2.add_argument('model_params', type=str, help='Parameters for mode
 @api.route('/model_parameters', endpoint='model_parameters', methods=['GET', 'PUT'])
 class ModelParameters(Resource):
     api: Api
-    params_path: str
+    settings: Settings
 
     def __init__(self, appi: Api = api):
         self.api = appi
-        if cfg['MODEL_PARAMETERS_PATH']:
-            self.params_path = cfg['MODEL_PARAMETERS_PATH']
-        else:
-            self.params_path = os.getcwd() + '/data/parameters/'
+        self.settings = get_settings()
         super().__init__(self.api)
 
     @api.expect(params_parser_1)
@@ -147,12 +314,8 @@ class ModelParameters(Resource):
         })
     def get(self):
         args = params_parser_1.parse_args()
-        model = args['model'].replace('_', '').title()
-        path = self.params_path + model + '_parameters.json'
         try:
-            with open(path, 'r') as f:
-                data = json.load(f)
-                return data, 200
+            return read_params(self.settings.params_path, args['model']), 200
         except FileNotFoundError:
             return 'Given file not found. Check path and model and try again.', 404
 
@@ -167,16 +330,55 @@ class ModelParameters(Resource):
         })
     def put(self):
         args = params_parser_2.parse_args()
-        model = args['model'].replace('_', '').title()
-        path = self.params_path + model + '_parameters.json'
-        with open(path, 'w') as f:
-            params = ast.literal_eval(args['model_params'])
-            json_object = json.dumps(params, indent=4)
-            f.write(json_object)
-            f.close()
+        write_params(self.settings.params_path, args['model'], ast.literal_eval(args['model_params']))
         return 'Parameters updated.', 200
 
 
+@api.route('/model_parameters/search', endpoint='model_parameters_search', methods=['POST'])
+class ModelParametersSearch(Resource):
+    api: Api
+    settings: Settings
+
+    def __init__(self, appi: Api = api):
+        self.api = appi
+        self.settings = get_settings()
+        super().__init__(self.api)
+
+    @api.doc(
+        description='Body: {"models": {model key: {param: [values]} or {param: {"loguniform": [low, high]}} or '
+                    'null}, "folds": int, "n_iter": int}. Lists only give a grid, distributions give n_iter random '
+                    'candidates. Empty body searches every model over its default space. The best parameters are '
+                    'written to the parameter files.',
+        responses={
+            202: 'Search job submitted.',
+            400: 'Invalid payload.',
+            429: 'Too many training jobs.'
+        })
+    def post(self):
+        payload = self.api.payload if request.get_data() else None
+        try:
+            spaces = to_search(payload)
+        except PayloadError as e:
+            return str(e), 400
+        payload = payload if isinstance(payload, dict) else {}
+        folds = payload.get('folds', self.settings['SEARCH_FOLDS'])
+        n_iter = payload.get('n_iter', self.settings['SEARCH_ITERATIONS'])
+        if not isinstance(folds, int) or not isinstance(n_iter, int) or folds < 2 or n_iter < 1:
+            return '"folds" must be an integer >= 2 and "n_iter" an integer >= 1.', 400
+        kwargs = {
+            'storage_path': self.settings.storage_path,
+            'params_path': self.settings.params_path,
+            'spaces': spaces,
+            'folds': folds,
+            'n_iter': n_iter
+        }
+        try:
+            job = job_manager().enqueue(search_job, self.settings, kwargs)
+        except QueueFullError as e:
+            return str(e), 429
+        return job, 202
+
+
 predictions_parser = reqparse.RequestParser()
 predictions_parser.add_argument('model', type=str, help='Model key (for more info check out available models)',
                                 required=True, location='args')
@@ -185,20 +387,11 @@ predictions_parser.add_argument('model', type=str, help='Model key (for more inf
 @api.route('/predictions', endpoint='predictions', methods=['POST'])
 class Predictions(Resource):
     api: Api
-    estimated_models_path: str
-    predictions_path: str
+    settings: Settings
 
     def __init__(self, appi: Api = api):
         self.api = appi
-        if cfg['ESTIMATED_MODELS_PATH']:
-            self.estimated_models_path = cfg['ESTIMATED_MODELS_PATH']
-        else:
-            self.estimated_models_path = os.getcwd() + '/res/estimated_models'
-
-        if cfg['PREDICTIONS_PATH']:
-            self.predictions_path = cfg['PREDICTIONS_PATH']
-        else:
-            self.predictions_path = os.getcwd() + '/res/predictions'
+        self.settings = get_settings()
         super().__init__(self.api)
 
     @api.expect(predictions_parser)
@@ -208,6 +401,7 @@ class Predictions(Resource):
         },
         responses={
             200: 'OK',
+            400: 'Model can not be used for predictions.',
             404: 'File not found.'
         })
     def post(self):
@@ -215,16 +409,126 @@ class Predictions(Resource):
         model = args['model']
         try:
             kwargs = {
-                'model_path': self.estimated_models_path + '/' + model,
-                'prediction_path': self.predictions_path
+                'model_path': self.settings.estimated_models_path + '/' + model,
+                'prediction_path': self.settings.predictions_path
             }
-            run_calc(cfg, mode=2, kwargs=kwargs)
+            path = run_calc(self.settings, mode=2, kwargs=kwargs)
         except FileNotFoundError:
             return 'Model not found', 404
-        return 'Predictions completed', 200
+        except PayloadError as e:
+            return str(e), 400
+        return {'model': model, 'file': os.path.basename(path)}, 200
 
 
-if __name__ == '__main__':
-    cfg = load_config()
+batch_predictions_parser = reqparse.RequestParser()
+batch_predictions_parser.add_argument('model', type=str, help='Model file name to use.', required=True,
+                                      location='args')
+batch_predictions_parser.add_argument('source', type=str, help='Stored file to score (default: the data table)',
+                                      required=False, location='args')
+
+
+@api.route('/predictions/batch', endpoint='predictions_batch', methods=['POST'])
+class BatchPredictions(Resource):
+    api: Api
+    settings: Settings
+
+    def __init__(self, appi: Api = api):
+        self.api = appi
+        self.settings = get_settings()
+        super().__init__(self.api)
+
+    @api.expect(batch_predictions_parser)
+    @api.doc(
+        params={
+            'model': 'Model file name to use.',
+            'source': 'Parquet, feather or excel file in the split storage folder (default: the data table)'
+        },
+        description='Scores the source in chunks and writes run_id=<id>/part-*.parquet with a _run.json summary '
+                    '(rows, seconds, rows_per_sec).',
+        responses={
+            202: 'Prediction job submitted.',
+            404: 'Model or source file not found.',
+            429: 'Too many jobs.'
+        })
+    def post(self):
+        args = batch_predictions_parser.parse_args()
+        kwargs = {
+            'model_path': self.settings.estimated_models_path + '/' + args['model'],
+            'prediction_path': self.settings.predictions_path
+        }
+        if not os.path.isfile(kwargs['model_path']):
+            return 'Model not found', 404
+        if args['source']:
+            kwargs['source'] = self.settings.storage_path + '/' + os.path.basename(args['source'])
+            if not os.path.isfile(kwargs['source']):
+                return 'Source file not found', 404
+        try:
+            job = job_manager().enqueue(predict_job, self.settings, kwargs)
+        except QueueFullError as e:
+            return str(e), 429
+        return job, 202
+
+
+scores_parser = reqparse.RequestParser()
+scores_parser.add_argument('model', type=str, help='Model file name to use.', required=True, location='args')
+scores_parser.add_argument('alpha', type=float, help='Alpha on the regularization path (path models only).',
+                           required=False, location='args')
+
+
+@api.route('/scores', endpoint='scores', methods=['POST'])
+class Scores(Resource):
+    api: Api
+    settings: Settings
+
+    def __init__(self, appi: Api = api):
+        self.api = appi
+        self.settings = get_settings()
+        super().__init__(self.api)
+
+    @api.expect(scores_parser)
+    @api.doc(
+        params={
+            'model': 'Model file name to use.',
+            'alpha': 'Alpha on the regularization path (path models only).'
+        },
+        description='Body: {"rows": [{feature: value, ...}, ...]} or {"columns": {feature: [values], ...}}',
+        responses={
+            200: 'OK',
+            400: 'Invalid payload.',
+            404: 'File not found.'
+        })
+    def post(self):
+        args = scores_parser.parse_args()
+        model = args['model']
+        try:
+            kwargs = {
+                'model_path': self.settings.estimated_models_path + '/' + model,
+                'payload': self.api.payload,
+                'alpha': args['alpha']
+            }
+            predictions = run_calc(self.settings, mode=4, kwargs=kwargs)
+        except FileNotFoundError:
+            return 'Model not found', 404
+        except PayloadError as e:
+            return str(e), 400
+        return {'model': model, 'predictions': predictions}, 200
+
+
+def startup(cfg: Settings, watch: bool = True):
+    engines.configure(cfg['DB_POOL_SIZE'], cfg['DB_MAX_OVERFLOW'], cfg['DB_POOL_TIMEOUT'], cfg['DB_POOL_RECYCLE'],
+                      cfg['DB_POOL_PRE_PING'])
     import_data(cfg)
+    model_catalog(cfg).sync(cfg.estimated_models_path)
+    warm_models(cfg)
+    configure_cache(cfg)
+    jobs.configure(cfg['TRAINING_WORKERS'], cfg['TRAINING_QUEUE_SIZE'], cfg['TRAINING_CANCELLATION'],
+                   cfg['TRAINING_HISTORY'])
+    settings_store.subscribe(apply_settings)
+    if watch:
+        settings_store.watch(cfg['CONFIG_RELOAD_INTERVAL'])
+
+
+if __name__ == '__main__':
+    cfg = get_settings()
+    startup(cfg)
     app.run(debug=cfg['DEBUG'])
@@ -0,0 +1,43 @@
+import argparse
+import joblib
+import numpy as np
+import os
+import tempfile
+
+from time import perf_counter
+
+from benchmarks.synthetic import make_data
+from model.artifact import artifact_size, load_artifact
+from scripts.calc import train
+
+
+def timed(f, repeat: int) -> float:
+    start = perf_counter()
+    for _ in range(repeat):
+        f()
+    return (perf_counter() - start) / repeat
+
+
+def run(rows: int, model_id: int, repeat: int):
+    data = make_data(rows)
+    with tempfile.TemporaryDirectory() as storage, tempfile.TemporaryDirectory() as models:
+        pkl = train(data, storage, model_id, None, models, slim_artifact=True)
+        slim = pkl[:-len('.pkl')] + '.json'
+        pipe, predictor = joblib.load(pkl), load_artifact(slim)
+        x = pipe.dataset.x_test
+        assert np.allclose(pipe.score(x), predictor.score(x))
+        pkl_size, slim_size = os.path.getsize(pkl), artifact_size(slim)
+        pkl_load, slim_load = timed(lambda: joblib.load(pkl), repeat), timed(lambda: load_artifact(slim), repeat)
+    print(f'{rows:>9} rows | size pkl {pkl_size / 1024:10.1f} KiB slim {slim_size / 1024:6.1f} KiB '
+          f'(x{pkl_size / slim_size:.0f}) | load pkl {pkl_load * 1000:8.2f} ms slim {slim_load * 1000:6.2f} ms '
+          f'(x{pkl_load / slim_load:.1f})')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pickled Pipe vs slim artifact: size and load time')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--model', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    for n in args.rows:
+        run(n, args.model, args.repeat)
@@ -0,0 +1,51 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+from time import perf_counter
+
+from domain.config import build_settings, get_settings, load_config
+
+
+def per_call(f, n: int) -> float:
+    start = perf_counter()
+    for _ in range(n):
+        f()
+    return (perf_counter() - start) / n
+
+
+def legacy_paths(cfg: dict) -> tuple:
+    return tuple(cfg[key] if cfg[key] else os.getcwd() + default for key, default in (
+        ('ESTIMATED_MODELS_PATH', '/res/estimated_models'), ('MODEL_PARAMETERS_PATH', '/data/parameters'),
+        ('STORAGE_PATH', '/res/split_storage'), ('PREDICTIONS_PATH', '/res/predictions')))
+
+
+def settings_paths() -> tuple:
+    settings = get_settings()
+    return settings.estimated_models_path, settings.params_path, settings.storage_path, settings.predictions_path
+
+
+def startup(runs: int) -> float:
+    times = []
+    for _ in range(runs):
+        start = perf_counter()
+        subprocess.run([sys.executable, '-c', 'import app; app.get_settings()'], check=True)
+        times.append(perf_counter() - start)
+    return statistics.median(times)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Settings build, per-request lookup and app startup time')
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+    cfg = load_config()
+    get_settings()
+    print(f'load_config    {per_call(load_config, args.calls) * 1e6:10.1f} us/call')
+    print(f'build_settings {per_call(build_settings, args.calls) * 1e6:10.1f} us/call')
+    print(f'get_settings   {per_call(get_settings, args.calls) * 1e6:10.1f} us/call')
+    print(f'paths: cfg + os.getcwd {per_call(lambda: legacy_paths(cfg), args.calls) * 1e6:8.2f} us/request | '
+          f'settings {per_call(settings_paths, args.calls) * 1e6:8.2f} us/request')
+    print(f'app import + settings  {startup(args.runs):8.3f} s (median of {args.runs})')
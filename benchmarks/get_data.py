@@ -0,0 +1,46 @@
+import argparse
+import os
+import pandas as pd
+import tempfile
+
+from time import perf_counter
+
+from benchmarks.synthetic import make_database
+from dbs.database import DatabaseSession
+from dbs.entities import Data
+from scripts.calc import DATA_COLUMNS, get_data
+
+
+def get_data_rows(cfg: dict) -> pd.DataFrame:
+    with DatabaseSession(cfg['SQLALCHEMY_DATABASE']) as session:
+        qr = session.query(*[getattr(Data, name) for name in DATA_COLUMNS]).all()
+    return pd.DataFrame([[result[i] for i in range(len(qr[0]))] for result in qr], columns=DATA_COLUMNS)
+
+
+def run(rows: int, chunk_size: int, legacy: bool):
+    with tempfile.TemporaryDirectory() as directory:
+        cfg = {'SQLALCHEMY_DATABASE': 'sqlite:///' + os.path.join(directory, 'bench.sqlite'),
+               'FETCH_CHUNK_SIZE': chunk_size}
+        make_database(cfg['SQLALCHEMY_DATABASE'], rows)
+        start = perf_counter()
+        new = get_data(cfg)
+        new_time = perf_counter() - start
+        if not legacy:
+            print(f'{rows:>9} rows | chunked float64 {new_time:8.3f} s')
+            return
+        start = perf_counter()
+        old = get_data_rows(cfg)
+        old_time = perf_counter() - start
+    pd.testing.assert_frame_equal(old.sort_values('id').reset_index(drop=True), new, check_dtype=False)
+    print(f'{rows:>9} rows | row build {old_time:8.3f} s | chunked float64 {new_time:8.3f} s | '
+          f'x{old_time / new_time:.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Row-by-row vs chunked columnar get_data')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    parser.add_argument('--no-legacy', action='store_true', help='Skip the row-by-row function (memory hungry)')
+    args = parser.parse_args()
+    for n in args.rows:
+        run(n, args.chunk_size, not args.no_legacy)
@@ -0,0 +1,63 @@
+import argparse
+import os
+
+from bs4 import BeautifulSoup
+from time import perf_counter
+from typing import List
+
+from data.parser.parser import get_university_data
+
+FIXTURES: str = os.path.join(os.path.dirname(__file__), os.pardir, 'tests', 'fixtures', 'parser')
+
+
+def get_university_data_legacy(html: bytes) -> List[str]:
+    soup_current = BeautifulSoup(html, 'html.parser')
+
+    result_current = soup_current.find_all('td')
+    result_current1 = list(soup_current.find_all('td', attrs={'class': 'n'})[ijk]
+                           for ijk in range(0, len(soup_current.find_all('td', attrs={'class': 'n'}))))
+
+    l1 = []
+    for ijk in range(0, len(result_current)):
+        l1.append(result_current[ijk].text)
+
+    l2 = []
+    for ijk in result_current1[0:6]:
+        l2.append(l1[int(l1.index(ijk.text)) + 1])
+
+    for ijk in result_current1[6:]:
+        l2.append(l1[int(l1.index(ijk.text)) + 2])
+
+    return l2
+
+
+def make_page(labels: int) -> bytes:
+    rows = [f'<tr><td class="n">Label {i}</td><td>value {i}</td></tr>' for i in range(6)]
+    rows += [f'<tr><td>{i}</td><td class="n">Indicator {i}</td><td>points</td><td>{i}.5</td></tr>'
+             for i in range(6, labels)]
+    return ('<html><body><table>' + ''.join(rows) + '</table></body></html>').encode()
+
+
+def timed(f, html: bytes, repeat: int) -> float:
+    start = perf_counter()
+    for _ in range(repeat):
+        f(html)
+    return (perf_counter() - start) / repeat
+
+
+def run(name: str, html: bytes, repeat: int):
+    assert get_university_data_legacy(html) == get_university_data(html)
+    old, new = timed(get_university_data_legacy, html, repeat), timed(get_university_data, html, repeat)
+    print(f'{name:>16} | legacy {old * 1000:9.2f} ms | single pass {new * 1000:8.2f} ms | x{old / new:.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Quadratic vs single-pass university page extraction')
+    parser.add_argument('--labels', type=int, nargs='+', default=[100, 500])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    for file in sorted(f for f in os.listdir(FIXTURES) if f.startswith('inst_')):
+        with open(os.path.join(FIXTURES, file), 'rb') as f:
+            run(file, f.read(), args.repeat)
+    for n in args.labels:
+        run(f'{n} labels', make_page(n), max(1, args.repeat // 10))
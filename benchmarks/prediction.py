@@ -0,0 +1,36 @@
+import argparse
+import os
+import tempfile
+
+from time import perf_counter
+
+from benchmarks.synthetic import make_data
+from model.registry import registry
+from model.storage import iter_frame, load_frame, save_frame
+from scripts.calc import predict_batch, train
+
+
+def run(rows: int, chunk_size: int, workers: list, excel: bool):
+    with tempfile.TemporaryDirectory() as directory:
+        model_path = train(make_data(20000), directory, 3, None, directory)
+        file = save_frame(make_data(rows, seed=37), os.path.join(directory, 'input'), 'parquet')
+        pipe = registry.get(model_path)
+        start = perf_counter()
+        storage_format = 'excel' if excel else 'parquet'
+        pipe.save_predict(pipe.score(load_frame(file)), directory, storage_format)
+        line = f'{rows:>9} rows | one shot {storage_format} {rows / (perf_counter() - start):>10.0f} rows/s'
+        for n_jobs in workers:
+            result = predict_batch(model_path, iter_frame(file, chunk_size), directory, n_jobs)
+            line += f' | {n_jobs} workers {result["rows_per_sec"]:>10.0f} rows/s'
+    print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='One-shot vs chunked parallel batch prediction')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--excel', action='store_true', help='Write the one-shot output as excel (legacy format)')
+    args = parser.parse_args()
+    for n in args.rows:
+        run(n, args.chunk_size, args.workers, args.excel)
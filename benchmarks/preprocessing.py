@@ -0,0 +1,75 @@
+import argparse
+import numpy as np
+import pandas as pd
+import tracemalloc
+
+from scipy import sparse
+from sklearn.compose import ColumnTransformer
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+from time import perf_counter
+
+from benchmarks.synthetic import make_data
+from model.base import Preprocessing
+
+
+class LegacyPreprocessing(Preprocessing):
+
+    def __init__(self, dataset: pd.DataFrame):
+        super().__init__(dataset)
+        self.column_transformer = ColumnTransformer([
+            ('ohe', OneHotEncoder(handle_unknown="ignore"), self.cat),
+            ('scaling', StandardScaler(), self.num)
+        ])
+
+    def fit_transform(self, x_train: pd.DataFrame):
+        x_train[self.cat] = x_train[self.cat].astype(str)
+        x_train[self.num] = x_train[self.num].astype(float)
+        x_train[self.to_binarize] = x_train[self.to_binarize].isna().astype(int)
+        x_train[self.num] = x_train[self.num].fillna(value=self.fill_values)
+        x_train[self.cat] = x_train[self.cat].fillna(-1000)
+        return self.column_transformer.fit_transform(x_train)
+
+    def transform(self, x_test: pd.DataFrame):
+        return self.legacy_transform(x_test)
+
+
+def make_frame(rows: int, categorical: int) -> pd.DataFrame:
+    data = make_data(rows).drop(columns='edu_index')
+    rng = np.random.default_rng(36)
+    for i in range(categorical):
+        data[f'cat_{i}'] = rng.choice(['a', 'b', 'c', 'd', None], rows).astype(object)
+    return data
+
+
+def measure(f) -> tuple:
+    tracemalloc.start()
+    start = perf_counter()
+    result = f()
+    elapsed = perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def dense(x) -> np.ndarray:
+    return x.toarray() if sparse.issparse(x) else np.asarray(x)
+
+
+def run(rows: int, categorical: int):
+    data = make_frame(rows, categorical)
+    legacy, new, copy = LegacyPreprocessing(data), Preprocessing(data), data.copy()
+    old_x, old_time, old_peak = measure(lambda: legacy.fit_transform(copy))
+    new_x, new_time, new_peak = measure(lambda: new.fit_transform(data))
+    assert np.allclose(dense(old_x), dense(new_x))
+    print(f'{rows:>9} rows {categorical} cat | legacy {old_time:7.3f} s {old_peak / 2 ** 20:8.1f} MiB | '
+          f'numpy plan {new_time:7.3f} s {new_peak / 2 ** 20:8.1f} MiB | x{old_time / new_time:.1f} time, '
+          f'x{old_peak / new_peak:.1f} memory')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='ColumnTransformer vs NumPy plan preprocessing')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 500000])
+    parser.add_argument('--categorical', type=int, default=0)
+    args = parser.parse_args()
+    for n in args.rows:
+        run(n, args.categorical)
@@ -0,0 +1,31 @@
+import argparse
+import os
+import tempfile
+
+from benchmarks.preprocessing import measure
+from benchmarks.synthetic import make_database
+from model.base import Dataset
+from scripts.calc import fit, fit_stream, get_data, iter_data, to_data_frame
+
+
+def run(rows: int, chunk_size: int, model_id: int):
+    with tempfile.TemporaryDirectory() as directory:
+        cfg = {'SQLALCHEMY_DATABASE': 'sqlite:///' + os.path.join(directory, 'bench.sqlite'),
+               'FETCH_CHUNK_SIZE': chunk_size}
+        make_database(cfg['SQLALCHEMY_DATABASE'], rows)
+        _, stream_time, stream_peak = measure(lambda: fit_stream(
+            lambda: (to_data_frame(v) for v in iter_data(cfg)), model_id, None, 'edu_index', directory, seed=36))
+        _, memory_time, memory_peak = measure(lambda: fit(
+            Dataset(get_data(cfg), 'data', 'edu_index', directory, seed=36), model_id, None, directory))
+    print(f'{rows:>9} rows | in memory {memory_time:7.2f} s {memory_peak / 2 ** 20:8.1f} MiB | '
+          f'streaming {stream_time:7.2f} s {stream_peak / 2 ** 20:8.1f} MiB')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='In-memory vs streaming (chunked Gram) training')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 500000])
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    parser.add_argument('--model', type=int, default=3)
+    args = parser.parse_args()
+    for n in args.rows:
+        run(n, args.chunk_size, args.model)
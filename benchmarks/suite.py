@@ -0,0 +1,185 @@
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from time import perf_counter
+from typing import Callable, Dict, List, Optional
+
+from werkzeug.serving import make_server
+
+from benchmarks.synthetic import make_sink
+from domain.config import Settings, load_config, settings_store
+from domain.enums import EModels
+from model.parameters import read_params
+from model.registry import registry
+from scripts.calc import get_data, iter_data, predict, predict_batch, to_data_frame, train
+from scripts.excel_import import import_data
+
+STEPS: List[str] = ['import', 'get_data', 'train', 'predict', 'rest']
+
+
+def timed(results: Dict[str, float], key: str, f: Callable):
+    start = perf_counter()
+    result = f()
+    results[key] = round(perf_counter() - start, 4)
+    print(f'{key:<40} {results[key]:10.3f} s', flush=True)
+    return result
+
+
+def make_settings(directory: str, sink: str) -> Settings:
+    cfg = load_config()
+    cfg.update({
+        'UPDATE_DATA': True,
+        'DATA_PATH': sink,
+        'INCREMENTAL_IMPORT': False,
+        'SQLALCHEMY_DATABASE': 'sqlite:///' + os.path.join(directory, 'bench.sqlite'),
+        'MODEL_PARAMETERS_PATH': os.path.join(os.getcwd(), 'data', 'parameters'),
+        'MODEL_REGISTRY_WARM': 0,
+        'PREPROCESSING_CACHE_SIZE': 0
+    })
+    for key in ('STORAGE_PATH', 'PREDICTIONS_PATH', 'ESTIMATED_MODELS_PATH'):
+        cfg[key] = os.path.join(directory, key.lower())
+        os.makedirs(cfg[key])
+    return Settings.from_config(cfg)
+
+
+def request(connection: http.client.HTTPConnection, method: str, path: str, body: Optional[dict] = None) -> float:
+    start = perf_counter()
+    payload = json.dumps(body).encode() if body is not None else None
+    connection.request(method, path, payload, {'Content-Type': 'application/json'} if payload else {})
+    response = connection.getresponse()
+    response.read()
+    if response.status >= 400:
+        raise RuntimeError(f'{method} {path}: HTTP {response.status}')
+    return perf_counter() - start
+
+
+def load(port: int, method: str, path: str, body: Optional[dict], clients: int, requests: int) -> List[float]:
+
+    def client(n: int) -> List[float]:
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        try:
+            return [request(connection, method, path, body) for _ in range(n)]
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        shares = [requests // clients + (i < requests % clients) for i in range(clients)]
+        return [t for times in pool.map(client, shares) for t in times]
+
+
+def rest(results: Dict[str, float], prefix: str, settings: Settings, model: str, rows: List[dict], clients: int,
+         requests: int):
+    from app import app
+    settings_store.settings = settings
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        for name, method, path, body in (
+                ('models', 'GET', '/models', None),
+                ('scores', 'POST', f'/scores?model={model}', {'rows': rows}),
+                ('metrics', 'GET', '/metrics', None)):
+            start = perf_counter()
+            latencies = sorted(load(server.server_port, method, path, body, clients, requests))
+            elapsed = perf_counter() - start
+            results[f'{prefix}/rest/{name}/p50'] = round(statistics.median(latencies), 5)
+            results[f'{prefix}/rest/{name}/p95'] = round(latencies[int(0.95 * (len(latencies) - 1))], 5)
+            print(f'{prefix}/rest/{name:<31} {requests / elapsed:10.0f} req/s | p50 '
+                  f'{results[f"{prefix}/rest/{name}/p50"] * 1000:7.2f} ms | p95 '
+                  f'{results[f"{prefix}/rest/{name}/p95"] * 1000:7.2f} ms', flush=True)
+    finally:
+        server.shutdown()
+        thread.join()
+
+
+def run(rows: int, steps: List[str], clients: int, requests: int) -> Dict[str, float]:
+    results = {}
+    prefix = f'{rows}'
+    with tempfile.TemporaryDirectory() as directory:
+        sink = make_sink(os.path.join(directory, 'crawl'), rows)
+        settings = make_settings(directory, sink)
+        timed(results, f'{prefix}/import', lambda: import_data(settings))
+        data = timed(results, f'{prefix}/get_data', lambda: get_data(settings)) if 'get_data' in steps else \
+            get_data(settings)
+        models = {}
+        for model in EModels:
+            params = read_params(settings.params_path, model.name)
+            models[model.name] = timed(results, f'{prefix}/train/{model.name}', lambda: train(
+                data, settings.storage_path, model.value, params, settings.estimated_models_path,
+                slim_artifact=True, seed=settings['SEED']))
+        del data
+        if 'predict' in steps:
+            for name, path in models.items():
+                timed(results, f'{prefix}/predict/{name}', lambda: predict(path, settings.predictions_path))
+            timed(results, f'{prefix}/predict_batch', lambda: predict_batch(
+                models[EModels.LINEAR_REGRESSION.name], (to_data_frame(v) for v in iter_data(settings)),
+                settings.predictions_path, settings['PREDICTION_WORKERS']))
+        if 'rest' in steps:
+            path = models[EModels.RIDGE_REGRESSION.name]
+            sample = to_data_frame(next(iter_data(settings, 100)))[registry.get(path).features]
+            payload = sample.astype(object).where(sample.notna(), None).to_dict(orient='records')
+            rest(results, prefix, settings, os.path.basename(path), payload, clients, requests)
+        registry.clear()
+    return {k: v for k, v in results.items() if k.split('/')[1] in steps}
+
+
+def commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def check(history: List[dict], results: Dict[str, float], threshold: float) -> List[str]:
+    regressions = []
+    for key, value in results.items():
+        previous = [run['results'][key] for run in history if key in run['results']]
+        if previous and value > previous[-1] * (1 + threshold) and value - previous[-1] > 0.001:
+            regressions.append(f'{key}: {previous[-1]:.4f} s -> {value:.4f} s (+{value / previous[-1] - 1:.0%})')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='End-to-end import, get_data, train, predict and REST benchmarks')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 100000, 1000000])
+    parser.add_argument('--steps', nargs='+', choices=STEPS, default=STEPS)
+    parser.add_argument('--clients', type=int, default=8, help='Concurrent REST clients')
+    parser.add_argument('--requests', type=int, default=400, help='REST requests per endpoint')
+    parser.add_argument('--history', default=os.path.join('res', 'benchmarks', 'history.json'))
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed slowdown vs the previous run')
+    parser.add_argument('--no-save', action='store_true', help='Check against the history without appending')
+    args = parser.parse_args()
+
+    results = {}
+    for n in args.rows:
+        results.update(run(n, args.steps, args.clients, args.requests))
+
+    history = []
+    if os.path.exists(args.history):
+        with open(args.history, 'r') as f:
+            history = json.load(f)
+    machine = f'{platform.node()}|{platform.machine()}|{platform.python_version()}'
+    regressions = check([run for run in history if run['machine'] == machine], results, args.threshold)
+    if not args.no_save:
+        history.append({'timestamp': datetime.now().isoformat(timespec='seconds'), 'commit': commit(),
+                        'machine': machine, 'results': results})
+        os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+        with open(args.history + '.tmp', 'w') as f:
+            json.dump(history, f, indent=4)
+        os.replace(args.history + '.tmp', args.history)
+    for regression in regressions:
+        print('REGRESSION ' + regression)
+    sys.exit(1 if regressions else 0)
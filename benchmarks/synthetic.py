@@ -0,0 +1,51 @@
+import numpy as np
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from sqlalchemy import create_engine
+
+from data.parser.sink import KEY_COLUMNS, TEXT_COLUMNS, ParquetSink
+from dbs.entities import Data, db
+from domain.enums import DataSheetIndexes
+
+
+def make_data(rows: int, seed: int = 36, missing: float = 0.1) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    columns = list(DataSheetIndexes.name_values_dict().keys())
+    values = rng.normal(50, 15, size=(rows, len(columns) - 1))
+    values[rng.random(values.shape) < missing] = np.nan
+    values[rng.random(rows) < 0.6, -1] = np.nan
+    data = pd.DataFrame(values, columns=columns[1:])
+    data['edu_index'] = np.nan_to_num(values[:, 1:11]).sum(axis=1) / 10 + rng.normal(0, 1, rows)
+    data.insert(0, 'id', np.arange(1, rows + 1))
+    return data
+
+
+def make_database(url: str, rows: int, seed: int = 36, chunk_size: int = 50000):
+    engine = create_engine(url)
+    db.metadata.drop_all(bind=engine, tables=[Data.__table__])
+    db.metadata.create_all(bind=engine, tables=[Data.__table__])
+    for start in range(0, rows, chunk_size):
+        data = make_data(min(chunk_size, rows - start), seed + start)
+        data['id'] += start
+        data.to_sql(Data.__tablename__, engine, if_exists='append', index=False)
+    engine.dispose()
+
+
+def make_sink(directory: str, rows: int, seed: int = 36, chunk_size: int = 50000) -> str:
+    sink = ParquetSink(directory)
+    for region, start in enumerate(range(0, rows, chunk_size)):
+        data = make_data(min(chunk_size, rows - start), seed + start)
+        n = data.shape[0]
+        arrays = [pa.array(data['id'].to_numpy() + start), pa.array([f'university {i}' for i in range(n)])]
+        arrays += [pa.array([f'text {i}'] * n) for i in range(TEXT_COLUMNS)]
+        for column in data.columns[1:]:
+            values = data[column].to_numpy()
+            arrays.append(pa.array(values.astype(str), mask=np.isnan(values)))
+        names = KEY_COLUMNS + [f'text_{i}' for i in range(TEXT_COLUMNS)] + list(data.columns[1:])
+        path = sink.partition(f'region {region}')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pq.write_table(pa.Table.from_arrays(arrays, names=names), path)
+    return directory
@@ -1,98 +1,173 @@
-import pandas as pd
+import http.client
 import os
 import ssl
-import urllib.request
+import threading
+import time
 import urllib.parse
 
 from bs4 import BeautifulSoup
-
-
-def get_regions(ctx):
-    url = 'http://indicators.miccedu.ru/monitoring/2019/index.php?m=vpo'
-
-    html = urllib.request.urlopen(url, context=ctx).read()
+from collections import defaultdict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from data.parser.sink import ParquetSink
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+BASE_URL: str = 'http://indicators.miccedu.ru/monitoring/2019/'
+RETRY_STATUSES: tuple = (429, 500, 502, 503, 504)
+
+
+class FetchError(IOError):
+
+    def __init__(self, url: str, status: int):
+        super().__init__(f'{url}: HTTP {status}')
+        self.status = status
+
+
+class Fetcher:
+
+    def __init__(self, ctx: Optional[ssl.SSLContext] = None, per_host: int = 4, retries: int = 3,
+                 backoff: float = 0.5, timeout: float = 30):
+        self.ctx = ctx
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.local = threading.local()
+        self.semaphores = defaultdict(lambda: threading.BoundedSemaphore(per_host))
+        self.lock = threading.Lock()
+
+    def semaphore(self, host: str) -> threading.BoundedSemaphore:
+        with self.lock:
+            return self.semaphores[host]
+
+    def connection(self, scheme: str, host: str) -> http.client.HTTPConnection:
+        if not hasattr(self.local, 'connections'):
+            self.local.connections = {}
+        if (scheme, host) not in self.local.connections:
+            if scheme == 'https':
+                connection = http.client.HTTPSConnection(host, timeout=self.timeout, context=self.ctx)
+            else:
+                connection = http.client.HTTPConnection(host, timeout=self.timeout)
+            self.local.connections[(scheme, host)] = connection
+        return self.local.connections[(scheme, host)]
+
+    def drop(self, scheme: str, host: str):
+        connection = getattr(self.local, 'connections', {}).pop((scheme, host), None)
+        if connection is not None:
+            connection.close()
+
+    def get(self, url: str) -> bytes:
+        parts = urllib.parse.urlsplit(url)
+        path = parts.path + ('?' + parts.query if parts.query else '')
+        with self.semaphore(parts.netloc):
+            for attempt in range(self.retries + 1):
+                try:
+                    connection = self.connection(parts.scheme, parts.netloc)
+                    connection.request('GET', path, headers={'Connection': 'keep-alive'})
+                    response = connection.getresponse()
+                    body = response.read()
+                    if response.will_close:
+                        self.drop(parts.scheme, parts.netloc)
+                    if response.status >= 400:
+                        raise FetchError(url, response.status)
+                    return body
+                except (http.client.HTTPException, OSError) as e:
+                    self.drop(parts.scheme, parts.netloc)
+                    retryable = not isinstance(e, FetchError) or e.status in RETRY_STATUSES
+                    if not retryable or attempt == self.retries:
+                        raise
+                    time.sleep(self.backoff * 2 ** attempt)
+
+
+def get_regions(fetcher: Fetcher, base_url: str = BASE_URL) -> Dict[str, str]:
+    url = base_url + 'index.php?m=vpo'
+
+    html = fetcher.get(url)
     soup = BeautifulSoup(html, 'html.parser')
     result = soup.find_all('a')
 
     regions = {}
     for region in result:
-        if region.get('href').startswith('_vpo/material.php?type=2'):
-            regions[str(region.text)] = region.get('href')
+        if region.get('href', '').startswith('_vpo/material.php?type=2'):
+            regions[str(region.text)] = urllib.parse.urljoin(url, region.get('href'))
 
     return regions
 
 
-def get_universities_data(url_univ, ctx):
-    html = urllib.request.urlopen(url_univ, context=ctx).read()
-    soup = BeautifulSoup(html, 'html.parser')
+def get_cells(html: bytes) -> List[Tuple[str, bool]]:
+    if lxml is not None:
+        return [(td.text_content(), 'n' in (td.get('class') or '').split())
+                for td in lxml.html.fromstring(html).iter('td')]
+    return [(td.text, 'n' in td.get('class', [])) for td in BeautifulSoup(html, 'html.parser').find_all('td')]
 
-    universities = {}
-    result = soup.find_all('a')
 
-    for university in result:
-        if university.get('href').startswith('inst'):
-            universities[str(university.text)] = university.get('href')
+def get_university_data(html: bytes) -> List[str]:
+    cells = get_cells(html)
 
-    basic_url = 'http://indicators.miccedu.ru/monitoring/2019/_vpo/'
+    index = {}
+    labels = []
+    for i, (text, label) in enumerate(cells):
+        index.setdefault(text, i)
+        if label:
+            labels.append(text)
 
-    universities_data = {}
+    return [cells[index[text] + (1 if i < 6 else 2)][0] for i, text in enumerate(labels)]
 
-    for i in list(universities.keys()):
-        print('Now searching for data about university: ' + str(i))
-        url_current = str(basic_url + universities[i])
-        html_current = urllib.request.urlopen(url_current, context=ctx).read()
-        soup_current = BeautifulSoup(html_current, 'html.parser')
 
-        result_current = soup_current.find_all('td')
-        result_current1 = list(soup_current.find_all('td', attrs={'class': 'n'})[ijk]
-                               for ijk in range(0, len(soup_current.find_all('td', attrs={'class': 'n'}))))
+def get_inst_id(url: str) -> int:
+    return int(urllib.parse.parse_qs(urllib.parse.urlsplit(url).query)['id'][0])
 
-        l1 = []
-        for ijk in range(0, len(result_current)):
-            l1.append(result_current[ijk].text)
 
-        l2 = []
-        for ijk in result_current1[0:6]:
-            l2.append(l1[int(l1.index(ijk.text)) + 1])
+def get_universities_data(url_univ: str, fetcher: Fetcher, pool: ThreadPoolExecutor,
+                          parsers: Executor) -> List[Tuple[int, str, List[str]]]:
+    soup = BeautifulSoup(fetcher.get(url_univ), 'html.parser')
 
-        for ijk in result_current1[6:]:
-            l2.append(l1[int(l1.index(ijk.text)) + 2])
+    universities = {}
+    result = soup.find_all('a')
 
-        universities_data[i] = l2
-        print('It\'s done with ' + str(i))
-        print('\n')
+    for university in result:
+        if university.get('href', '').startswith('inst'):
+            universities[str(university.text)] = urllib.parse.urljoin(url_univ, university.get('href'))
 
-    return universities_data
+    def fetch(name: str):
+        print('Now searching for data about university: ' + str(name))
+        return parsers.submit(get_university_data, fetcher.get(universities[name]))
 
+    data = []
+    for name, future in zip(universities, list(pool.map(fetch, universities))):
+        data.append((get_inst_id(universities[name]), name, future.result()))
+        print('It\'s done with ' + str(name))
+    return data
 
-def get_columns(ctx):
-    url_for_columns = 'http://indicators.miccedu.ru/monitoring/2019/_vpo/inst.php?id=1944'
 
-    html_for_columns = urllib.request.urlopen(url_for_columns, context=ctx).read()
-    soup_for_columns = BeautifulSoup(html_for_columns, 'html.parser')
+def get_columns(fetcher: Fetcher, base_url: str = BASE_URL) -> List[str]:
+    url_for_columns = base_url + '_vpo/inst.php?id=1944'
 
-    columns = list(soup_for_columns.find_all('td', attrs={'class': 'n'})[ijk].text.strip()
-                   for ijk in range(0, len(soup_for_columns.find_all('td', attrs={'class': 'n'}))))
-    return columns
+    return [text.strip() for text, label in get_cells(fetcher.get(url_for_columns)) if label]
 
 
-def run_parser():
+def run_parser(base_url: str = BASE_URL, output: Optional[str] = None, workers: int = 8, per_host: int = 4,
+               retries: int = 3, backoff: float = 0.5, parsers: Optional[int] = None) -> str:
     ctx = ssl.create_default_context()
     ctx.check_hostname = False
     ctx.verify_mode = ssl.CERT_NONE
 
-    regs = get_regions(ctx)
+    fetcher = Fetcher(ctx, per_host, retries, backoff)
+    sink = ParquetSink(output if output else os.getcwd() + '/data/dataset/crawl')
 
-    cols = get_columns(ctx)
+    regs = get_regions(fetcher, base_url)
 
-    dataframe = pd.DataFrame(columns=cols)
+    cols = get_columns(fetcher, base_url)
 
-    for i in regs:
-        url_uni = 'http://indicators.miccedu.ru/monitoring/2019/' + regs[i]
-        uni_data = get_universities_data(url_uni, ctx)
-        df = pd.DataFrame.from_dict(uni_data, orient='index', columns=cols)
-        dataframe = dataframe.append(df)
+    with ThreadPoolExecutor(max_workers=workers) as pool, ProcessPoolExecutor(max_workers=parsers) as parse_pool:
+        for i in regs:
+            if not sink.done(i):
+                sink.write(i, cols, get_universities_data(regs[i], fetcher, pool, parse_pool))
 
-        print('*************\nNOW DONE WITH ' + str(i) + '\n*************\n')
+            print('*************\nNOW DONE WITH ' + str(i) + '\n*************\n')
 
-    dataframe.to_excel(os.getcwd() + '/data/dataset/data.xlsx')
+    return sink.directory
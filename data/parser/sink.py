@@ -0,0 +1,79 @@
+import hashlib
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import urllib.parse
+
+from typing import Iterator, List, Optional, Tuple
+
+PARTITION: str = 'region'
+PART_FILE: str = 'part-0.parquet'
+KEY_COLUMNS: List[str] = ['inst_id', 'university']
+TEXT_COLUMNS: int = 6
+
+
+class ParquetSink:
+    directory: str
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def partition(self, region: str) -> str:
+        return os.path.join(self.directory, f'{PARTITION}={urllib.parse.quote(region, safe="")}', PART_FILE)
+
+    def done(self, region: str) -> bool:
+        return os.path.exists(self.partition(region))
+
+    def write(self, region: str, columns: List[str], universities: List[Tuple[int, str, List[str]]]) -> int:
+        rows = [values[:len(columns)] + [None] * (len(columns) - len(values)) for _, _, values in universities]
+        arrays = [pa.array([u[0] for u in universities], pa.int64()),
+                  pa.array([u[1] for u in universities], pa.string())]
+        arrays += [pa.array([row[i] for row in rows], pa.string()) for i in range(len(columns))]
+        path = self.partition(region)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pq.write_table(pa.Table.from_arrays(arrays, names=KEY_COLUMNS + list(columns)), path + '.tmp')
+        os.replace(path + '.tmp', path)
+        return len(rows)
+
+
+def is_sink(path: str) -> bool:
+    return os.path.isdir(path)
+
+
+def partitions(directory: str) -> List[str]:
+    return sorted(os.path.join(directory, d, PART_FILE) for d in os.listdir(directory)
+                  if d.startswith(PARTITION + '=') and os.path.exists(os.path.join(directory, d, PART_FILE)))
+
+
+def sink_hash(directory: str) -> str:
+    digest = hashlib.sha256()
+    for path in partitions(directory):
+        digest.update(os.path.relpath(path, directory).encode())
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def read_labels(directory: str) -> List[str]:
+    files = partitions(directory)
+    return pq.read_schema(files[0]).names[len(KEY_COLUMNS):] if files else []
+
+
+def to_numeric(values: List[Optional[str]]) -> List[Optional[float]]:
+    values = pd.to_numeric(pd.Series(values, dtype=object).str.replace(',', '.', regex=False)
+                           .str.replace(r'\s', '', regex=True), errors='coerce')
+    return [None if pd.isna(v) else float(v) for v in values]
+
+
+def iter_rows(directory: str, width: int) -> Iterator[List[tuple]]:
+    for path in partitions(directory):
+        table = pq.read_table(path)
+        indicators = table.num_columns - len(KEY_COLUMNS) - TEXT_COLUMNS
+        columns = [table.column(0).to_pylist()]
+        columns += [to_numeric(table.column(len(KEY_COLUMNS) + TEXT_COLUMNS + i).to_pylist())
+                    for i in range(min(width - 1, indicators))]
+        columns += [[None] * table.num_rows] * (width - len(columns))
+        yield list(zip(*columns))
@@ -0,0 +1,100 @@
+import os
+import threading
+
+from datetime import datetime
+from typing import List, Optional, Set
+
+from dbs.database import DatabaseSession, engines
+from dbs.entities import EstimatedModel, ImportWatermark, db
+from domain.enums import EModels, SheetNames
+from model.artifact import artifact_size
+
+ARTIFACTS: dict = {'.pkl': 'pickle', '.json': 'slim'}
+
+created: Set[str] = set()
+lock: threading.Lock = threading.Lock()
+
+
+def model_entry(path: str, model: str, params: Optional[dict] = None, data_hash: Optional[str] = None,
+                metrics: Optional[dict] = None, created_at: Optional[datetime] = None) -> dict:
+    return {
+        'file': os.path.basename(path),
+        'model': model,
+        'artifact': ARTIFACTS[os.path.splitext(path)[1]],
+        'params': params,
+        'data_hash': data_hash,
+        'metrics': metrics,
+        'size': artifact_size(path),
+        'created_at': created_at or datetime.now()
+    }
+
+
+def describe(row: EstimatedModel) -> dict:
+    return {
+        'file': row.file,
+        'model': row.model,
+        'artifact': row.artifact,
+        'params': row.params,
+        'data_hash': row.data_hash,
+        'metrics': row.metrics,
+        'size': row.size,
+        'created_at': row.created_at.isoformat(timespec='seconds')
+    }
+
+
+class ModelCatalog:
+    database: str
+
+    def __init__(self, database: str):
+        self.database = database
+        if database not in created:
+            with lock:
+                db.metadata.create_all(bind=engines.get(database), tables=[EstimatedModel.__table__])
+                created.add(database)
+
+    def add(self, entries: List[dict]):
+        with DatabaseSession(self.database) as session:
+            for entry in entries:
+                session.merge(EstimatedModel(**entry))
+
+    def get(self, file: str) -> Optional[dict]:
+        with DatabaseSession(self.database) as session:
+            row = session.get(EstimatedModel, file)
+            return describe(row) if row is not None else None
+
+    def list(self, model: Optional[str] = None, limit: Optional[int] = None) -> List[dict]:
+        with DatabaseSession(self.database) as session:
+            query = session.query(EstimatedModel)
+            if model:
+                query = query.filter(EstimatedModel.model == model)
+            query = query.order_by(EstimatedModel.created_at.desc(), EstimatedModel.file)
+            return [describe(row) for row in (query.limit(limit) if limit else query)]
+
+    def latest(self, model: str) -> Optional[dict]:
+        rows = self.list(model, 1)
+        return rows[0] if rows else None
+
+    def remove(self, file: str) -> bool:
+        with DatabaseSession(self.database) as session:
+            return session.query(EstimatedModel).filter(EstimatedModel.file == file).delete() > 0
+
+    def data_hash(self) -> Optional[str]:
+        with DatabaseSession(self.database) as session:
+            watermark = session.get(ImportWatermark, SheetNames.data.value)
+            return watermark.file_hash if watermark is not None else None
+
+    def sync(self, directory: str) -> int:
+        if not os.path.isdir(directory):
+            return 0
+        files = {f for f in os.listdir(directory) if os.path.splitext(f)[1] in ARTIFACTS and not f.startswith('.')}
+        with DatabaseSession(self.database) as session:
+            known = {file for file, in session.query(EstimatedModel.file)}
+            for file in known - files:
+                session.query(EstimatedModel).filter(EstimatedModel.file == file).delete()
+        entries = []
+        for file in sorted(files - known):
+            path = os.path.join(directory, file)
+            model = next((m.name for m in EModels if m.name in file), 'UNKNOWN')
+            entries.append(model_entry(path, model, created_at=datetime.fromtimestamp(os.path.getmtime(path))))
+        self.add(entries)
+        return len(entries)
@@ -1,25 +1,139 @@
+import csv
+import hashlib
+import io
+import itertools
 import logging
 import os
+import sqlite3
+import threading
 
+from datetime import datetime
+from functools import cached_property
 from openpyxl import load_workbook
-from sqlalchemy import create_engine
+from openpyxl.workbook import Workbook
+from sqlalchemy import Table, create_engine, event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import TimeoutError
 from sqlalchemy.orm import Session, sessionmaker
-from typing import Optional
+from time import perf_counter
+from typing import Dict, List, Optional
 
-from dbs.entities import Data, Info, db
+from data.parser.sink import is_sink, iter_rows, read_labels, sink_hash, TEXT_COLUMNS
+from dbs.entities import Data, DataHash, ImportWatermark, Info, db
 from domain.enums import SheetNames, DataSheetIndexes, InfoSheetIndexes
 from domain.logger import logged
 
+SQLITE_MAX_VARIABLES: int = 32766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999
+
+
+class Engines:
+    engines: Dict[str, Engine]
+    lock: threading.Lock
+    max_overflow: int
+    metrics: Dict[str, dict]
+    pool_size: int
+    pool_timeout: float
+    pool_recycle: int
+    pre_ping: bool
+    session_makers: Dict[str, sessionmaker]
+
+    def __init__(self, pool_size: int = 5, max_overflow: int = 10, pool_timeout: float = 30, pool_recycle: int = -1,
+                 pre_ping: bool = False):
+        self.engines = {}
+        self.session_makers = {}
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.configure(pool_size, max_overflow, pool_timeout, pool_recycle, pre_ping)
+        os.register_at_fork(after_in_child=self.after_fork)
+
+    def configure(self, pool_size: int, max_overflow: int, pool_timeout: float, pool_recycle: Optional[int],
+                  pre_ping: bool):
+        with self.lock:
+            self.pool_size = pool_size
+            self.max_overflow = max_overflow
+            self.pool_timeout = pool_timeout
+            self.pool_recycle = pool_recycle if pool_recycle else -1
+            self.pre_ping = pre_ping
+            for engine in self.engines.values():
+                engine.dispose()
+            self.engines.clear()
+            self.session_makers.clear()
+
+    def after_fork(self):
+        self.lock = threading.Lock()
+        for engine in self.engines.values():
+            engine.dispose(close=False)
+
+    def get(self, database: str) -> Engine:
+        engine = self.engines.get(database)
+        if engine is not None:
+            return engine
+        with self.lock:
+            if database not in self.engines:
+                options = {'pool_pre_ping': self.pre_ping, 'pool_recycle': self.pool_recycle}
+                if make_url(database).get_backend_name() != 'sqlite':
+                    options.update(pool_size=self.pool_size, max_overflow=self.max_overflow,
+                                   pool_timeout=self.pool_timeout)
+                engine = create_engine(database, **options)
+                self.metrics[database] = {'checkouts': 0, 'connects': 0, 'timeouts': 0, 'wait_total': 0.0,
+                                          'wait_max': 0.0}
+                event.listen(engine, 'connect', lambda *args, m=self.metrics[database]: self.count(m, 'connects'))
+                self.engines[database] = engine
+                self.session_makers[database] = sessionmaker(bind=engine)
+            return self.engines[database]
+
+    def session(self, database: str) -> Session:
+        self.get(database)
+        return self.session_makers[database]()
+
+    @staticmethod
+    def count(metrics: dict, key: str):
+        metrics[key] += 1
+
+    def checkout(self, database: str, session: Session):
+        metrics = self.metrics.get(database)
+        start = perf_counter()
+        try:
+            session.connection()
+        except TimeoutError:
+            if metrics is not None:
+                with self.lock:
+                    metrics['timeouts'] += 1
+            raise
+        if metrics is not None:
+            wait = perf_counter() - start
+            with self.lock:
+                metrics['checkouts'] += 1
+                metrics['wait_total'] += wait
+                metrics['wait_max'] = max(metrics['wait_max'], wait)
+
+    def stats(self) -> Dict[str, dict]:
+        stats = {}
+        for database, engine in list(self.engines.items()):
+            pool = engine.pool
+            metrics = dict(self.metrics[database])
+            metrics['wait_avg'] = metrics['wait_total'] / metrics['checkouts'] if metrics['checkouts'] else 0.0
+            metrics['pool'] = type(pool).__name__
+            for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+                if hasattr(pool, name):
+                    value = getattr(pool, name)
+                    metrics[name] = value() if callable(value) else value
+            stats[make_url(database).render_as_string(hide_password=True)] = metrics
+        return stats
+
+
+engines = Engines()
+
 
 class DatabaseSession:
 
     def __init__(self, database: str, session: Optional[Session] = None):
-        engine = create_engine(database)
-        session_maker = sessionmaker()
-        session_maker.configure(bind=engine)
-        self.session = session_maker() if session is None else session
+        self.database = database
+        self.session = engines.session(database) if session is None else session
 
     def __enter__(self) -> Session:
+        engines.checkout(self.database, self.session)
         return self.session
 
     def __exit__(self, exc_type, exc_val, exc_tb):
@@ -34,179 +148,179 @@ class DatabaseSession:
 
 class DatabaseInitializer:
 
-    def __init__(self, database: str, file: str, logger: logging.Logger):
-        engine = create_engine(database)
-        self.recreate_tables(engine)
+    def __init__(self, database: str, file: str, logger: logging.Logger, chunk_size: int = 5000,
+                 incremental: bool = False):
+        engine = engines.get(database)
+        if incremental:
+            self.create_tables(engine)
+        else:
+            self.recreate_tables(engine)
 
-        session_maker = sessionmaker()
-        session_maker.configure(bind=engine)
-        self.session = session_maker()
+        self.session = engines.session(database)
 
+        self.chunk_size = chunk_size
+        self.file = file
+        self.incremental = incremental
         self.logger = logger
-        self.workbook = load_workbook(file, read_only=True, data_only=True)
+
+    @cached_property
+    def workbook(self) -> Workbook:
+        return load_workbook(self.file, read_only=True, data_only=True)
 
     @staticmethod
     def recreate_tables(engine):
         tables = [t.__table__ for t in [
             Data,
-            Info
+            Info,
+            DataHash
         ]]
         db.metadata.drop_all(bind=engine, tables=tables)
+        db.metadata.create_all(bind=engine, tables=tables + [ImportWatermark.__table__])
+
+    @staticmethod
+    def create_tables(engine):
+        tables = [t.__table__ for t in [
+            Data,
+            Info,
+            DataHash,
+            ImportWatermark
+        ]]
         db.metadata.create_all(bind=engine, tables=tables)
 
-    @logged
-    def init_data(self):
-        data = []
-        for row in self.workbook[SheetNames.data.value].iter_rows(min_row=2, values_only=True):
-            if row[DataSheetIndexes.id] is None:
+    @staticmethod
+    def file_hash(file: str) -> str:
+        if is_sink(file):
+            return sink_hash(file)
+        file_hash = hashlib.sha256()
+        with open(file, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                file_hash.update(block)
+        return file_hash.hexdigest()
+
+    @staticmethod
+    def row_hashes(rows: List[tuple]) -> Dict[int, str]:
+        return {int(row[0]): hashlib.sha1(repr(tuple(
+            v if v is None or isinstance(v, str) else float(v) for v in row[1:])).encode()).hexdigest() for row in rows}
+
+    def read_sheet(self, sheet: SheetNames, columns: List[str]) -> List[tuple]:
+        if is_sink(self.file):
+            return self.read_sink(sheet, columns)
+        rows = []
+        for row in self.workbook[sheet.value].iter_rows(min_row=2, max_col=len(columns), values_only=True):
+            if not row or row[0] is None:
                 break
-            data.append(Data(
-                id=row[DataSheetIndexes.id],
-                edu_index=row[DataSheetIndexes.edu_index],
-                science_index=row[DataSheetIndexes.science_index],
-                inter_index=row[DataSheetIndexes.inter_index],
-                fin_index=row[DataSheetIndexes.fin_index],
-                wage=row[DataSheetIndexes.wage],
-                add=row[DataSheetIndexes.add],
-                exam_1=row[DataSheetIndexes.exam_1],
-                exam_2=row[DataSheetIndexes.exam_2],
-                exam_3=row[DataSheetIndexes.exam_3],
-                avg_exam_1=row[DataSheetIndexes.avg_exam_1],
-                stud_num_1=row[DataSheetIndexes.stud_num_1],
-                stud_num_2=row[DataSheetIndexes.stud_num_2],
-                stud_num_3=row[DataSheetIndexes.stud_num_3],
-                w_1=row[DataSheetIndexes.w_1],
-                w_2=row[DataSheetIndexes.w_2],
-                w_3=row[DataSheetIndexes.w_3],
-                w_4=row[DataSheetIndexes.w_4],
-                w_5=row[DataSheetIndexes.w_5],
-                asp_num=row[DataSheetIndexes.asp_num],
-                w_6=row[DataSheetIndexes.w_6],
-                w_7=row[DataSheetIndexes.w_7],
-                citation_1=row[DataSheetIndexes.citation_1],
-                citation_2=row[DataSheetIndexes.citation_2],
-                citation_3=row[DataSheetIndexes.citation_3],
-                pub_num_1=row[DataSheetIndexes.pub_num_1],
-                pub_num_2=row[DataSheetIndexes.pub_num_2],
-                pub_num_3=row[DataSheetIndexes.pub_num_3],
-                research_num=row[DataSheetIndexes.research_num],
-                w_8=row[DataSheetIndexes.w_8],
-                w_9=row[DataSheetIndexes.w_9],
-                research_incom=row[DataSheetIndexes.research_incom],
-                license_num=row[DataSheetIndexes.license_num],
-                w_10=row[DataSheetIndexes.w_10],
-                w_11=row[DataSheetIndexes.w_11],
-                w_12=row[DataSheetIndexes.w_12],
-                journal_num=row[DataSheetIndexes.journal_num],
-                grants_num=row[DataSheetIndexes.grants_num],
-                w_13=row[DataSheetIndexes.w_13],
-                w_14=row[DataSheetIndexes.w_14],
-                w_15=row[DataSheetIndexes.w_15],
-                w_16=row[DataSheetIndexes.w_16],
-                w_17=row[DataSheetIndexes.w_17],
-                w_18=row[DataSheetIndexes.w_18],
-                stud_num_4=row[DataSheetIndexes.stud_num_4],
-                w_19=row[DataSheetIndexes.w_19],
-                prof_num=row[DataSheetIndexes.prof_num],
-                w_20=row[DataSheetIndexes.w_20],
-                w_21=row[DataSheetIndexes.w_21],
-                money_1=row[DataSheetIndexes.money_1],
-                money_2=row[DataSheetIndexes.money_2],
-                income_per_npr=row[DataSheetIndexes.income_per_npr],
-                w_22=row[DataSheetIndexes.w_22],
-                avg_wage_1=row[DataSheetIndexes.avg_wage_1],
-                total_income=row[DataSheetIndexes.total_income],
-                total_square_1=row[DataSheetIndexes.total_square_1],
-                square_1=row[DataSheetIndexes.square_1],
-                square_2=row[DataSheetIndexes.square_2],
-                square_3=row[DataSheetIndexes.square_3],
-                square_4=row[DataSheetIndexes.square_4],
-                computer_number=row[DataSheetIndexes.computer_number],
-                w_23=row[DataSheetIndexes.w_23],
-                books=row[DataSheetIndexes.books],
-                w_24=row[DataSheetIndexes.w_24],
-                w_25=row[DataSheetIndexes.w_25],
-                w_26=row[DataSheetIndexes.w_26],
-                npr_num=row[DataSheetIndexes.npr_num],
-                w_27=row[DataSheetIndexes.w_27],
-                total_stud_num_1=row[DataSheetIndexes.total_stud_num_1],
-                stud_num_5=row[DataSheetIndexes.stud_num_5],
-                stud_num_6=row[DataSheetIndexes.stud_num_6],
-                stud_num_7=row[DataSheetIndexes.stud_num_7],
-                avg_exam_2=row[DataSheetIndexes.avg_exam_2],
-                w_28=row[DataSheetIndexes.w_28],
-                w_29=row[DataSheetIndexes.w_29],
-                w_30=row[DataSheetIndexes.w_30],
-                stud_num_8=row[DataSheetIndexes.stud_num_8],
-                stud_num_9=row[DataSheetIndexes.stud_num_9],
-                company_num_1=row[DataSheetIndexes.company_num_1],
-                company_num_2=row[DataSheetIndexes.company_num_2],
-                money_3=row[DataSheetIndexes.money_3],
-                money_4=row[DataSheetIndexes.money_4],
-                total_pub_num=row[DataSheetIndexes.total_pub_num],
-                bi_num=row[DataSheetIndexes.bi_num],
-                tp_num=row[DataSheetIndexes.tp_num],
-                ccus_num=row[DataSheetIndexes.ccus_num],
-                sb_num=row[DataSheetIndexes.sb_num],
-                total_asp_num=row[DataSheetIndexes.total_asp_num],
-                w_31=row[DataSheetIndexes.w_31],
-                total_doc_num=row[DataSheetIndexes.total_doc_num],
-                diss_sov_num=row[DataSheetIndexes.diss_sov_num],
-                total_work_num=row[DataSheetIndexes.total_work_num],
-                total_pps_num=row[DataSheetIndexes.total_pps_num],
-                total_sci_num=row[DataSheetIndexes.total_sci_num],
-                w_32=row[DataSheetIndexes.w_32],
-                w_33=row[DataSheetIndexes.w_33],
-                w_34=row[DataSheetIndexes.w_34],
-                w_35=row[DataSheetIndexes.w_35],
-                avg_wage_2=row[DataSheetIndexes.avg_wage_2],
-                avg_wage_3=row[DataSheetIndexes.avg_wage_3],
-                for_stud_num=row[DataSheetIndexes.for_stud_num],
-                w_36=row[DataSheetIndexes.w_36],
-                total_prog_num=row[DataSheetIndexes.total_prog_num],
-                total_stud_num_2=row[DataSheetIndexes.total_stud_num_2],
-                total_for_asp_num=row[DataSheetIndexes.total_for_asp_num],
-                citation_4=row[DataSheetIndexes.citation_4],
-                for_income_1=row[DataSheetIndexes.for_income_1],
-                for_income_2=row[DataSheetIndexes.for_income_2],
-                results_num=row[DataSheetIndexes.results_num],
-                total_square_2=row[DataSheetIndexes.total_square_2],
-                lab_square=row[DataSheetIndexes.lab_square],
-                research_square=row[DataSheetIndexes.research_square],
-                living_square=row[DataSheetIndexes.living_square],
-                sport_square=row[DataSheetIndexes.sport_square],
-                w_37=row[DataSheetIndexes.w_37],
-                comp_num=row[DataSheetIndexes.comp_num],
-                w_38=row[DataSheetIndexes.w_38],
-                library=row[DataSheetIndexes.library],
-                income=row[DataSheetIndexes.income],
-                non_budget_income=row[DataSheetIndexes.non_budget_income],
-                w_39=row[DataSheetIndexes.w_39],
-                w_40=row[DataSheetIndexes.w_40],
-                w_41=row[DataSheetIndexes.w_41],
-                w_42=row[DataSheetIndexes.w_42],
-                w_43=row[DataSheetIndexes.w_43],
-                w_44=row[DataSheetIndexes.w_44],
-                w_45=row[DataSheetIndexes.w_45]
-            ))
-        self.session.bulk_save_objects(data)
+            rows.append(row)
+        return rows
+
+    def read_sink(self, sheet: SheetNames, columns: List[str]) -> List[tuple]:
+        if sheet == SheetNames.info:
+            names = list(DataSheetIndexes.name_values_dict().keys())[1:]
+            return list((i, name, label) for i, (name, label) in
+                        enumerate(zip(names, read_labels(self.file)[TEXT_COLUMNS:]), 1))
+        return list(itertools.chain.from_iterable(iter_rows(self.file, len(columns))))
+
+    def insert_rows(self, table: Table, columns: List[str], rows: List[tuple]) -> int:
+        connection = self.session.connection()
+        dialect = connection.dialect.name
+        quoted = ', '.join(connection.dialect.identifier_preparer.quote(c) for c in columns)
+        placeholders = '(' + ', '.join('?' * len(columns)) + ')'
+        for start in range(0, len(rows), self.chunk_size):
+            chunk = rows[start:start + self.chunk_size]
+            if dialect == 'postgresql':
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(chunk)
+                buffer.seek(0)
+                with connection.connection.cursor() as cursor:
+                    cursor.copy_expert(f'COPY {table.name} ({quoted}) FROM STDIN WITH (FORMAT csv)', buffer)
+            elif dialect == 'sqlite':
+                step = max(1, SQLITE_MAX_VARIABLES // len(columns))
+                for i in range(0, len(chunk), step):
+                    part = chunk[i:i + step]
+                    connection.exec_driver_sql(
+                        f'INSERT INTO {table.name} ({quoted}) VALUES ' + ', '.join([placeholders] * len(part)),
+                        tuple(itertools.chain.from_iterable(part)))
+            else:
+                connection.execute(table.insert(), [dict(zip(columns, row)) for row in chunk])
+        return len(rows)
+
+    def upsert_rows(self, table: Table, columns: List[str], rows: List[tuple]) -> int:
+        connection = self.session.connection()
+        dialect = connection.dialect.name
+        if dialect not in ('postgresql', 'sqlite'):
+            self.delete_rows(table, [row[0] for row in rows])
+            return self.insert_rows(table, columns, rows)
+        statement = (postgresql if dialect == 'postgresql' else sqlite).insert(table)
+        statement = statement.on_conflict_do_update(index_elements=[columns[0]],
+                                                    set_={c: statement.excluded[c] for c in columns[1:]})
+        for start in range(0, len(rows), self.chunk_size):
+            connection.execute(statement, [dict(zip(columns, row)) for row in rows[start:start + self.chunk_size]])
+        return len(rows)
+
+    def delete_rows(self, table: Table, ids: List[int]):
+        connection = self.session.connection()
+        step = min(self.chunk_size, SQLITE_MAX_VARIABLES)
+        for start in range(0, len(ids), step):
+            connection.execute(table.delete().where(table.c.id.in_(ids[start:start + step])))
 
     @logged
-    def init_info(self):
-        info = []
-        for row in self.workbook[SheetNames.info.value].iter_rows(min_row=2, values_only=True):
-            if row == ():
-                break
-            info.append(Info(
-                id=row[InfoSheetIndexes.id],
-                var_name=row[InfoSheetIndexes.var_name],
-                var_description=row[InfoSheetIndexes.var_description],
-            ))
-        self.session.bulk_save_objects(info)
+    def init_data(self) -> int:
+        columns = list(DataSheetIndexes.name_values_dict().keys())
+        rows = self.read_sheet(SheetNames.data, columns)
+        self.insert_rows(DataHash.__table__, ['id', 'row_hash'], list(self.row_hashes(rows).items()))
+        return self.insert_rows(Data.__table__, columns, rows)
+
+    @logged
+    def upsert_data(self) -> int:
+        columns = list(DataSheetIndexes.name_values_dict().keys())
+        rows = self.read_sheet(SheetNames.data, columns)
+        hashes = self.row_hashes(rows)
+        stored = dict(self.session.query(DataHash.id, DataHash.row_hash).all())
+        if not stored:
+            stored = {i: None for i, in self.session.query(Data.id)}
+        changed = [row for row in rows if stored.get(int(row[0])) != hashes[int(row[0])]]
+        removed = list(set(stored) - set(hashes))
+        self.delete_rows(Data.__table__, removed)
+        self.delete_rows(DataHash.__table__, removed)
+        ids = [int(row[0]) for row in changed]
+        write_rows = self.upsert_rows if stored else self.insert_rows
+        write_rows(Data.__table__, columns, changed)
+        write_rows(DataHash.__table__, ['id', 'row_hash'], [(i, hashes[i]) for i in ids])
+        self.logger.info(f'{len(changed)} new or changed rows, {len(removed)} removed rows, '
+                         f'{len(rows) - len(changed)} unchanged rows')
+        return len(changed)
+
+    @logged
+    def init_info(self) -> int:
+        columns = list(InfoSheetIndexes.name_values_dict().keys())
+        return self.insert_rows(Info.__table__, columns, self.read_sheet(SheetNames.info, columns))
+
+    def unchanged(self, file_hash: str) -> bool:
+        watermark = self.session.get(ImportWatermark, SheetNames.data.value)
+        return watermark is not None and watermark.file_hash == file_hash
+
+    def save_watermark(self, file_hash: str):
+        self.session.merge(ImportWatermark(
+            source=SheetNames.data.value,
+            file=self.file,
+            file_hash=file_hash,
+            rows=self.session.query(DataHash).count(),
+            imported_at=datetime.now()
+        ))
 
     @logged
     def init_db(self):
-        self.init_data()
+        file_hash = self.file_hash(self.file)
+        if self.incremental and self.unchanged(file_hash):
+            self.logger.info('Source file is unchanged since the last import. Import skipped.')
+            self.session.close()
+            return
+
+        if self.incremental:
+            self.upsert_data()
+            self.session.query(Info).delete()
+        else:
+            self.init_data()
         self.init_info()
+        self.save_watermark(file_hash)
 
         self.session.commit()
@@ -1,6 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
 
-from sqlalchemy import Column, Float, Integer, String
+from sqlalchemy import JSON, Column, DateTime, Float, Index, Integer, String
 from typing import Callable
 
 
@@ -150,3 +150,31 @@ class Info(db.Model):
     id = Column(Integer, primary_key=True)
     var_name = Column(String, nullable=True)
     var_description = Column(String, nullable=True)
+
+
+class DataHash(db.Model):
+    __tablename__ = 'data_hash'
+    id = Column(Integer, primary_key=True)
+    row_hash = Column(String, nullable=False)
+
+
+class ImportWatermark(db.Model):
+    __tablename__ = 'import_watermark'
+    source = Column(String, primary_key=True)
+    file = Column(String, nullable=True)
+    file_hash = Column(String, nullable=False)
+    rows = Column(Integer, nullable=True)
+    imported_at = Column(DateTime, nullable=False)
+
+
+class EstimatedModel(db.Model):
+    __tablename__ = 'estimated_model'
+    __table_args__ = (Index('ix_estimated_model_model_created_at', 'model', 'created_at'),)
+    file = Column(String, primary_key=True)
+    model = Column(String, nullable=False)
+    artifact = Column(String, nullable=False)
+    params = Column(JSON, nullable=True)
+    data_hash = Column(String, nullable=True, index=True)
+    metrics = Column(JSON, nullable=True)
+    size = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False, index=True)
@@ -1,10 +1,33 @@
 import ast
+import logging
 import os
-from typing import Dict, Any
+import threading
+from collections.abc import Mapping
+from dataclasses import dataclass, fields, replace
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Iterator, List, Optional
 
 import yaml
 
+from domain.errors import ConfigError
+
 CONFIG_ENV_VAR: str = 'ML_OPS_CONFIG'
+DEFAULT_CONFIG: str = 'configuration/default.yaml'
+DEFAULT_PATHS: Dict[str, str] = {
+    'DATA_PATH': 'data/dataset/data.xlsx',
+    'ESTIMATED_MODELS_PATH': 'res/estimated_models',
+    'MODEL_PARAMETERS_PATH': 'data/parameters',
+    'PREDICTIONS_PATH': 'res/predictions',
+    'STORAGE_PATH': 'res/split_storage'
+}
+STRUCTURAL_KEYS: frozenset = frozenset({
+    'DEBUG', 'UPDATE_DATA', 'DATA_PATH', 'IMPORT_CHUNK_SIZE', 'INCREMENTAL_IMPORT', 'SQLALCHEMY_DATABASE',
+    'DB_POOL_SIZE', 'DB_MAX_OVERFLOW', 'DB_POOL_TIMEOUT', 'DB_POOL_RECYCLE', 'DB_POOL_PRE_PING',
+    'MODEL_PARAMETERS_PATH', 'STORAGE_PATH', 'PREDICTIONS_PATH', 'ESTIMATED_MODELS_PATH', 'TRAINING_WORKERS',
+    'TRAINING_QUEUE_SIZE', 'TRAINING_CANCELLATION', 'TRAINING_HISTORY', 'CONFIG_RELOAD_INTERVAL', 'METRICS_PATH',
+    'METRICS_FLUSH_INTERVAL', 'SERVER_BIND', 'SERVER_WORKERS', 'SERVER_THREADS', 'SERVER_TIMEOUT',
+    'SERVER_GRACEFUL_TIMEOUT'
+})
 
 
 def load_env_vars(cfg: Dict[str, Any]) -> None:
@@ -13,12 +36,161 @@ def load_env_vars(cfg: Dict[str, Any]) -> None:
             cfg[key] = ast.literal_eval(os.getenv(key))
 
 
-def load_config() -> Dict[str, Any]:
-    with open('configuration/default.yaml', 'r') as f:
-        cfg = yaml.load(f, Loader=yaml.FullLoader)
+def config_files() -> List[str]:
     working_cfg_path = os.getenv(CONFIG_ENV_VAR, None)
-    if working_cfg_path is not None:
-        with open(ast.literal_eval(working_cfg_path), 'r') as f:
-            cfg.update(yaml.load(f, Loader=yaml.FullLoader))
+    if working_cfg_path is None:
+        return [DEFAULT_CONFIG]
+    return [DEFAULT_CONFIG, ast.literal_eval(working_cfg_path)]
+
+
+def read_config(path: str) -> Dict[str, Any]:
+    with open(path, 'r') as f:
+        return yaml.load(f, Loader=yaml.FullLoader) or {}
+
+
+def load_config(defaults: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    files = config_files()
+    cfg = read_config(files[0]) if defaults is None else dict(defaults)
+    for path in files[1:]:
+        cfg.update(read_config(path))
     load_env_vars(cfg)
     return cfg
+
+
+def check_types(cfg: Dict[str, Any], defaults: Dict[str, Any]) -> Dict[str, Any]:
+    for key, default in defaults.items():
+        value = cfg.get(key)
+        if default is None or value is None:
+            continue
+        if isinstance(default, bool):
+            valid = isinstance(value, bool)
+        elif isinstance(default, (int, float)):
+            valid = isinstance(value, (int, float)) and not isinstance(value, bool) and \
+                    (isinstance(default, float) or isinstance(value, int))
+        else:
+            valid = isinstance(value, type(default))
+        if not valid:
+            raise ConfigError(f'{key} must be {type(default).__name__}, got {value!r}.')
+        if isinstance(default, float):
+            cfg[key] = float(value)
+    return cfg
+
+
+@dataclass(frozen=True)
+class Settings(Mapping):
+    config: Mapping
+    data_path: str
+    estimated_models_path: str
+    params_path: str
+    predictions_path: str
+    storage_path: str
+
+    def __getitem__(self, key: str) -> Any:
+        return self.config[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.config)
+
+    def __len__(self) -> int:
+        return len(self.config)
+
+    def __reduce__(self) -> tuple:
+        return self.restore, (dict(self.config), *(getattr(self, f.name) for f in fields(self)[1:]))
+
+    @classmethod
+    def restore(cls, config: Dict[str, Any], *paths: str) -> 'Settings':
+        return cls(MappingProxyType(config), *paths)
+
+    @classmethod
+    def from_config(cls, values: Dict[str, Any], cwd: Optional[str] = None) -> 'Settings':
+        cwd = os.getcwd() if cwd is None else cwd
+        paths = {k: values.get(k) or os.path.join(cwd, v) for k, v in DEFAULT_PATHS.items()}
+        return cls(MappingProxyType(dict(values)), paths['DATA_PATH'], paths['ESTIMATED_MODELS_PATH'],
+                   paths['MODEL_PARAMETERS_PATH'], paths['PREDICTIONS_PATH'], paths['STORAGE_PATH'])
+
+
+def read_settings() -> Dict[str, Any]:
+    defaults = read_config(DEFAULT_CONFIG)
+    return check_types(load_config(defaults), defaults)
+
+
+def build_settings() -> Settings:
+    return Settings.from_config(read_settings())
+
+
+class SettingsStore:
+    callbacks: List[Callable[[Settings], None]]
+    lock: threading.RLock
+    logger: logging.Logger
+    settings: Optional[Settings] = None
+    signature: Optional[tuple] = None
+    stop: threading.Event
+    thread: Optional[threading.Thread] = None
+
+    def __init__(self):
+        self.callbacks = []
+        self.lock = threading.RLock()
+        self.logger = logging.getLogger('SettingsLogger')
+        self.stop = threading.Event()
+
+    def stamp(self) -> tuple:
+        return tuple((path, os.stat(path).st_mtime_ns) for path in config_files() if os.path.exists(path))
+
+    def get(self) -> Settings:
+        if self.settings is None:
+            with self.lock:
+                if self.settings is None:
+                    self.signature = self.stamp()
+                    self.settings = build_settings()
+        return self.settings
+
+    def reload(self) -> bool:
+        with self.lock:
+            signature = self.stamp()
+            if self.settings is None or signature == self.signature:
+                return False
+            self.signature = signature
+            values = read_settings()
+            changed = {k for k in set(values) | set(self.settings.config)
+                       if values.get(k) != self.settings.config.get(k)}
+            for key in changed & STRUCTURAL_KEYS:
+                values[key] = self.settings.config.get(key)
+            if changed & STRUCTURAL_KEYS:
+                self.logger.warning(f'Restart to apply {sorted(changed & STRUCTURAL_KEYS)}')
+            if not changed - STRUCTURAL_KEYS:
+                return False
+            self.settings = replace(self.settings, config=MappingProxyType(values))
+            settings, callbacks = self.settings, list(self.callbacks)
+        self.logger.info(f'Reloaded {sorted(changed - STRUCTURAL_KEYS)}')
+        for callback in callbacks:
+            callback(settings)
+        return True
+
+    def subscribe(self, callback: Callable[[Settings], None]):
+        with self.lock:
+            self.callbacks.append(callback)
+
+    def watch(self, interval: Optional[float]):
+        with self.lock:
+            if not interval or (self.thread is not None and self.thread.is_alive()):
+                return
+            self.stop.clear()
+            self.thread = threading.Thread(target=self.run, args=(interval,), name='SettingsWatcher', daemon=True)
+            self.thread.start()
+
+    def run(self, interval: float):
+        while not self.stop.wait(interval):
+            try:
+                self.reload()
+            except (OSError, SyntaxError, ValueError, yaml.YAMLError) as e:
+                self.logger.warning(f'Settings not reloaded: {e}')
+
+    def close(self):
+        self.stop.set()
+
+
+settings_store = SettingsStore()
+
+
+def get_settings() -> Settings:
+    return settings_store.get()
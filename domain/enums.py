@@ -30,6 +30,7 @@ class EModes(AppIntEnum):
     TRAIN = 1
     PREDICT = 2
     OTHER = 3
+    SCORE = 4
 
 
 class SheetNames(enum.Enum):
@@ -0,0 +1,10 @@
+class PayloadError(ValueError):
+    pass
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+class ConfigError(ValueError):
+    pass
@@ -1,17 +1,38 @@
 import logging
 
-from time import process_time
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter
+
+from domain.metrics import metrics
 
 
 def logged(f):
 
+    @wraps(f)
     def wrapper(*args, **kwargs):
-        logger: logging.Logger = args[0].logger
+        logger: logging.Logger = getattr(args[0], 'logger', None) if args else None
+        logger = logger if isinstance(logger, logging.Logger) else logging.getLogger(f.__module__)
         logger.info(f'{f.__name__} started...')
-        start = process_time()
-        result = f(*args, **kwargs)
-        end = process_time()
-        logger.info(f'{f.__name__} finished. {end - start:.3f}s')
+        with metrics.span(f.__name__) as span:
+            result = f(*args, **kwargs)
+            if isinstance(result, int) and not isinstance(result, bool):
+                span.rows = result
+        if span.rows is not None:
+            rate = span.rows / span.wall if span.wall > 0 else float('inf')
+            logger.info(f'{f.__name__} finished. {span.wall:.3f}s wall, {span.cpu:.3f}s cpu, {span.rows} rows, '
+                        f'{rate:.0f} rows/s')
+        else:
+            logger.info(f'{f.__name__} finished. {span.wall:.3f}s wall, {span.cpu:.3f}s cpu')
         return result
 
     return wrapper
+
+
+@contextmanager
+def timed(timings: dict, stage: str):
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = round(perf_counter() - start, 3)
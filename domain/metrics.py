@@ -0,0 +1,273 @@
+import json
+import os
+import sys
+import threading
+import uuid
+
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import wraps
+from time import perf_counter, process_time, thread_time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+PREFIX: str = 'mlops'
+RETIRED: str = 'retired.json'
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+@contextmanager
+def locked(directory: str, exclusive: bool) -> Iterator[None]:
+    with open(os.path.join(directory, '.lock'), 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+
+
+def read_snapshot(path: str) -> Optional[dict]:
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_snapshot(path: str, snapshot: dict):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp, path)
+
+
+def retire(directory: str, path: str):
+    with locked(directory, True):
+        snapshot = read_snapshot(path)
+        if snapshot is not None:
+            retired = Metrics()
+            for previous in (read_snapshot(os.path.join(directory, RETIRED)), snapshot):
+                if previous is not None:
+                    retired.merge(dict(previous, peak_rss=0))
+            write_snapshot(os.path.join(directory, RETIRED), retired.snapshot(rss=False))
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def peak_rss() -> int:
+    if resource is None:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+@dataclass
+class Stage:
+    calls: int = 0
+    wall: float = 0.0
+    cpu: float = 0.0
+    rows: int = 0
+    wall_max: float = 0.0
+    scope: str = 'thread'
+
+    def add(self, calls: int, wall: float, cpu: float, rows: int, wall_max: float, scope: str = 'thread'):
+        self.calls += calls
+        self.wall += wall
+        self.cpu += cpu
+        self.rows += rows
+        self.wall_max = max(self.wall_max, wall_max)
+        self.scope = scope
+
+
+class Span:
+    cpu: float = 0.0
+    rows: Optional[int] = None
+    stage: str
+    wall: float = 0.0
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+
+class Metrics:
+    changed: bool = False
+    directory: Optional[str] = None
+    file: Optional[str] = None
+    lock: threading.Lock
+    rss: int = 0
+    stages: Dict[str, Stage]
+    stop: threading.Event
+    thread: Optional[threading.Thread] = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.stop = threading.Event()
+
+    def observe(self, stage: str, wall: float, cpu: float, rows: Optional[int] = None, scope: str = 'thread'):
+        with self.lock:
+            self.stages.setdefault(stage, Stage()).add(1, wall, cpu, rows or 0, wall, scope)
+            self.changed = True
+
+    @contextmanager
+    def span(self, stage: str, fan_out: bool = False) -> Iterator[Span]:
+        span = Span(stage)
+        clock = process_time if fan_out else thread_time
+        start, start_cpu = perf_counter(), clock()
+        try:
+            yield span
+        finally:
+            span.wall, span.cpu = perf_counter() - start, clock() - start_cpu
+            self.observe(stage, span.wall, span.cpu, span.rows, 'process' if fan_out else 'thread')
+
+    def traced(self, stage: str, rows: Optional[Callable[[Any], int]] = None) -> Callable:
+
+        def decorator(f: Callable) -> Callable:
+
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                with self.span(stage) as span:
+                    result = f(*args, **kwargs)
+                    if rows is not None:
+                        span.rows = rows(result)
+                return result
+
+            return wrapper
+
+        return decorator
+
+    def drain(self) -> dict:
+        with self.lock:
+            stages, self.stages = self.stages, {}
+        return {'stages': {k: vars(v) for k, v in stages.items()}, 'peak_rss': peak_rss()}
+
+    def merge(self, snapshot: dict):
+        with self.lock:
+            for stage, values in snapshot['stages'].items():
+                self.stages.setdefault(stage, Stage()).add(**values)
+            self.rss = max(self.rss, snapshot['peak_rss'])
+            self.changed = True
+
+    def after_fork(self):
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        self.thread = None
+        self.directory = None
+        self.file = None
+
+    def reset(self):
+        with self.lock:
+            self.stages = {}
+            self.rss = 0
+
+    def snapshot(self, rss: bool = True) -> dict:
+        with self.lock:
+            return {'stages': {k: dict(vars(v)) for k, v in self.stages.items()},
+                    'peak_rss': max(self.rss, peak_rss()) if rss else self.rss}
+
+    def share(self, directory: str, interval: Optional[float] = None, clear: bool = False):
+        os.makedirs(directory, exist_ok=True)
+        if clear:
+            for name in os.listdir(directory):
+                if name.endswith('.json'):
+                    os.remove(os.path.join(directory, name))
+        with self.lock:
+            self.directory = directory
+            self.file = os.path.join(directory, f'{os.getpid()}.{uuid.uuid4().hex[:8]}.json')
+            self.changed = True
+        self.flush()
+        if interval and (self.thread is None or not self.thread.is_alive()):
+            self.stop.clear()
+            self.thread = threading.Thread(target=self.run, args=(interval,), name='MetricsFlusher', daemon=True)
+            self.thread.start()
+
+    def run(self, interval: float):
+        while not self.stop.wait(interval):
+            if self.changed:
+                self.flush()
+
+    def flush(self):
+        if self.file is None:
+            return
+        with self.lock:
+            self.changed = False
+        write_snapshot(self.file, self.snapshot())
+
+    def collect(self) -> 'Metrics':
+        if self.directory is None:
+            return self
+        self.flush()
+        directory = self.directory
+        for name in os.listdir(directory):
+            pid = name.split('.')[0]
+            if name.endswith('.json') and pid.isdigit() and not pid_alive(int(pid)):
+                retire(directory, os.path.join(directory, name))
+        combined = Metrics()
+        with locked(directory, False):
+            for name in os.listdir(directory):
+                snapshot = read_snapshot(os.path.join(directory, name)) if name.endswith('.json') else None
+                if snapshot is not None:
+                    combined.merge(snapshot)
+        return combined
+
+    def close(self):
+        self.stop.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        if self.file is None:
+            return
+        self.flush()
+        retire(self.directory, self.file)
+        self.file = None
+
+    def render(self, gauges: Optional[Dict[str, Tuple[str, List[Tuple[dict, float]]]]] = None) -> str:
+        with self.lock:
+            stages = {k: Stage(**vars(v)) for k, v in self.stages.items()}
+            rss = self.rss
+        lines = []
+        for name, kind, text, field in (
+                ('stage_calls_total', 'counter', 'Number of completed spans per stage', 'calls'),
+                ('stage_seconds_total', 'counter', 'Wall-clock seconds per stage', 'wall'),
+                ('stage_rows_total', 'counter', 'Rows handled per stage', 'rows'),
+                ('stage_seconds_max', 'gauge', 'Slowest span per stage in seconds', 'wall_max')):
+            lines += metric_lines(name, kind, text, [({'stage': k}, getattr(v, field)) for k, v in stages.items()])
+        lines += metric_lines('stage_cpu_seconds_total', 'counter',
+                              'CPU seconds per stage, of the calling thread or of the whole process for fan-out stages',
+                              [({'stage': k, 'scope': v.scope}, v.cpu) for k, v in stages.items()])
+        lines += metric_lines('peak_rss_bytes', 'gauge', 'Peak resident set size', [
+            ({'process': 'app'}, peak_rss()), ({'process': 'worker'}, rss)])
+        for name, (text, samples) in (gauges or {}).items():
+            lines += metric_lines(name, 'gauge', text, samples)
+        return '\n'.join(lines) + '\n'
+
+
+def metric_lines(name: str, kind: str, text: str, samples: List[Tuple[dict, float]]) -> List[str]:
+    lines = [f'# HELP {PREFIX}_{name} {text}', f'# TYPE {PREFIX}_{name} {kind}']
+    for labels, value in samples:
+        label = ','.join(f'{k}="{escape(v)}"' for k, v in labels.items())
+        lines.append(f'{PREFIX}_{name}{{{label}}} {float(value)!r}' if label else f'{PREFIX}_{name} {float(value)!r}')
+    return lines
+
+
+def escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+metrics = Metrics()
+os.register_at_fork(after_in_child=metrics.after_fork)
@@ -0,0 +1,42 @@
+from domain.config import get_settings, settings_store
+from domain.metrics import metrics
+from scripts.calc import share_metrics, warm_models
+from scripts.jobs import connect_server, start_server, stop_server
+
+cfg = get_settings()
+
+wsgi_app = 'wsgi:app'
+bind = cfg['SERVER_BIND']
+workers = cfg['SERVER_WORKERS']
+threads = cfg['SERVER_THREADS']
+worker_class = 'gthread'
+timeout = cfg['SERVER_TIMEOUT']
+graceful_timeout = cfg['SERVER_GRACEFUL_TIMEOUT']
+preload_app = True
+loglevel = 'debug' if cfg['DEBUG'] else 'info'
+
+
+def when_ready(server):
+    share_metrics(get_settings(), clear=True)
+    start_server()
+
+
+def on_reload(server):
+    settings_store.reload()
+    warm_models(get_settings())
+
+
+def post_fork(server, worker):
+    settings_store.watch(get_settings()['CONFIG_RELOAD_INTERVAL'])
+    metrics.reset()
+    share_metrics(get_settings(), get_settings()['METRICS_FLUSH_INTERVAL'])
+    connect_server()
+
+
+def worker_exit(server, worker):
+    metrics.close()
+
+
+def on_exit(server):
+    stop_server()
+    metrics.close()
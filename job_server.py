@@ -0,0 +1,8 @@
+import os
+import sys
+
+from domain.config import get_settings
+from scripts.jobs import SERVER_KEY_ENV_VAR, serve
+
+if __name__ == '__main__':
+    serve(get_settings(), sys.argv[1], bytes.fromhex(os.environ.pop(SERVER_KEY_ENV_VAR)))
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import numpy as np
+import os
+import pandas as pd
+
+from typing import List, Optional
+
+from domain.errors import PayloadError
+from model.path import PathEstimator
+from model.store import atomic_write
+
+
+class Predictor:
+    categories: List[List[str]]
+    cat: List[str]
+    coef: np.ndarray
+    estimator_id: int
+    estimator_name: str
+    features: List[str]
+    fill_values: np.ndarray
+    intercept: float
+    mean: np.ndarray
+    num: List[str]
+    params: Optional[dict]
+    path: Optional[PathEstimator] = None
+    scale: np.ndarray
+    to_binarize: List[str]
+
+    def __init__(self, manifest: dict, arrays: dict):
+        self.features = manifest['features']
+        self.num = manifest['num']
+        self.cat = manifest['cat']
+        self.to_binarize = manifest['to_binarize']
+        self.categories = manifest['categories']
+        self.estimator_id = manifest['estimator_id']
+        self.estimator_name = manifest['estimator_name']
+        self.params = manifest['params']
+        self.intercept = manifest['intercept']
+        self.fill_values = arrays['fill_values']
+        self.mean = arrays['mean']
+        self.scale = arrays['scale']
+        self.coef = arrays['coef']
+        if 'path_alphas' in arrays:
+            self.path = PathEstimator.from_arrays(arrays, manifest['alpha'])
+        binarize = set(self.to_binarize)
+        self.num_binarize = np.array([c in binarize for c in self.num], dtype=bool)
+        self.cat_binarize = [c in binarize for c in self.cat]
+
+    def transform(self, x: pd.DataFrame) -> np.ndarray:
+        x = x.reindex(columns=self.features)
+        num = x[self.num].to_numpy(dtype=float)
+        missing = np.isnan(num)
+        num = np.where(missing, self.fill_values, num)
+        num[:, self.num_binarize] = missing[:, self.num_binarize]
+        num = (num - self.mean) / self.scale
+        ohe = []
+        for column, categories, binarize in zip(self.cat, self.categories, self.cat_binarize):
+            values = np.zeros(x.shape[0], dtype=int).astype(str) if binarize else x[column].astype(str).to_numpy()
+            ohe.append(values[:, None] == np.array(categories, dtype=str)[None, :])
+        return np.hstack(ohe + [num]) if ohe else num
+
+    def score(self, x: pd.DataFrame, alpha: Optional[float] = None) -> np.ndarray:
+        if alpha is None:
+            return self.transform(x) @ self.coef + self.intercept
+        if self.path is None:
+            raise ValueError('Model has no regularization path. Train it with n_alphas to score at any alpha.')
+        return self.path.predict(self.transform(x), alpha)
+
+    def predict(self, path: Optional[str] = None, storage_format: str = 'parquet', cache=None):
+        raise PayloadError('Slim artifact has no stored test split. Use /scores instead.')
+
+
+def save_artifact(pipe, path: str) -> str:
+    manifest, arrays = build_artifact(pipe.features, pipe.preprocessing, pipe.model, pipe.params, pipe.estimator)
+    return write_artifact(manifest, arrays, path)
+
+
+def build_artifact(features: List[str], preprocessing, model, params: Optional[dict], estimator) -> tuple:
+    if preprocessing.mean is None:
+        transformers = preprocessing.column_transformer.named_transformers_
+        mean, scale = transformers['scaling'].mean_, transformers['scaling'].scale_
+        categories = transformers['ohe'].categories_ if preprocessing.cat else []
+    else:
+        mean, scale, categories = preprocessing.mean, preprocessing.scale, preprocessing.categories
+    manifest = {
+        'features': list(features),
+        'num': list(preprocessing.num),
+        'cat': list(preprocessing.cat),
+        'to_binarize': [str(c) for c in preprocessing.to_binarize],
+        'categories': [[str(c) for c in column] for column in categories],
+        'estimator_id': model.estimator_id,
+        'estimator_name': model.estimator_name,
+        'params': params,
+        'intercept': float(np.ravel(estimator.intercept_)[0])
+    }
+    arrays = {
+        'fill_values': np.array([preprocessing.fill_values[c] for c in preprocessing.num], dtype=float),
+        'mean': np.asarray(mean, dtype=float),
+        'scale': np.asarray(scale, dtype=float),
+        'coef': np.ravel(estimator.coef_).astype(float)
+    }
+    if isinstance(estimator, PathEstimator):
+        manifest['alpha'] = estimator.alpha
+        arrays.update(estimator.to_arrays())
+    return manifest, arrays
+
+
+def artifact_digest(manifest: dict, arrays: dict) -> str:
+    digest = hashlib.sha256(json.dumps(manifest, sort_keys=True).encode())
+    for name in sorted(arrays):
+        digest.update(name.encode())
+        digest.update(np.ascontiguousarray(arrays[name]).tobytes())
+    return digest.hexdigest()
+
+
+def write_artifact(manifest: dict, arrays: dict, path: str) -> str:
+    manifest = {**manifest, 'arrays': os.path.basename(path) + '.npz'}
+
+    def write_arrays(tmp: str):
+        with open(tmp, 'wb') as f:
+            np.savez(f, **arrays)
+
+    def write_manifest(tmp: str):
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, indent=4)
+
+    atomic_write(path + '.npz', write_arrays)
+    return atomic_write(path + '.json', write_manifest)
+
+
+def artifact_size(path: str) -> int:
+    size = os.path.getsize(path)
+    if path.endswith('.json'):
+        size += os.path.getsize(path[:-len('.json')] + '.npz')
+    return size
+
+
+def load_artifact(path: str) -> Predictor:
+    with open(path, 'r') as f:
+        manifest = json.load(f)
+    with np.load(os.path.join(os.path.dirname(path), manifest['arrays'])) as npz:
+        arrays = {k: npz[k] for k in npz.files}
+    return Predictor(manifest, arrays)
@@ -1,21 +1,32 @@
+import hashlib
 import joblib
 import numpy as np
 import os
 import pandas as pd
+import uuid
 
 from dataclasses import dataclass
 from datetime import datetime
+from functools import cached_property
+from scipy import sparse
 from sklearn.compose import ColumnTransformer
 from sklearn.linear_model import Lasso, LinearRegression, Ridge
 from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import OneHotEncoder, StandardScaler
 from typing import Any, Callable, List, Optional
 
+from domain.metrics import metrics
+from model.cache import PreprocessingCache
+from model.storage import load_frame, save_frame
+from model.store import publish
+
 
 class Dataset:
     data: pd.DataFrame
     dataset_name: str
     features: List[str]
+    seed: Optional[int] = None
+    split_files: tuple[Optional[str], Optional[str]] = (None, None)
+    storage_format: str
     target: str
     test_size: float
     x_test: pd.DataFrame = None
@@ -24,7 +35,8 @@ class Dataset:
     y_train: pd.DataFrame = None
 
     def __init__(self, data: pd.DataFrame, dataset_name: str, target: str, storage_path: Optional[str],
-                 test_size: Optional[float] = 0.3):
+                 test_size: Optional[float] = 0.3, storage_format: str = 'parquet', split: Optional[tuple] = None,
+                 seed: Optional[int] = None):
         self.data = data
         self.dataset_name = dataset_name
         self.target = target
@@ -32,17 +44,50 @@ class Dataset:
         features.remove(self.target)
         self.features = features
         self.test_size = test_size
-        self.x_train, self.x_test, self.y_train, self.y_test = self.save_split(storage_path)
+        self.storage_format = storage_format
+        self.seed = seed
+        if split is None:
+            self.x_train, self.x_test, self.y_train, self.y_test = self.save_split(storage_path)
+        else:
+            self.x_train, self.x_test, self.y_train, self.y_test = split
+
+    @classmethod
+    def from_split(cls, train_file: str, test_file: str, dataset_name: str, target: str,
+                   memory_map: bool = True) -> 'Dataset':
+        train = load_frame(train_file, memory_map)
+        test = load_frame(test_file, memory_map)
+        features = [c for c in train.columns if c != target]
+        dataset = cls(pd.concat([train, test]), dataset_name, target, None, len(test) / (len(train) + len(test)),
+                      split=(train[features], test[features], train[target], test[target]))
+        dataset.split_files = (train_file, test_file)
+        return dataset
 
+    @cached_property
+    def fingerprint(self) -> Optional[str]:
+        if self.x_train is None:
+            return None
+        digest = hashlib.sha256()
+        for frame in (self.x_train, self.x_test, self.y_train, self.y_test):
+            columns = [frame.name] if isinstance(frame, pd.Series) else list(frame.columns)
+            digest.update(repr(columns).encode())
+            digest.update(pd.util.hash_pandas_object(frame, index=True).values.tobytes())
+        return digest.hexdigest()
+
+    @metrics.traced('save_split', rows=lambda split: 0 if split[0] is None else len(split[0]) + len(split[1]))
     def save_split(self, path: Optional[str]) -> tuple[Optional[pd.DataFrame], ...]:
         if path:
             x = self.data[self.features]
             y = self.data[self.target]
-            x_train, x_test, y_train, y_test = train_test_split(x, y, test_size=self.test_size)
+            x_train, x_test, y_train, y_test = train_test_split(x, y, test_size=self.test_size,
+                                                                random_state=self.seed)
             now = datetime.now()
             name = f'{now.year}.{now.month}.{now.day}_{now.hour}-{now.minute}-{now.second}_'
-            pd.concat([x_train, y_train], axis=1).to_excel(f'{path}/{name}train_{self.dataset_name}.xlsx')
-            pd.concat([x_test, y_test], axis=1).to_excel(f'{path}/{name}test_{self.dataset_name}.xlsx')
+            self.split_files = (
+                save_frame(pd.concat([x_train, y_train], axis=1), f'{path}/{name}train_{self.dataset_name}',
+                           self.storage_format),
+                save_frame(pd.concat([x_test, y_test], axis=1), f'{path}/{name}test_{self.dataset_name}',
+                           self.storage_format)
+            )
             return x_train, x_test, y_train, y_test
         return None, None, None, None
 
@@ -57,36 +102,116 @@ class Model:
 
 class Preprocessing:
     cat: list
+    categories: Optional[List[np.ndarray]] = None
     dataset: pd.DataFrame
     column_transformer: ColumnTransformer
+    dtype: np.dtype = np.float64
     fill_func: Callable
     fill_values: dict
+    mean: Optional[np.ndarray] = None
     num: list
+    scale: Optional[np.ndarray] = None
+    sparse_threshold: float = 0.3
     to_binarize: Optional[np.array] = None
 
-    def __init__(self, dataset: pd.DataFrame, fill_func: Callable = np.mean):
+    def __init__(self, dataset: pd.DataFrame, fill_func: Callable = np.mean, dtype: np.dtype = np.float64):
         self.dataset = dataset
         self.num = self.dataset.select_dtypes(['int64', 'float64']).columns.tolist()
         self.cat = self.dataset.select_dtypes(['object', 'string']).columns.tolist()
         self.fill_func = fill_func
-        self.column_transformer = ColumnTransformer([
-            ('ohe', OneHotEncoder(handle_unknown="ignore"), self.cat),
-            ('scaling', StandardScaler(), self.num)
-        ])
+        self.dtype = dtype
         self.to_binarize = np.array(self.dataset.columns)[
             (self.dataset.isna().sum() / self.dataset.shape[0] > 0.5).values]
         self.fill_values = dict(self.fill_func(self.dataset[self.num]))
+        self.compile()
 
-    def fit_transform(self, x_train: pd.DataFrame) -> pd.DataFrame:
-        x_train[self.cat] = x_train[self.cat].astype(str)
-        x_train[self.num] = x_train[self.num].astype(float)
-        x_train[self.to_binarize] = x_train[self.to_binarize].isna().astype(int)
-        x_train[self.num] = x_train[self.num].fillna(value=self.fill_values)
-        x_train[self.cat] = x_train[self.cat].fillna(-1000)
-        x_train = self.column_transformer.fit_transform(x_train)
-        return x_train
+    @classmethod
+    def from_stats(cls, num: list, cat: list, to_binarize: list, fill_values: dict, mean: np.ndarray,
+                   scale: np.ndarray, categories: List[np.ndarray], dtype: np.dtype = np.float64) -> 'Preprocessing':
+        preprocessing = cls.__new__(cls)
+        preprocessing.dataset = None
+        preprocessing.num, preprocessing.cat = num, cat
+        preprocessing.fill_func = np.mean
+        preprocessing.dtype = dtype
+        preprocessing.to_binarize = np.array(to_binarize, dtype=object)
+        preprocessing.fill_values = fill_values
+        preprocessing.mean, preprocessing.scale, preprocessing.categories = mean, scale, categories
+        preprocessing.compile()
+        return preprocessing
+
+    def compile(self):
+        binarize = set(self.to_binarize)
+        self.num_binarize = np.array([c in binarize for c in self.num], dtype=bool)
+        self.cat_binarize = [c in binarize for c in self.cat]
+        self.fill_vector = np.array([self.fill_values[c] for c in self.num], dtype=np.float64)
+
+    @property
+    def config(self) -> str:
+        return (f'{self.fill_func.__module__}.{self.fill_func.__name__}|ohe=ignore|scaling=standard|'
+                f'{np.dtype(self.dtype).name}|{self.sparse_threshold}')
+
+    def impute(self, x: pd.DataFrame) -> np.ndarray:
+        num = np.empty((x.shape[0], len(self.num)), dtype=np.float64, order='F')
+        for i, column in enumerate(self.num):
+            num[:, i] = x[column].to_numpy(dtype=np.float64)
+        missing = np.isnan(num)
+        np.copyto(num, np.broadcast_to(self.fill_vector, num.shape), where=missing)
+        num[:, self.num_binarize] = missing[:, self.num_binarize]
+        return num
+
+    def encode(self, x: pd.DataFrame) -> List[np.ndarray]:
+        values = []
+        for column, binarize in zip(self.cat, self.cat_binarize):
+            values.append(np.zeros(x.shape[0], dtype=int).astype(str) if binarize else
+                          x[column].to_numpy().astype(str))
+        return values
+
+    def compose(self, num: np.ndarray, cat: List[np.ndarray]) -> Any:
+        if not self.cat:
+            return num.astype(self.dtype, copy=False)
+        rows, columns, offset = [], [], 0
+        for values, categories in zip(cat, self.categories):
+            codes = np.searchsorted(categories, values)
+            known = codes < len(categories)
+            known[known] = categories[codes[known]] == values[known]
+            rows.append(np.flatnonzero(known))
+            columns.append(codes[known] + offset)
+            offset += len(categories)
+        rows, columns = np.concatenate(rows), np.concatenate(columns)
+        width = offset + num.shape[1]
+        density = (len(rows) + num.size) / (num.shape[0] * width) if num.shape[0] and width else 1
+        if density < self.sparse_threshold:
+            ohe = sparse.csr_matrix((np.ones(len(rows), dtype=self.dtype), (rows, columns)),
+                                    shape=(num.shape[0], offset))
+            return sparse.hstack([ohe, sparse.csr_matrix(num.astype(self.dtype, copy=False))], format='csr')
+        x = np.zeros((num.shape[0], width), dtype=self.dtype)
+        x[rows, columns] = 1
+        x[:, offset:] = num
+        return x
 
-    def transform(self, x_test: pd.DataFrame) -> pd.DataFrame:
+    @metrics.traced('fit_transform', rows=lambda x: x.shape[0])
+    def fit_transform(self, x_train: pd.DataFrame) -> Any:
+        num = self.impute(x_train)
+        self.mean = num.mean(axis=0)
+        num -= self.mean
+        var = np.einsum('ij,ij->j', num, num) / max(num.shape[0], 1)
+        eps = np.finfo(np.float64).eps
+        constant = var <= num.shape[0] * eps * var + (num.shape[0] * self.mean * eps) ** 2
+        self.scale = np.where(constant, 1.0, np.sqrt(var))
+        num /= self.scale
+        cat = self.encode(x_train)
+        self.categories = [np.unique(values) for values in cat]
+        return self.compose(num, cat)
+
+    def transform(self, x_test: pd.DataFrame) -> Any:
+        if self.mean is None:
+            return self.legacy_transform(x_test.copy())
+        num = self.impute(x_test)
+        num -= self.mean
+        num /= self.scale
+        return self.compose(num, self.encode(x_test))
+
+    def legacy_transform(self, x_test: pd.DataFrame) -> Any:
         x_test[self.cat] = x_test[self.cat].astype(str)
         x_test[self.num] = x_test[self.num].astype(float)
         x_test[self.to_binarize] = x_test[self.to_binarize].isna().astype(int)
@@ -97,6 +222,7 @@ class Preprocessing:
 
 
 class Pipe:
+    cache_key: Optional[str] = None
     dataset: Dataset
     estimator: Any
     model: Model
@@ -108,34 +234,74 @@ class Pipe:
         self.model = model
         self.preprocessing = Preprocessing(self.dataset.x_train)
 
-    def fit(self, params: Optional[dict] = None, path: Optional[str] = None):
+    @property
+    def features(self) -> List[str]:
+        return self.dataset.features
+
+    def preprocessing_key(self) -> Optional[str]:
+        if self.dataset.fingerprint is None:
+            return None
+        return hashlib.sha256(f'{self.dataset.fingerprint}|{self.preprocessing.config}'.encode()).hexdigest()
+
+    def fit_preprocessing(self, cache: Optional[PreprocessingCache] = None) -> Any:
+        self.cache_key = self.preprocessing_key()
+        cached = cache.get(self.cache_key) if cache else None
+        if cached is not None:
+            self.preprocessing, x_train, _ = cached
+            return x_train
         x_train = self.preprocessing.fit_transform(self.dataset.x_train)
+        if cache:
+            cache.put(self.cache_key, (self.preprocessing, x_train, self.preprocessing.transform(self.dataset.x_test)))
+        return x_train
+
+    def fit(self, params: Optional[dict] = None, path: Optional[str] = None,
+            cache: Optional[PreprocessingCache] = None) -> str:
+        x_train = self.fit_preprocessing(cache)
+        self.fit_estimator(x_train, params)
+        return self.save_model(path)
+
+    def fit_estimator(self, x_train: Any, params: Optional[dict] = None) -> Any:
         if params:
             estimator = self.model.base_estimator(**params)
             self.params = params
         else:
             estimator = self.model.base_estimator()
-        self.estimator = estimator.fit(x_train, self.dataset.y_train)
-        self.save_model(path)
+        with metrics.span('fit_estimator') as span:
+            self.estimator = estimator.fit(x_train, self.dataset.y_train)
+            span.rows = x_train.shape[0]
+        return self.estimator
 
-    def save_model(self, path: Optional[str] = None):
+    def save_model(self, path: Optional[str] = None, suffix: str = '') -> str:
         if not path:
             path = os.getcwd() + '/res/estimated_models'
-        now = datetime.now()
-        filename = f'{now.year}.{now.month}.{now.day}_{now.hour}-{now.minute}-{now.second}_{self.model.estimator_name}'
-        joblib.dump(self, path + '/' + filename + '_model.pkl')
+        with metrics.span('save_model'):
+            return publish(path, self.model.estimator_name, suffix + '_model.pkl', lambda tmp: joblib.dump(self, tmp))
 
-    def predict(self, path: Optional[str] = None):
-        x_test = self.preprocessing.transform(self.dataset.x_test)
+    def predict(self, path: Optional[str] = None, storage_format: str = 'parquet',
+                cache: Optional[PreprocessingCache] = None) -> str:
+        cached = cache.get(self.cache_key) if cache else None
+        x_test = cached[2] if cached is not None else self.preprocessing.transform(self.dataset.x_test)
         y_predict = self.estimator.predict(x_test)
-        self.save_predict(y_predict, path)
+        return self.save_predict(y_predict, path, storage_format)
+
+    def score(self, x: pd.DataFrame, alpha: Optional[float] = None) -> np.ndarray:
+        x = self.preprocessing.transform(x.reindex(columns=self.features))
+        if alpha is None:
+            return self.estimator.predict(x)
+        if not hasattr(self.estimator, 'alphas'):
+            raise ValueError('Model has no regularization path. Train it with n_alphas to score at any alpha.')
+        return self.estimator.predict(x, alpha)
 
-    def save_predict(self, prediction: pd.Series, path: Optional[str] = None):
+    def save_predict(self, prediction: pd.Series, path: Optional[str] = None, storage_format: str = 'parquet') -> str:
         if not path:
             path = os.getcwd() + '/res/prediction'
         now = datetime.now()
         filename = f'{now.year}.{now.month}.{now.day}_{now.hour}-{now.minute}-{now.second}_{self.model.estimator_name}'
-        pd.Series(prediction).to_excel(path + '/' + filename + '_predictions.xlsx')
+        filename += '_' + uuid.uuid4().hex[:8]
+        with metrics.span('save_predict') as span:
+            span.rows = len(prediction)
+            return save_frame(pd.Series(prediction, name='prediction').to_frame(),
+                              path + '/' + filename + '_predictions', storage_format)
 
 
 base_estimators = {
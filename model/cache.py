@@ -0,0 +1,169 @@
+import hashlib
+import joblib
+import numpy as np
+import os
+import pickle
+
+from scipy import sparse
+from time import monotonic
+from typing import Any, Callable, Optional
+
+from model.lru import BoundedLRU
+from model.store import file_digest
+
+DIGEST_ENTRIES: int = 1024
+
+
+def nbytes(matrix: Any) -> int:
+    if sparse.issparse(matrix):
+        matrix = matrix.tocsr()
+        return matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+    return np.asarray(matrix).nbytes
+
+
+class PreprocessingCache(BoundedLRU):
+    directory: Optional[str]
+    disk_bytes: Optional[int]
+
+    def __init__(self, max_entries: Optional[int] = 4, max_bytes: Optional[int] = None,
+                 directory: Optional[str] = None, disk_bytes: Optional[int] = None):
+        super().__init__(max_entries, max_bytes)
+        self.configure(max_entries, max_bytes, directory, disk_bytes)
+
+    def configure(self, max_entries: Optional[int], max_bytes: Optional[int], directory: Optional[str],
+                  disk_bytes: Optional[int]):
+        with self.lock:
+            self.directory = directory if disk_bytes != 0 else None
+            self.disk_bytes = disk_bytes
+            if self.directory:
+                os.makedirs(self.directory, exist_ok=True)
+            self.resize(max_entries, max_bytes)
+
+    def file(self, key: str) -> str:
+        return os.path.join(self.directory, key + '.joblib')
+
+    def get(self, key: Optional[str]) -> Optional[tuple]:
+        if not key or self.max_entries == 0:
+            return None
+        value = self.lookup(key)
+        if value is None and self.directory and os.path.exists(self.file(key)):
+            try:
+                value = joblib.load(self.file(key))
+            except (EOFError, OSError, ValueError):
+                value = None
+            if value is not None:
+                os.utime(self.file(key))
+                self.put(key, value, persist=False)
+        with self.lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def put(self, key: Optional[str], value: tuple, persist: bool = True):
+        if not key or self.max_entries == 0:
+            return
+        preprocessing, x_train, x_test = value
+        super().put(key, value, nbytes(x_train) + nbytes(x_test))
+        if persist and self.directory:
+            tmp = f'{self.file(key)}.{os.getpid()}.tmp'
+            joblib.dump(value, tmp)
+            os.replace(tmp, self.file(key))
+            self.evict_disk()
+
+    def evict_disk(self):
+        if not self.directory or not self.disk_bytes:
+            return
+        files = [os.path.join(self.directory, f) for f in os.listdir(self.directory) if f.endswith('.joblib')]
+        files = sorted(files, key=os.path.getmtime)
+        total = sum(os.path.getsize(f) for f in files)
+        while files and total > self.disk_bytes:
+            file = files.pop(0)
+            total -= os.path.getsize(file)
+            os.remove(file)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'size': self.size,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+class PredictionCache(BoundedLRU):
+    digests: BoundedLRU
+    expired: int = 0
+    ttl: Optional[float]
+
+    def __init__(self, max_entries: Optional[int] = 256, max_bytes: Optional[int] = None, ttl: Optional[float] = None):
+        super().__init__(max_entries, max_bytes)
+        self.digests = BoundedLRU(DIGEST_ENTRIES)
+        self.configure(max_entries, max_bytes, ttl)
+
+    def configure(self, max_entries: Optional[int], max_bytes: Optional[int], ttl: Optional[float]):
+        with self.lock:
+            self.ttl = ttl
+            self.resize(max_entries, max_bytes)
+
+    def model_digest(self, path: str) -> str:
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        entry = self.digests.lookup(path, lambda value: value[0] == stamp)
+        if entry is not None:
+            return entry[1]
+        digest = file_digest(path)
+        if path.endswith('.json'):
+            digest += file_digest(path[:-len('.json')] + '.npz')
+        self.digests.put(path, (stamp, digest))
+        return digest
+
+    def forget(self, path: str):
+        self.digests.drop(path)
+
+    def key(self, model_path: str, *inputs: Any) -> str:
+        digest = hashlib.sha256(self.model_digest(model_path).encode())
+        digest.update(pickle.dumps(inputs, protocol=5))
+        return digest.hexdigest()
+
+    def get(self, key: str, valid: Optional[Callable[[Any], bool]] = None) -> Optional[Any]:
+        if self.max_entries == 0:
+            return None
+        with self.lock:
+            entry = self.lookup(key)
+            if entry is not None and self.ttl and entry[0] + self.ttl < monotonic():
+                self.drop(key)
+                self.expired += 1
+                entry = None
+            if entry is not None and valid is not None and not valid(entry[1]):
+                self.drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, value: Any, size: int):
+        super().put(key, (monotonic(), value), size)
+
+    def clear(self):
+        with self.lock:
+            super().clear()
+            self.digests.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'size': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'expired': self.expired
+            }
+
+
+preprocessing_cache = PreprocessingCache()
+prediction_cache = PredictionCache()
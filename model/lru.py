@@ -0,0 +1,76 @@
+import threading
+
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class BoundedLRU:
+    entries: OrderedDict
+    hits: int = 0
+    lock: threading.RLock
+    max_bytes: Optional[int]
+    max_entries: Optional[int]
+    misses: int = 0
+    size: int = 0
+
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None):
+        self.entries = OrderedDict()
+        self.lock = threading.RLock()
+        self.resize(max_entries, max_bytes)
+
+    def resize(self, max_entries: Optional[int], max_bytes: Optional[int]):
+        with self.lock:
+            self.max_entries = max_entries
+            self.max_bytes = max_bytes
+            self.evict()
+
+    def lookup(self, key: Hashable, valid: Optional[Callable[[Any], bool]] = None) -> Optional[Any]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if valid is not None and not valid(entry[1]):
+                self.drop(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def get(self, key: Hashable, valid: Optional[Callable[[Any], bool]] = None) -> Optional[Any]:
+        with self.lock:
+            value = self.lookup(key, valid)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, size: int = 0) -> bool:
+        with self.lock:
+            self.drop(key)
+            if self.max_entries == 0 or (self.max_bytes and size > self.max_bytes):
+                return False
+            self.entries[key] = (size, value)
+            self.size += size
+            self.evict()
+            return True
+
+    def drop(self, key: Hashable) -> Optional[Any]:
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return None
+            self.size -= entry[0]
+            return entry[1]
+
+    def evict(self):
+        with self.lock:
+            while self.entries and (
+                    (self.max_entries is not None and len(self.entries) > self.max_entries) or
+                    (self.max_bytes and self.size > self.max_bytes)):
+                _, (size, _) = self.entries.popitem(last=False)
+                self.size -= size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
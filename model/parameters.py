@@ -0,0 +1,21 @@
+import json
+import os
+
+from typing import Optional
+
+
+def params_file(params_path: str, model: str) -> str:
+    return os.path.join(params_path, ''.join(word.title() for word in model.split('_')) + '_parameters.json')
+
+
+def read_params(params_path: str, model: str) -> dict:
+    with open(params_file(params_path, model), 'r') as f:
+        return dict(json.load(f))
+
+
+def write_params(params_path: str, model: str, params: Optional[dict]) -> str:
+    path = params_file(params_path, model)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(params or {}, f, indent=4)
+    os.replace(path + '.tmp', path)
+    return path
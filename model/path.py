@@ -0,0 +1,110 @@
+import numpy as np
+
+from scipy import sparse
+from sklearn.linear_model import Lasso, Ridge, lasso_path
+from typing import Any, Callable, Dict, List, Optional
+
+
+class PathEstimator:
+    alpha: float
+    alphas: np.ndarray
+    coefs: np.ndarray
+    factors: Optional[Dict[str, np.ndarray]] = None
+    intercepts: np.ndarray
+    rmse: Optional[np.ndarray] = None
+
+    def __init__(self, alphas: np.ndarray, coefs: np.ndarray, intercepts: np.ndarray,
+                 factors: Optional[Dict[str, np.ndarray]] = None, alpha: Optional[float] = None):
+        order = np.argsort(alphas)[::-1]
+        self.alphas = np.asarray(alphas, dtype=float)[order]
+        self.coefs = np.asarray(coefs, dtype=float)[order]
+        self.intercepts = np.asarray(intercepts, dtype=float)[order]
+        self.factors = factors
+        self.alpha = float(self.alphas[-1] if alpha is None else alpha)
+
+    @property
+    def coef_(self) -> np.ndarray:
+        return self.coef_at(self.alpha)[0]
+
+    @property
+    def intercept_(self) -> float:
+        return self.coef_at(self.alpha)[1]
+
+    def coef_at(self, alpha: float) -> tuple:
+        if self.factors is not None:
+            f = self.factors
+            coef = f['vt'].T @ (f['s'] / (f['s'] ** 2 + alpha) * f['uty'])
+            return coef, float(f['y_mean'] - f['x_mean'] @ coef)
+        if not self.alphas[-1] <= alpha <= self.alphas[0]:
+            raise ValueError(f'alpha must be within the path [{self.alphas[-1]:.6g}, {self.alphas[0]:.6g}].')
+        i = min(int(np.searchsorted(-self.alphas, -alpha, side='right')), len(self.alphas) - 1)
+        if i == 0 or self.alphas[i] == alpha:
+            return self.coefs[i], float(self.intercepts[i])
+        t = (self.alphas[i - 1] - alpha) / (self.alphas[i - 1] - self.alphas[i])
+        return (1 - t) * self.coefs[i - 1] + t * self.coefs[i], float((1 - t) * self.intercepts[i - 1] +
+                                                                      t * self.intercepts[i])
+
+    def predict(self, x: Any, alpha: Optional[float] = None) -> np.ndarray:
+        coef, intercept = self.coef_at(self.alpha if alpha is None else alpha)
+        return np.asarray(x @ coef).ravel() + intercept
+
+    def path_rmse(self, x: Any, y: Any) -> np.ndarray:
+        y = np.asarray(y, dtype=float)
+        predictions = np.asarray(x @ self.coefs.T) + self.intercepts
+        return np.sqrt(((predictions - y[:, None]) ** 2).mean(axis=0))
+
+    def select(self, rmse: np.ndarray) -> float:
+        self.rmse = np.asarray(rmse, dtype=float)
+        self.alpha = float(self.alphas[int(np.argmin(self.rmse))])
+        return self.alpha
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        arrays = {'path_alphas': self.alphas, 'path_coefs': self.coefs, 'path_intercepts': self.intercepts}
+        for k, v in (self.factors or {}).items():
+            arrays['path_' + k] = np.asarray(v, dtype=float)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], alpha: float) -> 'PathEstimator':
+        factors = {k: arrays['path_' + k] for k in ('s', 'vt', 'uty', 'x_mean', 'y_mean')} \
+            if 'path_vt' in arrays else None
+        return cls(arrays['path_alphas'], arrays['path_coefs'], arrays['path_intercepts'], factors, alpha)
+
+
+def center(x: Any, y: Any) -> tuple:
+    x = x.toarray() if sparse.issparse(x) else np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    x_mean, y_mean = x.mean(axis=0), y.mean()
+    return x - x_mean, y - y_mean, x_mean, y_mean
+
+
+def fit_lasso_path(x: Any, y: Any, n_alphas: int = 100, eps: float = 1e-3,
+                   alphas: Optional[np.ndarray] = None) -> PathEstimator:
+    xc, yc, x_mean, y_mean = center(x, y)
+    alphas, coefs, _ = lasso_path(np.asfortranarray(xc), yc, eps=eps, n_alphas=n_alphas, alphas=alphas)
+    coefs = coefs.T
+    return PathEstimator(alphas, coefs, y_mean - coefs @ x_mean)
+
+
+def fit_ridge_path(x: Any, y: Any, n_alphas: int = 100, eps: float = 1e-3,
+                   alphas: Optional[np.ndarray] = None) -> PathEstimator:
+    xc, yc, x_mean, y_mean = center(x, y)
+    u, s, vt = np.linalg.svd(xc, full_matrices=False)
+    uty = u.T @ yc
+    if alphas is None:
+        top = s.max() ** 2 if len(s) else 1.0
+        alphas = np.logspace(np.log10(top), np.log10(top * eps), n_alphas)
+    coefs = (vt.T @ (s[:, None] / (s[:, None] ** 2 + alphas[None, :]) * uty[:, None])).T
+    factors = {'s': s, 'vt': vt, 'uty': uty, 'x_mean': x_mean, 'y_mean': np.float64(y_mean)}
+    return PathEstimator(alphas, coefs, y_mean - coefs @ x_mean, factors)
+
+
+def cross_validate(solver: Callable, folds: List[tuple], alphas: np.ndarray) -> np.ndarray:
+    return np.mean([solver(x_train, y_train, alphas=alphas).path_rmse(x_val, y_val)
+                    for x_train, y_train, x_val, y_val in folds], axis=0)
+
+
+path_solvers = {
+    Lasso: fit_lasso_path,
+    Ridge: fit_ridge_path
+}
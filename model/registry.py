@@ -0,0 +1,48 @@
+import joblib
+import os
+
+from typing import Any, List, Optional
+
+from domain.metrics import metrics
+from model.artifact import artifact_size, load_artifact
+from model.lru import BoundedLRU
+
+
+class ModelRegistry(BoundedLRU):
+
+    def __init__(self, max_models: Optional[int] = 8, max_bytes: Optional[int] = None):
+        super().__init__(max_models, max_bytes)
+
+    def configure(self, max_models: Optional[int], max_bytes: Optional[int]):
+        self.resize(max_models, max_bytes)
+
+    def get(self, path: str) -> Any:
+        stat = os.stat(path)
+        entry = super().get(path, lambda value: value[0] == stat.st_mtime_ns)
+        if entry is not None:
+            return entry[1]
+        with metrics.span('load_model'):
+            pipe = load_artifact(path) if path.endswith('.json') else joblib.load(path)
+        self.put(path, (stat.st_mtime_ns, pipe), artifact_size(path))
+        return pipe
+
+    def warm(self, directory: str, count: Optional[int]) -> List[str]:
+        if not count or not os.path.isdir(directory):
+            return []
+        paths = [os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.pkl')]
+        paths = sorted(paths, key=os.path.getmtime, reverse=True)[:count]
+        for path in reversed(paths):
+            self.get(path)
+        return paths
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'models': list(os.path.basename(p) for p in self.entries),
+                'size': self.size,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+registry = ModelRegistry()
@@ -0,0 +1,76 @@
+import itertools
+import math
+import numpy as np
+
+from joblib import Parallel, delayed
+from sklearn.metrics import mean_squared_error
+from sklearn.model_selection import KFold
+from typing import Any, List, Optional
+
+from model.base import Dataset, Preprocessing
+
+DEFAULT_SPACES: dict = {
+    'LASSO_REGRESSION': {'alpha': {'loguniform': [1e-3, 1e2]}},
+    'LINEAR_REGRESSION': {'fit_intercept': [True, False]},
+    'RIDGE_REGRESSION': {'alpha': {'loguniform': [1e-3, 1e3]}}
+}
+DISTRIBUTIONS: tuple = ('loguniform', 'uniform', 'randint')
+
+
+def sample(rng: np.random.Generator, value: Any) -> Any:
+    if isinstance(value, list):
+        return value[rng.integers(len(value))]
+    (distribution, (low, high)), = value.items()
+    if distribution == 'loguniform':
+        return float(f'{10 ** rng.uniform(math.log10(low), math.log10(high)):.6g}')
+    if distribution == 'uniform':
+        return float(f'{rng.uniform(low, high):.6g}')
+    return int(rng.integers(low, high + 1))
+
+
+def candidates(space: dict, n_iter: int, seed: Optional[int] = None) -> List[dict]:
+    if all(isinstance(v, list) for v in space.values()):
+        return [dict(zip(space, values)) for values in itertools.product(*space.values())]
+    rng = np.random.default_rng(seed)
+    result = []
+    for _ in range(n_iter):
+        params = {k: sample(rng, v) for k, v in space.items()}
+        if params not in result:
+            result.append(params)
+    return result
+
+
+def make_folds(dataset: Dataset, n_folds: int, seed: Optional[int] = None) -> List[tuple]:
+    folds = []
+    for train, val in KFold(n_folds, shuffle=True, random_state=seed).split(dataset.x_train):
+        x_train, x_val = dataset.x_train.iloc[train], dataset.x_train.iloc[val]
+        preprocessing = Preprocessing(x_train)
+        folds.append((preprocessing.fit_transform(x_train), dataset.y_train.iloc[train].to_numpy(),
+                      preprocessing.transform(x_val), dataset.y_train.iloc[val].to_numpy()))
+    return folds
+
+
+def evaluate(estimator: Any, params: dict, fold: tuple) -> float:
+    x_train, y_train, x_val, y_val = fold
+    prediction = estimator(**params).fit(x_train, y_train).predict(x_val)
+    return float(np.sqrt(mean_squared_error(y_val, prediction)))
+
+
+def search(estimator: Any, params: List[dict], folds: List[tuple], eta: int = 3, n_jobs: Optional[int] = None) -> dict:
+    scores = [[] for _ in params]
+    alive = list(range(len(params)))
+    with Parallel(n_jobs=n_jobs) as parallel:
+        for k, fold in enumerate(folds):
+            results = parallel(delayed(evaluate)(estimator, params[i], fold) for i in alive)
+            for i, rmse in zip(alive, results):
+                scores[i].append(rmse)
+            if k < len(folds) - 1:
+                alive = sorted(alive, key=lambda i: np.mean(scores[i]))[:max(1, math.ceil(len(alive) / eta))]
+    best = min(alive, key=lambda i: np.mean(scores[i]))
+    return {
+        'best_params': params[best],
+        'rmse': float(np.mean(scores[best])),
+        'candidates': len(params),
+        'evaluations': sum(len(s) for s in scores),
+        'pruned': len(params) - len(alive)
+    }
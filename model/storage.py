@@ -0,0 +1,50 @@
+import os
+import pandas as pd
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+from typing import Dict, Iterator
+
+EXTENSIONS: Dict[str, str] = {
+    'parquet': '.parquet',
+    'feather': '.feather',
+    'excel': '.xlsx'
+}
+
+
+def save_frame(data: pd.DataFrame, path: str, storage_format: str = 'parquet') -> str:
+    file = path + EXTENSIONS[storage_format]
+    if storage_format == 'parquet':
+        data.to_parquet(file)
+    elif storage_format == 'feather':
+        data.reset_index().to_feather(file)
+    else:
+        data.to_excel(file)
+    return file
+
+
+def load_frame(file: str, memory_map: bool = True) -> pd.DataFrame:
+    extension = os.path.splitext(file)[1]
+    if extension == EXTENSIONS['parquet']:
+        return pd.read_parquet(file, memory_map=memory_map)
+    if extension == EXTENSIONS['feather']:
+        data = feather.read_table(file, memory_map=memory_map).to_pandas()
+        return data.set_index(data.columns[0]).rename_axis(None)
+    return pd.read_excel(file, index_col=0)
+
+
+def iter_frame(file: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    extension = os.path.splitext(file)[1]
+    if extension == EXTENSIONS['parquet']:
+        for batch in pq.ParquetFile(file, memory_map=True, pre_buffer=True).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+        return
+    if extension == EXTENSIONS['feather']:
+        table = feather.read_table(file, memory_map=True)
+        for offset in range(0, table.num_rows, chunk_size):
+            data = table.slice(offset, chunk_size).to_pandas()
+            yield data.set_index(data.columns[0]).rename_axis(None)
+        return
+    data = load_frame(file)
+    for offset in range(0, data.shape[0], chunk_size):
+        yield data.iloc[offset:offset + chunk_size]
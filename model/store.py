@@ -0,0 +1,46 @@
+import hashlib
+import os
+import uuid
+
+from typing import Callable
+
+DIGEST_LENGTH: int = 16
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def temp_path(directory: str) -> str:
+    return os.path.join(directory, f'.{uuid.uuid4().hex}.tmp')
+
+
+def atomic_write(path: str, write: Callable[[str], None]) -> str:
+    tmp = temp_path(os.path.dirname(path) or '.')
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return path
+
+
+def addressed_name(prefix: str, digest: str, suffix: str) -> str:
+    return f'{prefix}_{digest[:DIGEST_LENGTH]}{suffix}'
+
+
+def publish(directory: str, prefix: str, suffix: str, write: Callable[[str], None]) -> str:
+    tmp = temp_path(directory)
+    try:
+        write(tmp)
+        path = os.path.join(directory, addressed_name(prefix, file_digest(tmp), suffix))
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return path
@@ -0,0 +1,170 @@
+import numpy as np
+import pandas as pd
+
+from scipy import sparse
+from sklearn.linear_model import Lasso, LinearRegression, Ridge
+from typing import Any, Dict, List, Optional
+
+from model.base import Preprocessing
+
+
+def is_test(ids: np.ndarray, seed: Optional[int] = None, test_size: float = 0.3) -> np.ndarray:
+    z = np.asarray(ids).astype(np.uint64) + np.uint64((seed or 0) + 0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z = z ^ (z >> np.uint64(31))
+    return z % np.uint64(10000) < np.uint64(round(test_size * 10000))
+
+
+class StreamingStats:
+    cat: List[str]
+    count: np.ndarray
+    features: List[str]
+    m2: np.ndarray
+    mean: np.ndarray
+    missing: np.ndarray
+    n: int = 0
+    num: List[str]
+    vocabularies: List[set]
+
+    def __init__(self, features: List[str]):
+        self.features = features
+        self.num, self.cat = None, None
+
+    def setup(self, x: pd.DataFrame):
+        self.num = x.select_dtypes(['int64', 'float64']).columns.tolist()
+        self.cat = x.select_dtypes(['object', 'string']).columns.tolist()
+        self.count = np.zeros(len(self.num))
+        self.mean = np.zeros(len(self.num))
+        self.m2 = np.zeros(len(self.num))
+        self.missing = np.zeros(len(self.features))
+        self.vocabularies = [set() for _ in self.cat]
+
+    def update(self, x: pd.DataFrame):
+        x = x[self.features]
+        if self.num is None:
+            self.setup(x)
+        if x.empty:
+            return
+        self.n += x.shape[0]
+        self.missing += x.isna().sum().to_numpy()
+        values = x[self.num].to_numpy(dtype=np.float64)
+        present = ~np.isnan(values)
+        count = present.sum(axis=0)
+        mean = np.divide(np.where(present, values, 0).sum(axis=0), count, out=np.zeros(len(self.num)),
+                         where=count > 0)
+        m2 = np.where(present, values - mean, 0)
+        m2 = np.einsum('ij,ij->j', m2, m2)
+        total = self.count + count
+        delta = mean - self.mean
+        ratio = np.divide(count, total, out=np.zeros(len(self.num)), where=total > 0)
+        self.mean += delta * ratio
+        self.m2 += m2 + delta ** 2 * self.count * ratio
+        self.count = total
+        for vocabulary, column in zip(self.vocabularies, self.cat):
+            vocabulary.update(np.unique(x[column].to_numpy().astype(str)))
+
+    def preprocessing(self) -> Preprocessing:
+        n = max(self.n, 1)
+        to_binarize = [c for c, m in zip(self.features, self.missing) if m / n > 0.5]
+        binarize = np.array([c in to_binarize for c in self.num], dtype=bool)
+        fill = np.where(self.count > 0, self.mean, np.nan)
+        p = (n - self.count) / n
+        mean = np.where(binarize, p, fill)
+        var = np.where(binarize, p * (1 - p), self.m2 / n)
+        eps = np.finfo(np.float64).eps
+        constant = var <= n * eps * var + (n * mean * eps) ** 2
+        scale = np.where(constant, 1.0, np.sqrt(var))
+        categories = [np.array(['0']) if c in to_binarize else np.array(sorted(v))
+                      for c, v in zip(self.cat, self.vocabularies)]
+        return Preprocessing.from_stats(self.num, self.cat, to_binarize, dict(zip(self.num, fill)), mean, scale,
+                                        categories)
+
+
+class GramAccumulator:
+    n: int = 0
+    x_sum: Optional[np.ndarray] = None
+    xtx: Optional[np.ndarray] = None
+    xty: Optional[np.ndarray] = None
+    y_sum: float = 0.0
+    yy: float = 0.0
+
+    def update(self, x: Any, y: np.ndarray):
+        y = np.asarray(y, dtype=np.float64)
+        xtx = x.T @ x
+        xtx = xtx.toarray() if sparse.issparse(xtx) else xtx
+        if self.xtx is None:
+            self.xtx = np.zeros_like(xtx)
+            self.xty = np.zeros(xtx.shape[0])
+            self.x_sum = np.zeros(xtx.shape[0])
+        self.n += x.shape[0]
+        self.xtx += xtx
+        self.xty += np.asarray(x.T @ y).ravel()
+        self.x_sum += np.asarray(x.sum(axis=0)).ravel()
+        self.y_sum += float(y.sum())
+        self.yy += float(y @ y)
+
+    def centered(self, fit_intercept: bool = True) -> tuple:
+        if not fit_intercept:
+            return self.xtx, self.xty, np.zeros_like(self.x_sum), 0.0
+        x_mean, y_mean = self.x_sum / self.n, self.y_sum / self.n
+        return self.xtx - self.n * np.outer(x_mean, x_mean), self.xty - self.n * x_mean * y_mean, x_mean, y_mean
+
+    def metrics(self, coef: np.ndarray, intercept: float) -> dict:
+        sse = (self.yy - 2 * (coef @ self.xty + intercept * self.y_sum) + coef @ self.xtx @ coef +
+               2 * intercept * coef @ self.x_sum + self.n * intercept ** 2)
+        sst = self.yy - self.y_sum ** 2 / self.n
+        return {
+            'r2': float(1 - sse / sst) if sst > 0 else 0.0,
+            'rmse': float(np.sqrt(max(sse, 0) / self.n))
+        }
+
+
+def lasso_gram(q_xx: np.ndarray, q_xy: np.ndarray, n: int, alpha: float, max_iter: int = 1000,
+               tol: float = 1e-4) -> np.ndarray:
+    w = np.zeros(len(q_xy))
+    r = q_xy.copy()
+    diag = np.diag(q_xx)
+    threshold = n * alpha
+    for _ in range(max_iter):
+        w_max, d_max = 0.0, 0.0
+        for j in np.flatnonzero(diag > 0):
+            rho = r[j] + diag[j] * w[j]
+            new = np.sign(rho) * max(abs(rho) - threshold, 0.0) / diag[j]
+            if new != w[j]:
+                r -= q_xx[:, j] * (new - w[j])
+                d_max = max(d_max, abs(new - w[j]))
+                w[j] = new
+            w_max = max(w_max, abs(w[j]))
+        if w_max == 0 or d_max / w_max < tol:
+            break
+    return w
+
+
+def solve_linear(q_xx: np.ndarray, q_xy: np.ndarray, n: int, params: dict) -> np.ndarray:
+    return np.linalg.lstsq(q_xx, q_xy, rcond=None)[0]
+
+
+def solve_ridge(q_xx: np.ndarray, q_xy: np.ndarray, n: int, params: dict) -> np.ndarray:
+    return np.linalg.solve(q_xx + params.get('alpha', 1.0) * np.eye(len(q_xy)), q_xy)
+
+
+def solve_lasso(q_xx: np.ndarray, q_xy: np.ndarray, n: int, params: dict) -> np.ndarray:
+    return lasso_gram(q_xx, q_xy, n, params.get('alpha', 1.0), params.get('max_iter', 1000), params.get('tol', 1e-4))
+
+
+gram_solvers = {
+    Lasso: solve_lasso,
+    LinearRegression: solve_linear,
+    Ridge: solve_ridge
+}
+
+
+def solve(acc: GramAccumulator, base_estimator: Any, params: Dict[str, Any]) -> Any:
+    q_xx, q_xy, x_mean, y_mean = acc.centered(params.get('fit_intercept', True))
+    coef = gram_solvers[base_estimator](q_xx, q_xy, acc.n, params)
+    estimator = base_estimator(**params)
+    estimator.coef_ = coef
+    estimator.intercept_ = float(y_mean - x_mean @ coef)
+    estimator.n_features_in_ = len(coef)
+    return estimator
@@ -1,166 +1,461 @@
-import joblib
+import json
+import numpy as np
+import os
 import pandas as pd
+import sys
+import uuid
 
-from typing import Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from joblib import Parallel, delayed
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+from sqlalchemy import select
+from time import perf_counter
+from typing import Any, Callable, Iterator, List, Optional
 
+from dbs.catalog import ModelCatalog, model_entry
 from dbs.database import DatabaseSession
 from dbs.entities import Data
+from domain.config import Settings
 from domain.enums import EModels, EModes, DataSheetIndexes
+from domain.errors import PayloadError
+from domain.logger import timed
+from domain.metrics import metrics
+from model.artifact import artifact_digest, build_artifact, save_artifact, write_artifact
 from model.base import Dataset, Model, Pipe, base_estimators
+from model.cache import prediction_cache, preprocessing_cache
+from model.parameters import write_params
+from model.path import cross_validate, path_solvers
+from model.registry import registry
+from model.search import DEFAULT_SPACES, DISTRIBUTIONS, candidates, make_folds, search
+from model.storage import iter_frame
+from model.store import addressed_name
+from model.streaming import GramAccumulator, StreamingStats, is_test, solve
 
 
-def train(data: pd.DataFrame, storage_path: str, model_id: int, model_params: Optional[dict]):
-    dataset = Dataset(data, 'data', 'edu_index', storage_path)
-    model = Model(base_estimators[model_id], model_id, EModels(model_id).name, model_params)
-    pipe = Pipe(dataset, model)
-    pipe.fit()
+def train(data: pd.DataFrame, storage_path: str, model_id: int, model_params: Optional[dict],
+          models_path: Optional[str] = None, slim_artifact: bool = False, split_format: str = 'parquet',
+          timings: Optional[dict] = None, seed: Optional[int] = None) -> str:
+    timings = {} if timings is None else timings
+    with timed(timings, 'split'):
+        dataset = Dataset(data, 'data', 'edu_index', storage_path, storage_format=split_format, seed=seed)
+    return fit(dataset, model_id, model_params, models_path, slim_artifact, timings)
 
 
-def predict(model_path: str, prediction_path: str):
-    pipe = joblib.load(model_path)
-    pipe.predict(prediction_path)
+def fit(dataset: Dataset, model_id: int, model_params: Optional[dict], models_path: Optional[str] = None,
+        slim_artifact: bool = False, timings: Optional[dict] = None, catalog: Optional[ModelCatalog] = None) -> str:
+    timings = {} if timings is None else timings
+    with timed(timings, 'fit'):
+        params = filter_params(base_estimators[model_id], model_params)
+        model = Model(base_estimators[model_id], model_id, EModels(model_id).name, params)
+        pipe = Pipe(dataset, model)
+        path = pipe.fit(params, models_path, preprocessing_cache)
+    if slim_artifact:
+        with timed(timings, 'slim_artifact'):
+            save_artifact(pipe, path[:-len('.pkl')])
+    if catalog is not None:
+        with timed(timings, 'catalog'):
+            y_pred = pipe.estimator.predict(pipe.preprocessing.transform(dataset.x_test))
+            record_model(catalog, path, model.estimator_name, params, dataset.fingerprint,
+                         regression_metrics(dataset.y_test, y_pred), slim_artifact)
+    return path
 
 
-def get_data(cfg: dict):
+def fit_path(dataset: Dataset, model_id: int, n_alphas: int, eps: float, models_path: Optional[str] = None,
+             slim_artifact: bool = False, timings: Optional[dict] = None, catalog: Optional[ModelCatalog] = None,
+             n_folds: int = 5, seed: Optional[int] = None) -> str:
+    timings = {} if timings is None else timings
+    if base_estimators[model_id] not in path_solvers:
+        raise PayloadError(f'{EModels(model_id).name} has no regularization path.')
+    pipe = Pipe(dataset, Model(base_estimators[model_id], model_id, EModels(model_id).name, None))
+    with timed(timings, 'preprocessing'):
+        x_train = pipe.fit_preprocessing(preprocessing_cache)
+        x_test = pipe.preprocessing.transform(dataset.x_test)
+    with timed(timings, 'path'):
+        solver = path_solvers[base_estimators[model_id]]
+        pipe.estimator = solver(x_train, dataset.y_train, n_alphas, eps)
+    with timed(timings, 'cross_validation'):
+        pipe.estimator.select(cross_validate(solver, make_folds(dataset, n_folds, seed), pipe.estimator.alphas))
+        pipe.params = {'alpha': pipe.estimator.alpha}
+    path = pipe.save_model(models_path, '_path')
+    if slim_artifact:
+        with timed(timings, 'slim_artifact'):
+            save_artifact(pipe, path[:-len('.pkl')])
+    if catalog is not None:
+        record_model(catalog, path, pipe.model.estimator_name, pipe.params, dataset.fingerprint,
+                     regression_metrics(dataset.y_test, pipe.estimator.predict(x_test)), slim_artifact)
+    return path
+
+
+def fit_stream(chunks: Callable[[], Iterator[pd.DataFrame]], model_id: int, model_params: Optional[dict],
+               target: str, models_path: Optional[str] = None, seed: Optional[int] = None, test_size: float = 0.3,
+               timings: Optional[dict] = None, catalog: Optional[ModelCatalog] = None) -> tuple:
+    timings = {} if timings is None else timings
+    with timed(timings, 'statistics'):
+        stats = None
+        for chunk in chunks():
+            if stats is None:
+                stats = StreamingStats([c for c in chunk.columns if c != target])
+            stats.update(chunk[~is_test(chunk['id'], seed, test_size)])
+        if stats is None or not stats.n:
+            raise PayloadError('No training rows to fit on.')
+        preprocessing = stats.preprocessing()
+    with timed(timings, 'gram'):
+        train_acc, test_acc = GramAccumulator(), GramAccumulator()
+        for chunk in chunks():
+            test = is_test(chunk['id'], seed, test_size)
+            x = preprocessing.transform(chunk[stats.features])
+            train_acc.update(x[~test], chunk[target].to_numpy()[~test])
+            test_acc.update(x[test], chunk[target].to_numpy()[test])
+    with timed(timings, 'fit'):
+        params = filter_params(base_estimators[model_id], model_params)
+        estimator = solve(train_acc, base_estimators[model_id], params)
+    model = Model(base_estimators[model_id], model_id, EModels(model_id).name, params)
+    if not models_path:
+        models_path = os.getcwd() + '/res/estimated_models'
+    manifest, arrays = build_artifact(stats.features, preprocessing, model, params or None, estimator)
+    name = addressed_name(model.estimator_name, artifact_digest(manifest, arrays), '_stream_model')
+    path = write_artifact(manifest, arrays, os.path.join(models_path, name))
+    scores = test_acc.metrics(estimator.coef_, estimator.intercept_) if test_acc.n else {}
+    if catalog is not None:
+        record_model(catalog, path, model.estimator_name, params or None, catalog.data_hash(), scores, False)
+    return path, {'train_rows': train_acc.n, 'test_rows': test_acc.n, **scores}
+
+
+def filter_params(estimator: Any, params: Optional[dict]) -> dict:
+    valid = estimator().get_params()
+    return {k: v for k, v in (params or {}).items() if k in valid}
+
+
+def record_model(catalog: ModelCatalog, path: str, model: str, params: Optional[dict], data_hash: Optional[str],
+                 scores: Optional[dict], slim_artifact: bool):
+    paths = [path] + ([path[:-len('.pkl')] + '.json'] if slim_artifact and path.endswith('.pkl') else [])
+    catalog.add([model_entry(p, model, params, data_hash, scores) for p in paths])
+
+
+def model_catalog(cfg: dict) -> ModelCatalog:
+    return ModelCatalog(cfg['MODEL_CATALOG_DATABASE'] or cfg['SQLALCHEMY_DATABASE'])
+
+
+def regression_metrics(y_true: Any, y_pred: Any) -> dict:
+    return {
+        'r2': float(r2_score(y_true, y_pred)),
+        'mae': float(mean_absolute_error(y_true, y_pred)),
+        'rmse': float(np.sqrt(mean_squared_error(y_true, y_pred)))
+    }
+
+
+def fit_estimator(pipe: Pipe, x_train: Any, x_test: Any, models_path: Optional[str],
+                  slim_artifact: bool) -> dict:
+    start = perf_counter()
+    pipe.fit_estimator(x_train, pipe.model.params)
+    fit_time = perf_counter() - start
+    path = pipe.save_model(models_path)
+    if slim_artifact:
+        save_artifact(pipe, path[:-len('.pkl')])
+    return {
+        'model': pipe.model.estimator_name,
+        'params': pipe.model.params,
+        'fit_time': round(fit_time, 4),
+        **regression_metrics(pipe.dataset.y_test, pipe.estimator.predict(x_test)),
+        'file': os.path.basename(path)
+    }
+
+
+def fit_batch(dataset: Dataset, models: List[dict], models_path: Optional[str] = None, slim_artifact: bool = False,
+              n_jobs: Optional[int] = None, timings: Optional[dict] = None,
+              catalog: Optional[ModelCatalog] = None) -> List[dict]:
+    timings = {} if timings is None else timings
+    pipes = []
+    for m in models:
+        params = filter_params(base_estimators[m['model_id']], m['model_params'])
+        pipes.append(Pipe(dataset, Model(base_estimators[m['model_id']], m['model_id'],
+                                         EModels(m['model_id']).name, params)))
+    with timed(timings, 'preprocessing'):
+        x_train = pipes[0].fit_preprocessing(preprocessing_cache)
+        x_test = pipes[0].preprocessing.transform(dataset.x_test)
+    for pipe in pipes[1:]:
+        pipe.preprocessing, pipe.cache_key = pipes[0].preprocessing, pipes[0].cache_key
+    with timed(timings, 'fit'), metrics.span('fit_batch', fan_out=True) as span:
+        results = Parallel(n_jobs=n_jobs, prefer='threads')(
+            delayed(fit_estimator)(pipe, x_train, x_test, models_path, slim_artifact) for pipe in pipes)
+        span.rows = x_train.shape[0] * len(pipes)
+    if catalog is not None:
+        for result in results:
+            record_model(catalog, os.path.join(models_path or os.getcwd() + '/res/estimated_models', result['file']),
+                         result['model'], result['params'], dataset.fingerprint,
+                         {k: result[k] for k in ('r2', 'mae', 'rmse')}, slim_artifact)
+    return results
+
+
+def load_split(storage_path: str, split: tuple) -> Dataset:
+    train_file, test_file = (os.path.join(storage_path, os.path.basename(f)) for f in split)
+    return Dataset.from_split(train_file, test_file, 'data', 'edu_index')
+
+
+def configure_cache(cfg: dict):
+    preprocessing_cache.configure(cfg['PREPROCESSING_CACHE_SIZE'], cfg['PREPROCESSING_CACHE_BYTES'],
+                                  cfg['PREPROCESSING_CACHE_PATH'] or os.getcwd() + '/res/preprocessing_cache',
+                                  cfg['PREPROCESSING_CACHE_DISK_BYTES'])
+    prediction_cache.configure(cfg['PREDICTION_CACHE_SIZE'], cfg['PREDICTION_CACHE_BYTES'],
+                               cfg['PREDICTION_CACHE_TTL'])
+
+
+def share_metrics(cfg: dict, interval: Optional[float] = None, clear: bool = False):
+    metrics.share(cfg['METRICS_PATH'] or os.getcwd() + '/res/metrics', interval, clear)
+
+
+def train_job(cfg: dict, kwargs: dict, timings: dict) -> dict:
+    configure_cache(cfg)
+    if kwargs.get('streaming'):
+        path, scores = fit_stream(lambda: (to_data_frame(v) for v in iter_data(cfg)), kwargs['model_id'],
+                                  kwargs['model_params'], 'edu_index', kwargs.get('models_path'), cfg['SEED'],
+                                  timings=timings, catalog=model_catalog(cfg))
+        return {'model': os.path.basename(path), 'metrics': scores}
+    if kwargs.get('split'):
+        with timed(timings, 'load_split'):
+            dataset = load_split(kwargs['storage_path'], kwargs['split'])
+    else:
+        with timed(timings, 'get_data'):
+            data = get_data(cfg)
+        with timed(timings, 'split'):
+            dataset = Dataset(data, 'data', 'edu_index', kwargs['storage_path'], storage_format=cfg['SPLIT_FORMAT'],
+                              seed=cfg['SEED'])
+    if kwargs.get('n_alphas'):
+        path = fit_path(dataset, kwargs['model_id'], kwargs['n_alphas'], cfg['PATH_EPS'], kwargs.get('models_path'),
+                        kwargs.get('slim_artifact', False), timings, model_catalog(cfg), cfg['PATH_FOLDS'], cfg['SEED'])
+    else:
+        path = fit(dataset, kwargs['model_id'], kwargs['model_params'], kwargs.get('models_path'),
+                   kwargs.get('slim_artifact', False), timings, model_catalog(cfg))
+    return {'model': os.path.basename(path)}
+
+
+def batch_job(cfg: dict, kwargs: dict, timings: dict) -> dict:
+    configure_cache(cfg)
+    with timed(timings, 'get_data'):
+        data = get_data(cfg)
+    with timed(timings, 'split'):
+        dataset = Dataset(data, 'data', 'edu_index', kwargs['storage_path'], storage_format=cfg['SPLIT_FORMAT'],
+                          seed=cfg['SEED'])
+    models = fit_batch(dataset, kwargs['models'], kwargs.get('models_path'), kwargs.get('slim_artifact', False),
+                       cfg['TRAINING_BATCH_JOBS'], timings, model_catalog(cfg))
+    return {'models': models}
+
+
+def to_batch(payload: Any) -> List[dict]:
+    models = EModels.name_values_dict()
+    if payload is None:
+        return [{'model_id': v, 'model_params': None} for v in models.values()]
+    if not isinstance(payload, dict) or not isinstance(payload.get('models'), list) or not payload['models']:
+        raise PayloadError('Payload must be a JSON object with a non-empty "models" list.')
+    batch = []
+    for item in payload['models']:
+        if not isinstance(item, dict) or item.get('model') not in models:
+            raise PayloadError(f'Each item must be {{"model": one of {sorted(models)}, "params": {{...}}}}.')
+        if not isinstance(item.get('params') or {}, dict):
+            raise PayloadError('"params" must be a JSON object.')
+        batch.append({'model_id': models[item['model']], 'model_params': item.get('params')})
+    return batch
+
+
+def search_job(cfg: dict, kwargs: dict, timings: dict) -> dict:
+    with timed(timings, 'get_data'):
+        data = get_data(cfg)
+    with timed(timings, 'split'):
+        dataset = Dataset(data, 'data', 'edu_index', kwargs['storage_path'], storage_format=cfg['SPLIT_FORMAT'],
+                          seed=cfg['SEED'])
+    with timed(timings, 'folds'):
+        folds = make_folds(dataset, kwargs['folds'], cfg['SEED'])
+    models = []
+    for model, space in kwargs['spaces'].items():
+        with timed(timings, model):
+            params = candidates(space, kwargs['n_iter'], cfg['SEED'])
+            result = search(base_estimators[EModels.get_value_by_name(model)], params, folds, cfg['SEARCH_ETA'],
+                            cfg['SEARCH_JOBS'])
+        result['file'] = write_params(kwargs['params_path'], model, result['best_params'])
+        models.append({'model': model, **result})
+    return {'models': models}
+
+
+def to_search(payload: Any) -> dict:
+    models = EModels.name_values_dict()
+    if payload is None:
+        return dict(DEFAULT_SPACES)
+    if not isinstance(payload, dict) or not isinstance(payload.get('models'), dict) or not payload['models']:
+        raise PayloadError('Payload must be a JSON object with a non-empty "models" object.')
+    spaces = {}
+    for model, space in payload['models'].items():
+        if model not in models:
+            raise PayloadError(f'Unknown model {model}. Use one of {sorted(models)}.')
+        space = DEFAULT_SPACES[model] if space is None else space
+        if not isinstance(space, dict) or not space:
+            raise PayloadError(f'Space for {model} must be a non-empty object.')
+        unknown = set(space) - set(base_estimators[models[model]]().get_params())
+        if unknown:
+            raise PayloadError(f'Unknown parameters for {model}: {sorted(unknown)}')
+        for name, value in space.items():
+            if isinstance(value, list) and value:
+                continue
+            if isinstance(value, dict) and len(value) == 1 and next(iter(value)) in DISTRIBUTIONS and \
+                    isinstance(next(iter(value.values())), list) and len(next(iter(value.values()))) == 2:
+                continue
+            raise PayloadError(f'{model}.{name} must be a list of values or {{"{"|".join(DISTRIBUTIONS)}": '
+                               f'[low, high]}}.')
+        spaces[model] = space
+    return spaces
+
+
+def predict(model_path: str, prediction_path: str, storage_format: str = 'parquet') -> str:
+    pipe = registry.get(model_path)
+    dataset = getattr(pipe, 'dataset', None)
+    key = prediction_cache.key(model_path, 'predict', None if dataset is None else dataset.fingerprint,
+                               os.path.abspath(prediction_path), storage_format)
+    path = prediction_cache.get(key, os.path.exists)
+    if path is None:
+        path = pipe.predict(prediction_path, storage_format, preprocessing_cache)
+        prediction_cache.put(key, path, sys.getsizeof(path))
+    return path
+
+
+def predict_chunk(model: Any, part: int, chunk: pd.DataFrame, path: str) -> int:
+    prediction = pd.DataFrame({'prediction': model.score(chunk)})
+    if 'id' in chunk.columns:
+        prediction.insert(0, 'id', chunk['id'].to_numpy())
+    prediction.to_parquet(os.path.join(path, f'part-{part:05d}.parquet'), index=False)
+    return prediction.shape[0]
+
+
+def predict_batch(model_path: str, chunks: Iterator[pd.DataFrame], prediction_path: Optional[str] = None,
+                  n_jobs: int = 4) -> dict:
+    model = registry.get(model_path)
+    if not prediction_path:
+        prediction_path = os.getcwd() + '/res/prediction'
+    run_id = uuid.uuid4().hex
+    path = os.path.join(prediction_path, f'run_id={run_id}')
+    os.makedirs(path)
+    rows, parts = 0, 0
+    with metrics.span('predict_batch', fan_out=True) as span, ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(predict_chunk, model, parts, chunk, path))
+            parts += 1
+            if len(pending) >= 2 * n_jobs:
+                rows += pending.popleft().result()
+        while pending:
+            rows += pending.popleft().result()
+        span.rows = rows
+    seconds = span.wall
+    run = {
+        'run_id': run_id,
+        'model': os.path.basename(model_path),
+        'rows': rows,
+        'parts': parts,
+        'seconds': round(seconds, 3),
+        'rows_per_sec': round(rows / seconds, 1) if seconds else None,
+        'path': path
+    }
+    with open(os.path.join(path, '_run.json'), 'w') as f:
+        json.dump(run, f, indent=4)
+    return run
+
+
+def predict_job(cfg: dict, kwargs: dict, timings: dict) -> dict:
+    chunk_size = cfg['PREDICTION_CHUNK_SIZE']
+    if kwargs.get('source'):
+        chunks = iter_frame(kwargs['source'], chunk_size)
+    else:
+        chunks = (to_data_frame(v) for v in iter_data(cfg, chunk_size))
+    with timed(timings, 'predict'):
+        return predict_batch(kwargs['model_path'], chunks, kwargs['prediction_path'], cfg['PREDICTION_WORKERS'])
+
+
+def to_frame(payload: dict, features: List[str]) -> pd.DataFrame:
+    if not isinstance(payload, dict):
+        raise PayloadError('Payload must be a JSON object with "rows" or "columns".')
+    if 'rows' in payload and isinstance(payload['rows'], list) and \
+            all(isinstance(row, dict) for row in payload['rows']):
+        x = pd.DataFrame.from_records(payload['rows'])
+    elif 'columns' in payload and isinstance(payload['columns'], dict):
+        try:
+            x = pd.DataFrame(payload['columns'])
+        except ValueError as e:
+            raise PayloadError(str(e))
+    else:
+        raise PayloadError('Payload must contain "rows" (list of objects) or "columns" (object of lists).')
+    unknown = set(x.columns) - set(features)
+    if unknown:
+        raise PayloadError(f'Unknown features: {sorted(unknown)}')
+    if x.empty:
+        raise PayloadError('Payload contains no rows.')
+    return x
+
+
+def score(model_path: str, payload: dict, alpha: Optional[float] = None) -> List[float]:
+    key = prediction_cache.key(model_path, 'score', payload, alpha)
+    predictions = prediction_cache.get(key)
+    if predictions is None:
+        pipe = registry.get(model_path)
+        x = to_frame(payload, pipe.features)
+        try:
+            predictions = pipe.score(x, alpha).tolist()
+        except (TypeError, ValueError) as e:
+            raise PayloadError(str(e))
+        prediction_cache.put(key, predictions, sys.getsizeof(predictions) + 24 * len(predictions))
+    return list(predictions)
+
+
+def warm_models(cfg: Settings):
+    registry.configure(cfg['MODEL_REGISTRY_SIZE'], cfg['MODEL_REGISTRY_BYTES'])
+    registry.warm(cfg.estimated_models_path, cfg['MODEL_REGISTRY_WARM'])
+
+
+def apply_settings(cfg: Settings):
+    registry.configure(cfg['MODEL_REGISTRY_SIZE'], cfg['MODEL_REGISTRY_BYTES'])
+    configure_cache(cfg)
+
+
+DATA_COLUMNS: List[str] = list(DataSheetIndexes.name_values_dict().keys())
+
+
+def iter_data(cfg: dict, chunk_size: Optional[int] = None) -> Iterator[np.ndarray]:
+    chunk_size = chunk_size if chunk_size else cfg['FETCH_CHUNK_SIZE']
+    statement = select(*[Data.__table__.c[name] for name in DATA_COLUMNS]).order_by(Data.__table__.c.id)
     with DatabaseSession(cfg['SQLALCHEMY_DATABASE']) as session:
-        qr = session.query(
-            Data.id,
-            Data.edu_index,
-            Data.science_index,
-            Data.inter_index,
-            Data.fin_index,
-            Data.wage,
-            Data.add,
-            Data.exam_1,
-            Data.exam_2,
-            Data.exam_3,
-            Data.avg_exam_1,
-            Data.stud_num_1,
-            Data.stud_num_2,
-            Data.stud_num_3,
-            Data.w_1,
-            Data.w_2,
-            Data.w_3,
-            Data.w_4,
-            Data.w_5,
-            Data.asp_num,
-            Data.w_6,
-            Data.w_7,
-            Data.citation_1,
-            Data.citation_2,
-            Data.citation_3,
-            Data.pub_num_1,
-            Data.pub_num_2,
-            Data.pub_num_3,
-            Data.research_num,
-            Data.w_8,
-            Data.w_9,
-            Data.research_incom,
-            Data.license_num,
-            Data.w_10,
-            Data.w_11,
-            Data.w_12,
-            Data.journal_num,
-            Data.grants_num,
-            Data.w_13,
-            Data.w_14,
-            Data.w_15,
-            Data.w_16,
-            Data.w_17,
-            Data.w_18,
-            Data.stud_num_4,
-            Data.w_19,
-            Data.prof_num,
-            Data.w_20,
-            Data.w_21,
-            Data.money_1,
-            Data.money_2,
-            Data.income_per_npr,
-            Data.w_22,
-            Data.avg_wage_1,
-            Data.total_income,
-            Data.total_square_1,
-            Data.square_1,
-            Data.square_2,
-            Data.square_3,
-            Data.square_4,
-            Data.computer_number,
-            Data.w_23,
-            Data.books,
-            Data.w_24,
-            Data.w_25,
-            Data.w_26,
-            Data.npr_num,
-            Data.w_27,
-            Data.total_stud_num_1,
-            Data.stud_num_5,
-            Data.stud_num_6,
-            Data.stud_num_7,
-            Data.avg_exam_2,
-            Data.w_28,
-            Data.w_29,
-            Data.w_30,
-            Data.stud_num_8,
-            Data.stud_num_9,
-            Data.company_num_1,
-            Data.company_num_2,
-            Data.money_3,
-            Data.money_4,
-            Data.total_pub_num,
-            Data.bi_num,
-            Data.tp_num,
-            Data.ccus_num,
-            Data.sb_num,
-            Data.total_asp_num,
-            Data.w_31,
-            Data.total_doc_num,
-            Data.diss_sov_num,
-            Data.total_work_num,
-            Data.total_pps_num,
-            Data.total_sci_num,
-            Data.w_32,
-            Data.w_33,
-            Data.w_34,
-            Data.w_35,
-            Data.avg_wage_2,
-            Data.avg_wage_3,
-            Data.for_stud_num,
-            Data.w_36,
-            Data.total_prog_num,
-            Data.total_stud_num_2,
-            Data.total_for_asp_num,
-            Data.citation_4,
-            Data.for_income_1,
-            Data.for_income_2,
-            Data.results_num,
-            Data.total_square_2,
-            Data.lab_square,
-            Data.research_square,
-            Data.living_square,
-            Data.sport_square,
-            Data.w_37,
-            Data.comp_num,
-            Data.w_38,
-            Data.library,
-            Data.income,
-            Data.non_budget_income,
-            Data.w_39,
-            Data.w_40,
-            Data.w_41,
-            Data.w_42,
-            Data.w_43,
-            Data.w_44,
-            Data.w_45
-        ).all()
-    return pd.DataFrame([[result[i] for i in range(len(qr[0]))] for result in qr],
-                        columns=list(DataSheetIndexes.name_values_dict().keys()))
+        connection = session.connection()
+        if connection.dialect.name == 'postgresql':
+            cursor = connection.connection.cursor(name='get_data')
+        else:
+            cursor = connection.connection.cursor()
+        try:
+            cursor.execute(str(statement.compile(dialect=connection.dialect)))
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield np.array(rows, dtype=np.float64)
+        finally:
+            cursor.close()
+
+
+def to_data_frame(values: np.ndarray) -> pd.DataFrame:
+    data = pd.DataFrame(values, columns=DATA_COLUMNS, copy=False)
+    data['id'] = data['id'].astype(np.int64)
+    return data
+
+
+@metrics.traced('get_data', rows=len)
+def get_data(cfg: dict, chunk_size: Optional[int] = None) -> pd.DataFrame:
+    chunks = list(iter_data(cfg, chunk_size))
+    values = np.concatenate(chunks) if chunks else np.empty((0, len(DATA_COLUMNS)))
+    return to_data_frame(values)
 
 
 def run_calc(cfg: dict, mode: int = 1, **kwargs):
     assert EModes.has_value(mode), 'CAN NOT UNDERSTAND YOUR QUERY!'
     kwargs = kwargs['kwargs']
     if mode == 1:
-        data = get_data(cfg)
-        train(data, kwargs['storage_path'], kwargs['model_id'], kwargs['model_params'])
+        return train_job(cfg, kwargs, {})['model']
     elif mode == 2:
-        predict(kwargs['model_path'], kwargs['prediction_path'])
+        return predict(kwargs['model_path'], kwargs['prediction_path'], cfg['PREDICTIONS_FORMAT'])
+    elif mode == 4:
+        return score(kwargs['model_path'], kwargs['payload'], kwargs.get('alpha'))
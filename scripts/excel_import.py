@@ -1,8 +1,8 @@
 import logging
-import os
 import sys
 
 from dbs.database import DatabaseInitializer
+from domain.config import Settings
 
 
 def init_logger() -> logging.Logger:
@@ -14,11 +14,8 @@ def init_logger() -> logging.Logger:
     return logging.getLogger('DatabaseInitializerLogger')
 
 
-def import_data(cfg: dict):
+def import_data(cfg: Settings):
     if cfg['UPDATE_DATA']:
         database = cfg['SQLALCHEMY_DATABASE']
-        if cfg['DATA_PATH']:
-            file = cfg['DATA_PATH']
-        else:
-            file = os.getcwd() + '/data/dataset/data.xlsx'
-        DatabaseInitializer(database, file, init_logger()).init_db()
+        DatabaseInitializer(database, cfg.data_path, init_logger(), cfg['IMPORT_CHUNK_SIZE'],
+                            cfg['INCREMENTAL_IMPORT']).init_db()
@@ -0,0 +1,261 @@
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import uuid
+
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from datetime import datetime
+from multiprocessing.managers import BaseManager
+from threading import RLock, Thread
+from time import monotonic, sleep
+from typing import Any, Callable, List, Optional
+
+from dbs.database import engines
+from domain.config import Settings
+from domain.errors import QueueFullError
+from domain.metrics import metrics
+from scripts.calc import configure_cache, share_metrics
+
+
+@dataclass
+class Job:
+    job_id: str
+    f: Callable
+    cfg: dict
+    kwargs: dict
+    submitted: datetime = field(default_factory=datetime.now)
+    future: Future = field(default_factory=Future)
+
+    @property
+    def status(self) -> str:
+        if self.future.cancelled():
+            return 'cancelled'
+        if self.future.done():
+            return 'failed' if self.future.exception() is not None else 'completed'
+        if self.future.running():
+            return 'running'
+        return 'queued'
+
+    def describe(self) -> dict:
+        description = {
+            'job_id': self.job_id,
+            'status': self.status,
+            'submitted': self.submitted.isoformat(timespec='seconds'),
+            'model_id': self.kwargs.get('model_id')
+        }
+        if description['status'] == 'completed':
+            description.update(self.future.result())
+        elif description['status'] == 'failed':
+            description['error'] = repr(self.future.exception())
+        return description
+
+
+def run_job(f: Callable, cfg: dict, kwargs: dict) -> tuple:
+    metrics.drain()
+    started, timings = datetime.now(), {}
+    result = f(cfg, kwargs, timings)
+    return {
+        'started': started.isoformat(timespec='seconds'),
+        'finished': datetime.now().isoformat(timespec='seconds'),
+        'timings': timings,
+        **result
+    }, metrics.drain()
+
+
+class JobManager:
+    cancellation: bool
+    executor: Optional[ProcessPoolExecutor] = None
+    history: int
+    jobs: OrderedDict
+    lock: RLock
+    pending: deque
+    queue_size: Optional[int]
+    running: int = 0
+    workers: int
+
+    def __init__(self, workers: int = 2, queue_size: Optional[int] = 16, cancellation: bool = True,
+                 history: int = 100):
+        self.jobs = OrderedDict()
+        self.pending = deque()
+        self.lock = RLock()
+        self.configure(workers, queue_size, cancellation, history)
+
+    def configure(self, workers: int, queue_size: Optional[int], cancellation: bool, history: int):
+        with self.lock:
+            self.workers = workers
+            self.queue_size = queue_size
+            self.cancellation = cancellation
+            self.history = history
+            if self.executor is not None:
+                self.executor.shutdown(wait=False)
+                self.executor = None
+
+    def submit(self, f: Callable, cfg: dict, kwargs: dict) -> Job:
+        with self.lock:
+            self.pending = deque(job for job in self.pending if not job.future.cancelled())
+            if self.queue_size and len(self.pending) >= self.queue_size:
+                raise QueueFullError('Too many training jobs. Try again later.')
+            job = Job(uuid.uuid4().hex, f, cfg, kwargs)
+            self.jobs[job.job_id] = job
+            self.pending.append(job)
+            while len(self.jobs) > self.history and next(iter(self.jobs.values())).future.done():
+                self.jobs.popitem(last=False)
+            self.dispatch()
+            return job
+
+    def dispatch(self):
+        with self.lock:
+            while self.pending and self.running < self.workers:
+                job = self.pending.popleft()
+                if not job.future.set_running_or_notify_cancel():
+                    continue
+                if self.executor is None:
+                    self.executor = ProcessPoolExecutor(max_workers=self.workers)
+                executor = self.executor
+                try:
+                    future = executor.submit(run_job, job.f, job.cfg, job.kwargs)
+                except (BrokenProcessPool, RuntimeError) as e:
+                    job.future.set_exception(e)
+                    self.reset(executor)
+                    continue
+                self.running += 1
+                future.add_done_callback(lambda future, job=job, executor=executor: self.finish(job, executor, future))
+
+    def reset(self, executor: ProcessPoolExecutor):
+        with self.lock:
+            if self.executor is executor:
+                self.executor = None
+        executor.shutdown(wait=False)
+
+    def finish(self, job: Job, executor: ProcessPoolExecutor, future: Future):
+        if future.exception() is not None:
+            job.future.set_exception(future.exception())
+            if isinstance(future.exception(), BrokenProcessPool):
+                self.reset(executor)
+        else:
+            result, snapshot = future.result()
+            metrics.merge(snapshot)
+            job.future.set_result(result)
+        with self.lock:
+            self.running -= 1
+            self.dispatch()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def enqueue(self, f: Callable, cfg: dict, kwargs: dict) -> dict:
+        return self.submit(f, cfg, kwargs).describe()
+
+    def describe(self, job_id: str) -> Optional[dict]:
+        job = self.jobs.get(job_id)
+        return job.describe() if job is not None else None
+
+    def list(self) -> List[dict]:
+        return [job.describe() for job in list(self.jobs.values())]
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.jobs.get(job_id)
+        if job is None or not self.cancellation:
+            return False
+        return job.future.cancel()
+
+    def shutdown(self):
+        with self.lock:
+            for job in self.pending:
+                job.future.cancel()
+            self.pending.clear()
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+jobs = JobManager()
+
+
+class JobServer(BaseManager):
+    pass
+
+
+def served_jobs() -> JobManager:
+    return jobs
+
+
+JobServer.register('jobs', served_jobs, exposed=('enqueue', 'describe', 'list', 'cancel', 'shutdown'))
+
+SERVER_KEY_ENV_VAR: str = 'ML_OPS_JOB_SERVER_KEY'
+SERVER_SCRIPT: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'job_server.py')
+
+address: Optional[str] = None
+authkey: Optional[bytes] = None
+client: Optional[Any] = None
+server: Optional[subprocess.Popen] = None
+
+
+def watch_parent(parent: int, interval: float = 1.0):
+    while os.getppid() == parent:
+        sleep(interval)
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def serve(cfg: Settings, path: str, key: bytes):
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    Thread(target=watch_parent, args=(os.getppid(),), name='ParentWatcher', daemon=True).start()
+    engines.configure(cfg['DB_POOL_SIZE'], cfg['DB_MAX_OVERFLOW'], cfg['DB_POOL_TIMEOUT'], cfg['DB_POOL_RECYCLE'],
+                      cfg['DB_POOL_PRE_PING'])
+    configure_cache(cfg)
+    share_metrics(cfg, cfg['METRICS_FLUSH_INTERVAL'])
+    jobs.configure(cfg['TRAINING_WORKERS'], cfg['TRAINING_QUEUE_SIZE'], cfg['TRAINING_CANCELLATION'],
+                   cfg['TRAINING_HISTORY'])
+    try:
+        JobServer(path, key).get_server().serve_forever()
+    finally:
+        jobs.shutdown()
+        metrics.close()
+
+
+def start_server(timeout: float = 60) -> str:
+    global address, authkey, server
+    address, authkey = os.path.join(tempfile.mkdtemp(), 'jobs.sock'), os.urandom(32)
+    server = subprocess.Popen([sys.executable, SERVER_SCRIPT, address], start_new_session=True,
+                              env=dict(os.environ, **{SERVER_KEY_ENV_VAR: authkey.hex()}))
+    deadline = monotonic() + timeout
+    while not os.path.exists(address):
+        if server.poll() is not None or monotonic() > deadline:
+            stop_server()
+            raise RuntimeError('Job server did not start.')
+        sleep(0.05)
+    return address
+
+
+def connect_server():
+    global client
+    if address is None:
+        return
+    manager = JobServer(address, authkey)
+    manager.connect()
+    client = manager.jobs()
+
+
+def stop_server():
+    global address, authkey, client, server
+    if server is not None and server.poll() is None:
+        try:
+            manager = JobServer(address, authkey)
+            manager.connect()
+            manager.jobs().shutdown()
+        finally:
+            server.terminate()
+            server.wait()
+    if address is not None:
+        shutil.rmtree(os.path.dirname(address), ignore_errors=True)
+    address, authkey, client, server = None, None, None, None
+
+
+def job_manager() -> Any:
+    return client if client is not None else jobs
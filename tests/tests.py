@@ -1,12 +1,53 @@
+import joblib
+import numpy as np
 import json
+import logging
+import multiprocessing
+import os
 import pandas as pd
+import pickle
 import pytest
+import shutil
+import tempfile
+import threading
+import time
 import unittest
+import unittest.mock
 
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from openpyxl import Workbook
+from sklearn.compose import ColumnTransformer
+from sklearn.linear_model import Lasso, Ridge
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+from sqlalchemy import create_engine
 from werkzeug.exceptions import NotFound
 
-from app import AvailableModels
-from domain.enums import DataSheetIndexes
+from app import AvailableModels, app
+from benchmarks.synthetic import make_data, make_sink
+from data.parser import parser
+from data.parser.parser import get_university_data, run_parser
+from data.parser.sink import ParquetSink, partitions
+from dbs.catalog import ModelCatalog
+from dbs.database import SQLITE_MAX_VARIABLES, DatabaseInitializer, DatabaseSession, engines
+from dbs.entities import Data, DataHash, Info, db
+from domain.config import CONFIG_ENV_VAR, SettingsStore, check_types, load_config
+from domain.enums import DataSheetIndexes, EModels
+from domain.errors import ConfigError, PayloadError
+from domain.logger import logged
+from domain.metrics import RETIRED, Metrics, metrics
+from model.artifact import load_artifact
+from model.base import Dataset, Model, Pipe, Preprocessing, base_estimators
+from model.cache import PredictionCache, PreprocessingCache, prediction_cache, preprocessing_cache
+from model.parameters import read_params, write_params
+from model.path import cross_validate, fit_lasso_path, fit_ridge_path
+from model.registry import ModelRegistry
+from model.search import candidates, make_folds, search
+from model.storage import EXTENSIONS, iter_frame, load_frame, save_frame
+from model.streaming import is_test
+from scripts.calc import configure_cache, fit, fit_batch, fit_path, fit_stream, get_data, predict, predict_batch, score, to_batch, \
+    to_frame, to_search, train
+from scripts.jobs import JobManager, connect_server, job_manager, jobs, run_job, start_server, stop_server
 
 
 class TestGetModelsRest(unittest.TestCase):
@@ -18,9 +59,894 @@ class TestGetModelsRest(unittest.TestCase):
                              {'LASSO_REGRESSION': 1, 'LINEAR_REGRESSION': 2, 'RIDGE_REGRESSION': 3})
 
 
-@pytest.fixture()
-def get_fixture_data(scope="module"):
-    df = pd.read_excel('/Users/meirroketlisvili/PycharmProjects/FTAD_MLOps/data/dataset/data.xlsx', sheet_name='data')
+class TestModelRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.paths = []
+        for i in range(3):
+            path = os.path.join(self.dir.name, f'{i}_model.pkl')
+            joblib.dump({'model': i}, path)
+            os.utime(path, ns=(i * 10 ** 9, i * 10 ** 9))
+            self.paths.append(path)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_lru_eviction(self):
+        registry = ModelRegistry(max_models=2)
+        registry.get(self.paths[0])
+        registry.get(self.paths[1])
+        registry.get(self.paths[0])
+        registry.get(self.paths[2])
+
+        self.assertListEqual(list(registry.entries), [self.paths[0], self.paths[2]])
+        self.assertEqual(registry.hits, 1)
+
+    def test_reload_on_mtime_change(self):
+        registry = ModelRegistry()
+        registry.get(self.paths[0])
+        joblib.dump({'model': 'new'}, self.paths[0])
+
+        self.assertDictEqual(registry.get(self.paths[0]), {'model': 'new'})
+        self.assertEqual(registry.misses, 2)
+
+    def test_warm_and_drop(self):
+        registry = ModelRegistry()
+        registry.warm(self.dir.name, 2)
+
+        self.assertListEqual(list(registry.entries), [self.paths[1], self.paths[2]])
+
+        registry.drop(self.paths[2])
+        self.assertListEqual(list(registry.entries), [self.paths[1]])
+        self.assertEqual(registry.size, os.path.getsize(self.paths[1]))
+
+
+class TestScoresPayload(unittest.TestCase):
+    features = ['id', 'wage', 'add']
+
+    def test_rows_and_columns(self):
+        rows = to_frame({'rows': [{'wage': 1.0}, {'wage': 2.0, 'add': 3.0}]}, self.features)
+        columns = to_frame({'columns': {'wage': [1.0, 2.0], 'add': [None, 3.0]}}, self.features)
+
+        pd.testing.assert_frame_equal(rows, columns)
+
+    def test_invalid(self):
+        for payload in (None, {}, {'rows': [1, 2]}, {'rows': []}, {'columns': {'edu_index': [1.0]}}):
+            with self.assertRaises(PayloadError):
+                to_frame(payload, self.features)
+
+
+def training_data(add: bool = False) -> pd.DataFrame:
+    data = pd.DataFrame({
+        'id': range(1, 41),
+        'edu_index': [float(i % 7) for i in range(40)],
+        'wage': [float(i) if i % 3 else None for i in range(40)],
+    })
+    return data.assign(add=[None if i % 4 else float(i) for i in range(40)]) if add else data
+
+
+class TestSlimArtifact(unittest.TestCase):
+
+    def test_matches_pipe(self):
+        data = training_data(add=True)
+        with tempfile.TemporaryDirectory() as storage, tempfile.TemporaryDirectory() as models:
+            path = train(data, storage, 3, None, models, slim_artifact=True)
+            pipe = joblib.load(path)
+            predictor = load_artifact(path[:-len('.pkl')] + '.json')
+            x = data.drop(columns='edu_index')
+
+            self.assertListEqual(predictor.features, pipe.features)
+            self.assertTrue((abs(pipe.score(x) - predictor.score(x)) < 1e-9).all())
+
+
+def preprocessing_job(cfg, kwargs, timings):
+    configure_cache(cfg)
+    dataset = Dataset(kwargs['data'], 'data', 'edu_index', kwargs['storage'], seed=36)
+    Pipe(dataset, Model(base_estimators[2], 2, EModels(2).name, None)).fit_preprocessing(preprocessing_cache)
+    return preprocessing_cache.stats()
+
+
+class TestPreprocessingCache(unittest.TestCase):
+
+    def setUp(self):
+        self.data = training_data(add=True)
+
+    def test_shared_across_models(self):
+        cache = PreprocessingCache()
+        with tempfile.TemporaryDirectory() as storage, tempfile.TemporaryDirectory() as models:
+            dataset = Dataset(self.data, 'data', 'edu_index', storage, seed=36)
+            pipes = [Pipe(dataset, Model(base_estimators[i], i, EModels(i).name, None)) for i in (1, 2, 3)]
+            for pipe in pipes:
+                pipe.fit(path=models, cache=cache)
+            uncached = Pipe(Dataset(self.data, 'data', 'edu_index', storage, seed=36), pipes[2].model)
+            uncached.fit(path=models)
+
+            self.assertDictEqual(cache.stats(), {'entries': 1, 'size': cache.size, 'hits': 2, 'misses': 1})
+            self.assertEqual(uncached.cache_key, pipes[2].cache_key)
+            self.assertTrue((abs(uncached.score(self.data) - pipes[2].score(self.data)) < 1e-9).all())
+
+    def test_disk_store(self):
+        with tempfile.TemporaryDirectory() as storage, tempfile.TemporaryDirectory() as directory:
+            dataset = Dataset(self.data, 'data', 'edu_index', storage, seed=36)
+            first = Pipe(dataset, Model(base_estimators[2], 2, EModels(2).name, None))
+            first.fit_preprocessing(PreprocessingCache(directory=directory))
+            cache = PreprocessingCache(directory=directory)
+            second = Pipe(Dataset(self.data, 'data', 'edu_index', storage, seed=36), first.model)
+            second.fit_preprocessing(cache)
+
+            self.assertEqual(cache.hits, 1)
+            self.assertEqual(second.preprocessing.fill_values, first.preprocessing.fill_values)
+
+    def test_shared_across_processes(self):
+        with tempfile.TemporaryDirectory() as storage, tempfile.TemporaryDirectory() as directory:
+            cfg = dict(load_config(), PREPROCESSING_CACHE_PATH=directory)
+            start, stats = preprocessing_cache.stats(), []
+            for _ in range(2):
+                with ProcessPoolExecutor(1) as pool:
+                    stats.append(pool.submit(run_job, preprocessing_job, cfg,
+                                             {'data': self.data, 'storage': storage}).result()[0])
+
+        self.assertListEqual([(s['hits'] - start['hits'], s['misses'] - start['misses']) for s in stats],
+                             [(0, 1), (1, 0)])
+
+    def test_default_directory(self):
+        with tempfile.TemporaryDirectory() as cwd, unittest.mock.patch('os.getcwd', return_value=cwd):
+            configure_cache(dict(load_config(), PREPROCESSING_CACHE_PATH=None))
+            directory = preprocessing_cache.directory
+
+            self.assertEqual(directory, cwd + '/res/preprocessing_cache')
+            self.assertTrue(os.path.isdir(directory))
+            configure_cache(dict(load_config(), PREPROCESSING_CACHE_DISK_BYTES=0))
+            self.assertIsNone(preprocessing_cache.directory)
+
+
+class TestPredictionCache(unittest.TestCase):
+
+    def test_eviction(self):
+        cache = PredictionCache(max_entries=2, max_bytes=100, ttl=10)
+        with unittest.mock.patch('model.cache.monotonic', return_value=0):
+            cache.put('a', [1.0], 10)
+            cache.put('b', [2.0], 10)
+            cache.get('a')
+            cache.put('c', [3.0], 10)
+            cache.put('d', [4.0], 200)
+        with unittest.mock.patch('model.cache.monotonic', return_value=20):
+            expired = cache.get('a')
+
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNone(cache.get('d'))
+        self.assertIsNone(expired)
+        self.assertDictEqual(cache.stats(), {'entries': 1, 'size': 10, 'hits': 1, 'misses': 3, 'expired': 1})
+
+    def test_digests_bounded(self):
+        cache = PredictionCache()
+        cache.digests.resize(2, None)
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [os.path.join(directory, f'{i}_model.pkl') for i in range(3)]
+            for i, path in enumerate(paths):
+                joblib.dump({'model': i}, path)
+                cache.key(path, 'score')
+            self.assertListEqual(list(cache.digests.entries), paths[1:])
+
+            cache.forget(paths[2])
+            self.assertListEqual(list(cache.digests.entries), paths[1:2])
+
+    def test_predict_and_score(self):
+        data = training_data()
+        prediction_cache.clear()
+        with tempfile.TemporaryDirectory() as storage, tempfile.TemporaryDirectory() as models:
+            path = train(data, storage, 3, None, models)
+            first, second = predict(path, storage), predict(path, storage)
+            payload = {'rows': [{'id': 1, 'wage': 2.0}, {'id': 2}]}
+            scores = score(path, payload), score(path, payload)
+            os.remove(first)
+            third = predict(path, storage)
+
+        self.assertEqual(first, second)
+        self.assertListEqual(scores[0], scores[1])
+        self.assertNotEqual(first, third)
+        self.assertEqual(prediction_cache.stats()['hits'], 2)
+
+
+class TestBatchTraining(unittest.TestCase):
+
+    def test_fit_batch(self):
+        data = training_data()
+        models = to_batch({'models': [{'model': 'LASSO_REGRESSION', 'params': {'alpha': 0.5, 'max_depth': 30}},
+                                      {'model': 'LINEAR_REGRESSION'},
+                                      {'model': 'LASSO_REGRESSION', 'params': {'alpha': 0.01}}]})
+        with tempfile.TemporaryDirectory() as storage, tempfile.TemporaryDirectory() as models_path:
+            dataset = Dataset(data, 'data', 'edu_index', storage, seed=36)
+            results = fit_batch(dataset, models, models_path, n_jobs=2)
+
+            self.assertEqual(len(set(os.listdir(models_path))), 3)
+        self.assertListEqual([r['model'] for r in results],
+                             ['LASSO_REGRESSION', 'LINEAR_REGRESSION', 'LASSO_REGRESSION'])
+        self.assertListEqual([r['params'] for r in results], [{'alpha': 0.5}, {}, {'alpha': 0.01}])
+        self.assertTrue(all({'fit_time', 'r2', 'mae', 'rmse', 'file'} <= set(r) for r in results))
+
+    def test_payload(self):
+        self.assertEqual(len(to_batch(None)), len(EModels))
+        with self.assertRaises(PayloadError):
+            to_batch({'models': [{'model': 'FOREST'}]})
+
+
+class TestModelCatalog(unittest.TestCase):
+
+    def test_fit_records_models(self):
+        data = training_data()
+        with tempfile.TemporaryDirectory() as storage, tempfile.TemporaryDirectory() as models_path:
+            catalog = ModelCatalog('sqlite:///' + os.path.join(storage, 'catalog.sqlite'))
+            dataset = Dataset(data, 'data', 'edu_index', storage, seed=36)
+            first = fit(dataset, 3, {'alpha': 2.0}, models_path, slim_artifact=True, catalog=catalog)
+            second = fit(dataset, 3, {'alpha': 2.0}, models_path, catalog=catalog)
+            fit(dataset, 1, None, models_path, catalog=catalog)
+            latest = catalog.latest('RIDGE_REGRESSION')
+            listed = catalog.list()
+            joblib.dump('legacy', os.path.join(models_path, '2024.1.1_0-0-0_LASSO_REGRESSION_model.pkl'))
+            os.remove(first[:-len('.pkl')] + '.json')
+            added = catalog.sync(models_path)
+
+            self.assertEqual(first, second)
+            self.assertFalse(any(f.startswith('.') for f in os.listdir(models_path)))
+            self.assertIn(latest['file'], {os.path.basename(first), os.path.basename(first)[:-len('.pkl')] + '.json'})
+            self.assertEqual(latest['params'], {'alpha': 2.0})
+            self.assertEqual(latest['data_hash'], dataset.fingerprint)
+            self.assertSetEqual(set(latest['metrics']), {'r2', 'mae', 'rmse'})
+            self.assertEqual(len(listed), 3)
+            self.assertEqual(added, 1)
+            self.assertListEqual(sorted(m['artifact'] for m in catalog.list()), ['pickle', 'pickle', 'pickle'])
+            self.assertTrue(catalog.remove(os.path.basename(first)))
+            self.assertIsNone(catalog.get(os.path.basename(first)))
+
+
+class TestStreamingTraining(unittest.TestCase):
+
+    def test_fit_stream(self):
+        rng = np.random.default_rng(36)
+        data = pd.DataFrame(rng.normal(size=(500, 3)), columns=['wage', 'add', 'w_1'])
+        data['wage'] = data['wage'].mask(rng.random(500) < 0.2)
+        data['w_1'] = data['w_1'].mask(rng.random(500) < 0.7)
+        data['region'] = rng.choice(['a', 'b', 'c'], 500).astype(object)
+        data['id'] = np.arange(500, dtype=np.int64)
+        data['edu_index'] = data['add'] * 2 + data['wage'].fillna(0) + (data['region'] == 'b') + rng.normal(0, .1, 500)
+        train = data[~is_test(data['id'], 36)]
+        features = [c for c in data.columns if c != 'edu_index']
+        for model_id, params in ((1, {'alpha': 0.01}), (2, None), (3, {'alpha': 5.0})):
+            with tempfile.TemporaryDirectory() as models_path:
+                path, scores = fit_stream(lambda: (data[i:i + 64] for i in range(0, 500, 64)), model_id, params,
+                                          'edu_index', models_path, seed=36)
+                predictor = load_artifact(path)
+            preprocessing = Preprocessing(train[features])
+            estimator = base_estimators[model_id](**(params or {})).fit(
+                preprocessing.fit_transform(train[features]), train['edu_index'])
+
+            self.assertEqual(scores['train_rows'] + scores['test_rows'], 500)
+            self.assertListEqual(predictor.to_binarize, ['w_1'])
+            np.testing.assert_allclose(predictor.score(data[features]),
+                                       estimator.predict(preprocessing.transform(data[features])), atol=1e-3)
+
+
+class TestHyperparameterSearch(unittest.TestCase):
+
+    def test_candidates(self):
+        self.assertEqual(len(candidates({'alpha': [0.1, 1.0], 'fit_intercept': [True, False]}, 5)), 4)
+        sampled = candidates({'alpha': {'loguniform': [1e-3, 1e2]}, 'fit_intercept': [True]}, 6, seed=36)
+
+        self.assertListEqual(sampled, candidates({'alpha': {'loguniform': [1e-3, 1e2]}, 'fit_intercept': [True]}, 6,
+                                                 seed=36))
+        self.assertTrue(all(1e-3 <= c['alpha'] <= 1e2 for c in sampled))
+
+    def test_search(self):
+        rng = np.random.default_rng(36)
+        x = pd.DataFrame(rng.normal(size=(120, 3)), columns=['wage', 'add', 'w_1'])
+        data = x.assign(id=range(120), edu_index=x.wage * 3 + rng.normal(0, 0.1, 120))
+        with tempfile.TemporaryDirectory() as storage:
+            dataset = Dataset(data, 'data', 'edu_index', storage, seed=36)
+            result = search(base_estimators[1], [{'alpha': a} for a in (100.0, 10.0, 1.0, 0.01)],
+                            make_folds(dataset, 3, 36), eta=2, n_jobs=2)
+            path = write_params(storage, 'LASSO_REGRESSION', result['best_params'])
+
+            self.assertDictEqual(result['best_params'], {'alpha': 0.01})
+            self.assertEqual(result['pruned'], 3)
+            self.assertEqual(result['evaluations'], 4 + 2 + 1)
+            self.assertEqual(os.path.basename(path), 'LassoRegression_parameters.json')
+            self.assertDictEqual(read_params(storage, 'LASSO_REGRESSION'), {'alpha': 0.01})
+
+    def test_payload(self):
+        self.assertSetEqual(set(to_search(None)), set(EModels.name_values_dict()))
+        with self.assertRaises(PayloadError):
+            to_search({'models': {'LASSO_REGRESSION': {'max_depth': [30]}}})
+        with self.assertRaises(PayloadError):
+            to_search({'models': {'RIDGE_REGRESSION': {'alpha': {'normal': [0, 1]}}}})
+
+
+class TestRegularizationPath(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(36)
+        self.x = rng.normal(size=(80, 5))
+        self.y = self.x @ np.array([3.0, 0.0, -2.0, 0.5, 0.0]) + 4 + rng.normal(0, 0.3, 80)
+
+    def test_matches_refit(self):
+        lasso, ridge = fit_lasso_path(self.x, self.y, 30), fit_ridge_path(self.x, self.y, 30)
+        alpha = lasso.alphas[10]
+
+        self.assertTrue(np.allclose(lasso.predict(self.x, alpha),
+                                    Lasso(alpha=alpha).fit(self.x, self.y).predict(self.x), atol=1e-3))
+        self.assertTrue(np.allclose(ridge.predict(self.x, 7.3), Ridge(alpha=7.3).fit(self.x, self.y).predict(self.x)))
+        with self.assertRaises(ValueError):
+            lasso.predict(self.x, lasso.alphas[0] * 2)
+
+    def test_slim_artifact(self):
+        data = pd.DataFrame(self.x, columns=['wage', 'add', 'w_1', 'w_2', 'w_3']).assign(id=range(80), edu_index=self.y)
+        with tempfile.TemporaryDirectory() as storage, tempfile.TemporaryDirectory() as models:
+            dataset = Dataset(data, 'data', 'edu_index', storage, seed=36)
+            path = fit_path(dataset, 1, 20, 1e-3, models, slim_artifact=True)
+            pipe, predictor = joblib.load(path), load_artifact(path[:-len('.pkl')] + '.json')
+            alpha = float(pipe.estimator.alphas[5] * 0.9)
+
+            self.assertAlmostEqual(predictor.path.alpha, pipe.estimator.alpha)
+            self.assertTrue(np.allclose(pipe.score(data), predictor.score(data)))
+            self.assertTrue(np.allclose(pipe.score(data, alpha), predictor.score(data, alpha)))
+
+    def test_selects_alpha_on_train_folds(self):
+        data = pd.DataFrame(self.x, columns=['wage', 'add', 'w_1', 'w_2', 'w_3']).assign(id=range(80), edu_index=self.y)
+        with tempfile.TemporaryDirectory() as storage, tempfile.TemporaryDirectory() as models:
+            dataset = Dataset(data, 'data', 'edu_index', storage, seed=36)
+            estimator = joblib.load(fit_path(dataset, 3, 20, 1e-3, models, n_folds=4, seed=36)).estimator
+            rmse = cross_validate(fit_ridge_path, make_folds(dataset, 4, 36), estimator.alphas)
+
+            self.assertTrue(np.allclose(estimator.rmse, rmse))
+            self.assertEqual(estimator.alpha, estimator.alphas[int(np.argmin(rmse))])
+
+
+class TestPreprocessing(unittest.TestCase):
+
+    def setUp(self):
+        self.x = pd.DataFrame({
+            'id': range(1, 41),
+            'wage': [float(i) if i % 3 else None for i in range(40)],
+            'add': [None if i % 4 else float(i) for i in range(40)],
+            'const': [1.0] * 40,
+            'kind': [['a', 'b', 'c', None][i % 4] for i in range(40)],
+        })
+
+    def test_matches_column_transformer(self):
+        preprocessing = Preprocessing(self.x)
+        legacy = Preprocessing(self.x)
+        legacy.mean = None
+        legacy.column_transformer = ColumnTransformer([
+            ('ohe', OneHotEncoder(handle_unknown='ignore'), legacy.cat),
+            ('scaling', StandardScaler(), legacy.num)
+        ]).fit(self.x.assign(kind=self.x.kind.astype(str), add=self.x['add'].isna().astype(int))
+               .fillna(legacy.fill_values))
+        before = self.x.copy()
+        x_test = self.x.assign(kind=['d'] + list(self.x.kind[1:]))
+
+        self.assertTrue(np.allclose(preprocessing.fit_transform(self.x), legacy.transform(self.x)))
+        self.assertTrue(np.allclose(preprocessing.transform(x_test), legacy.transform(x_test)))
+        pd.testing.assert_frame_equal(self.x, before)
+
+
+class TestGetData(unittest.TestCase):
+
+    def test_fetch(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cfg = {'SQLALCHEMY_DATABASE': f'sqlite:///{directory}/data.sqlite', 'FETCH_CHUNK_SIZE': 2}
+            engine = create_engine(cfg['SQLALCHEMY_DATABASE'])
+            db.metadata.create_all(bind=engine, tables=[Data.__table__])
+            with engine.begin() as connection:
+                connection.execute(Data.__table__.insert(), [
+                    {'id': 3, 'edu_index': 1.5, 'wage': None},
+                    {'id': 1, 'edu_index': 2.5, 'wage': 10.0},
+                    {'id': 2, 'edu_index': None, 'wage': 20.0}
+                ])
+            engine.dispose()
+            data = get_data(cfg)
+
+        self.assertListEqual(list(data.columns), list(DataSheetIndexes.name_values_dict().keys()))
+        self.assertListEqual(data['id'].tolist(), [1, 2, 3])
+        self.assertEqual(data['id'].dtype, 'int64')
+        self.assertTrue((data.drop(columns='id').dtypes == 'float64').all())
+        self.assertTrue(data['add'].isna().all())
+        self.assertListEqual(data['wage'].fillna(-1).tolist(), [10.0, 20.0, -1])
+
+    def test_shared_engine(self):
+        database = 'sqlite://'
+        for _ in range(2):
+            with DatabaseSession(database):
+                pass
+
+        self.assertIs(engines.get(database), engines.get(database))
+        self.assertEqual(engines.metrics[database]['checkouts'], 2)
+
+
+def workbook_rows(n: int, offset: float = 0.0) -> list:
+    width = len(DataSheetIndexes) - 1
+    return [(i, *(float(i * 1000 + j) + offset if (i + j) % 5 else None for j in range(width))) for i in range(1, n + 1)]
+
+
+def write_workbook(path: str, rows: list) -> str:
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = 'data'
+    columns = list(DataSheetIndexes.name_values_dict().keys())
+    sheet.append(columns)
+    for row in rows:
+        sheet.append(list(row))
+    about = workbook.create_sheet('about')
+    about.append(['id', 'var_name', 'var_description'])
+    for i, name in enumerate(columns[1:], 1):
+        about.append([i, name, name])
+    workbook.save(path)
+    return path
+
+
+def stored_rows(database: str) -> list:
+    with DatabaseSession(database) as session:
+        return [tuple(row) for row in session.query(*Data.__table__.columns).order_by(Data.id)]
+
+
+class TestIncrementalImport(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.database = 'sqlite:///' + os.path.join(self.dir.name, 'data.sqlite')
+        self.file = os.path.join(self.dir.name, 'data.xlsx')
+        self.logger = logging.getLogger('test-import')
+
+    def tearDown(self):
+        engines.configure(5, 10, 30, -1, False)
+        self.dir.cleanup()
+
+    def run_import(self, rows: list):
+        write_workbook(self.file, rows)
+        DatabaseInitializer(self.database, self.file, self.logger, incremental=True).init_db()
+
+    def test_unchanged_file_is_skipped(self):
+        self.run_import(workbook_rows(5))
+        with self.assertLogs('test-import', level='INFO') as logs:
+            DatabaseInitializer(self.database, self.file, self.logger, incremental=True).init_db()
+
+        self.assertTrue(any('Import skipped' in line for line in logs.output))
+        self.assertListEqual(stored_rows(self.database), workbook_rows(5))
+
+    def test_changed_and_removed_rows(self):
+        self.run_import(workbook_rows(5))
+        rows = workbook_rows(5)
+        rows[1] = workbook_rows(5, 0.5)[1]
+        del rows[3]
+        self.run_import(rows)
+
+        self.assertListEqual(stored_rows(self.database), rows)
+        with DatabaseSession(self.database) as session:
+            self.assertListEqual([i for i, in session.query(DataHash.id).order_by(DataHash.id)], [1, 2, 3, 5])
+
+    def test_existing_data_table(self):
+        engine = engines.get(self.database)
+        db.metadata.create_all(bind=engine, tables=[Data.__table__])
+        columns = list(DataSheetIndexes.name_values_dict().keys())
+        with engine.begin() as connection:
+            connection.execute(Data.__table__.insert(), [dict(zip(columns, row)) for row in workbook_rows(6, 0.5)])
+        self.run_import(workbook_rows(4))
+
+        self.assertListEqual(stored_rows(self.database), workbook_rows(4))
+
+
+class TestInsertRows(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.database = 'sqlite:///' + os.path.join(self.dir.name, 'data.sqlite')
+        self.rows = 600
+
+    def tearDown(self):
+        engines.configure(5, 10, 30, -1, False)
+        self.dir.cleanup()
+
+    def test_workbook(self):
+        rows = workbook_rows(self.rows)
+        initializer = DatabaseInitializer(self.database, write_workbook(os.path.join(self.dir.name, 'data.xlsx'), rows),
+                                          logging.getLogger('test'), chunk_size=400)
+
+        self.assertGreater(self.rows, initializer.chunk_size)
+        self.assertGreater(initializer.chunk_size * len(DataSheetIndexes), SQLITE_MAX_VARIABLES)
+        initializer.init_db()
+        self.assertListEqual(stored_rows(self.database), rows)
+        with DatabaseSession(self.database) as session:
+            self.assertEqual(session.query(DataHash).count(), self.rows)
+            self.assertEqual(session.query(Info).count(), len(DataSheetIndexes) - 1)
+
+    def test_sink(self):
+        sink = make_sink(os.path.join(self.dir.name, 'crawl'), self.rows, chunk_size=250)
+        DatabaseInitializer(self.database, sink, logging.getLogger('test'), chunk_size=400).init_db()
+
+        expected = pd.concat([make_data(min(250, self.rows - start), 36 + start).assign(id=lambda d: d.id + start)
+                              for start in range(0, self.rows, 250)])
+        stored = pd.DataFrame(stored_rows(self.database), columns=expected.columns, dtype=float)
+        pd.testing.assert_frame_equal(stored, expected.reset_index(drop=True).astype(float))
+
+
+class TestSplitStorage(unittest.TestCase):
+
+    def test_round_trip(self):
+        data = pd.DataFrame({'edu_index': [1.0, 2.0, None], 'wage': [3.0, None, 5.0]}, index=[7, 3, 5])
+        with tempfile.TemporaryDirectory() as directory:
+            for storage_format in EXTENSIONS:
+                file = save_frame(data, os.path.join(directory, 'split'), storage_format)
+                pd.testing.assert_frame_equal(load_frame(file), data, check_index_type=False)
+
+    def test_dataset_from_split(self):
+        data = pd.DataFrame({'id': range(10), 'edu_index': [float(i) for i in range(10)], 'wage': [1.0] * 10})
+        with tempfile.TemporaryDirectory() as directory:
+            dataset = Dataset(data, 'data', 'edu_index', directory)
+            loaded = Dataset.from_split(*dataset.split_files, 'data', 'edu_index')
+
+            pd.testing.assert_frame_equal(loaded.x_train, dataset.x_train)
+            pd.testing.assert_series_equal(loaded.y_test, dataset.y_test)
+            self.assertListEqual(loaded.features, dataset.features)
+
+    def test_iter_frame(self):
+        data = pd.DataFrame({'edu_index': np.arange(10) + .5, 'wage': np.arange(10) * 2.5}, index=range(10, 20))
+        with tempfile.TemporaryDirectory() as directory:
+            for storage_format in EXTENSIONS:
+                file = save_frame(data, os.path.join(directory, 'split'), storage_format)
+                chunks = list(iter_frame(file, 4))
+
+                self.assertListEqual([len(c) for c in chunks], [4, 4, 2])
+                pd.testing.assert_frame_equal(pd.concat(chunks)[data.columns].reset_index(drop=True),
+                                              data.reset_index(drop=True))
+
+
+class TestBatchPrediction(unittest.TestCase):
+
+    def test_predict_batch(self):
+        rng = np.random.default_rng(36)
+        data = pd.DataFrame({'id': np.arange(100), 'wage': rng.normal(size=100), 'edu_index': rng.normal(size=100)})
+        with tempfile.TemporaryDirectory() as directory:
+            path = train(data, directory, 3, None, directory, slim_artifact=True)
+            pipe = joblib.load(path)
+            file = save_frame(data, os.path.join(directory, 'input'), 'parquet')
+            runs = [predict_batch(path, iter_frame(file, 30), directory, n_jobs=2) for _ in range(2)]
+            prediction = pd.read_parquet(runs[0]['path']).sort_values('id')
+
+            self.assertNotEqual(runs[0]['run_id'], runs[1]['run_id'])
+            self.assertEqual(runs[0]['rows'], 100)
+            self.assertEqual(runs[0]['parts'], 4)
+            self.assertTrue(os.path.exists(os.path.join(runs[0]['path'], '_run.json')))
+            self.assertTrue(np.allclose(prediction['prediction'], pipe.score(data)))
+            self.assertNotEqual(pipe.save_predict(prediction['prediction'], directory),
+                                pipe.save_predict(prediction['prediction'], directory))
+
+
+class TestSettings(unittest.TestCase):
+
+    def test_build_and_reload(self):
+        with tempfile.TemporaryDirectory() as directory:
+            override = os.path.join(directory, 'override.yaml')
+            with open(override, 'w') as f:
+                f.write('SEED: 1\nSTORAGE_PATH: /tmp/splits\n')
+            with unittest.mock.patch.dict(os.environ, {CONFIG_ENV_VAR: repr(override), 'PATH_EPS': '1'}):
+                store = SettingsStore()
+                settings = store.get()
+                reloaded = []
+                store.subscribe(reloaded.append)
+
+                self.assertIs(store.get(), settings)
+                self.assertEqual(settings['SEED'], 1)
+                self.assertEqual(settings['PATH_EPS'], 1.0)
+                self.assertEqual(settings.storage_path, '/tmp/splits')
+                self.assertEqual(settings.estimated_models_path, os.path.join(os.getcwd(), 'res/estimated_models'))
+                self.assertFalse(store.reload())
+
+                with open(override, 'w') as f:
+                    f.write('SEED: 2\nSTORAGE_PATH: /tmp/other\n')
+                os.utime(override, ns=(0, os.stat(override).st_mtime_ns + 10 ** 9))
+
+                self.assertTrue(store.reload())
+                self.assertEqual(store.get()['SEED'], 2)
+                self.assertEqual(store.get().storage_path, '/tmp/splits')
+                self.assertListEqual(reloaded, [store.get()])
+                with self.assertRaises(AttributeError):
+                    settings.config = {}
+                with self.assertRaises(TypeError):
+                    store.get().config['SEED'] = 3
+                self.assertEqual(pickle.loads(pickle.dumps(store.get())), store.get())
+
+    def test_types(self):
+        with self.assertRaises(ConfigError):
+            check_types({'SEED': 'a'}, {'SEED': 36})
+        with self.assertRaises(ConfigError):
+            check_types({'DEBUG': 1}, {'DEBUG': True})
+        self.assertDictEqual(check_types({'PATH_EPS': 1, 'DATA_PATH': 'x'}, {'PATH_EPS': 0.1, 'DATA_PATH': None}),
+                             {'PATH_EPS': 1.0, 'DATA_PATH': 'x'})
+
+
+def shared_metrics_job(directory):
+    metrics.reset()
+    metrics.share(directory)
+    metrics.observe('shared', 1.0, 0.5, 10)
+    metrics.flush()
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_spans(self):
+        collector, worker = Metrics(), Metrics()
+        with collector.span('fit_estimator') as span:
+            span.rows = 10
+        collector.traced('load_model', rows=len)(lambda: [1, 2])()
+        worker.observe('fit_estimator', 2.0, 1.0, 5)
+        collector.merge(worker.drain())
+        text = collector.render({'jobs': ('Known jobs by status', [({'status': 'completed'}, 1)])})
+
+        self.assertDictEqual(worker.stages, {})
+        self.assertIn('mlops_stage_calls_total{stage="fit_estimator"} 2.0', text)
+        self.assertIn('mlops_stage_rows_total{stage="fit_estimator"} 15.0', text)
+        self.assertIn('mlops_stage_rows_total{stage="load_model"} 2.0', text)
+        self.assertIn('mlops_stage_seconds_max{stage="fit_estimator"} 2.0', text)
+        self.assertIn('mlops_jobs{status="completed"} 1.0', text)
+
+    def test_cpu_scope(self):
+        collector = Metrics()
+
+        def spin():
+            end = time.thread_time() + 0.2
+            while time.thread_time() < end:
+                pass
+
+        for stage, fan_out in (('single', False), ('fan_out', True)):
+            with collector.span(stage, fan_out=fan_out):
+                thread = threading.Thread(target=spin)
+                thread.start()
+                thread.join()
+        text = collector.render()
+
+        self.assertLess(collector.stages['single'].cpu, 0.1)
+        self.assertGreaterEqual(collector.stages['fan_out'].cpu, 0.2)
+        self.assertIn('mlops_stage_cpu_seconds_total{stage="single",scope="thread"}', text)
+        self.assertIn('mlops_stage_cpu_seconds_total{stage="fan_out",scope="process"}', text)
+
+    def test_collect_across_processes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for _ in range(2):
+                process = multiprocessing.get_context('fork').Process(target=shared_metrics_job, args=(directory,))
+                process.start()
+                process.join()
+            local = Metrics()
+            local.share(directory)
+            local.observe('shared', 2.0, 1.0, 5)
+            combined = local.collect()
+
+            self.assertEqual(combined.stages['shared'].calls, 3)
+            self.assertEqual(combined.stages['shared'].rows, 25)
+            self.assertListEqual(sorted(name for name in os.listdir(directory) if name.endswith('.json')),
+                                 sorted([RETIRED, os.path.basename(local.file)]))
+
+            local.close()
+            self.assertListEqual([name for name in os.listdir(directory) if name.endswith('.json')], [RETIRED])
+            self.assertEqual(local.collect().stages['shared'].calls, 3)
+
+    def test_logged_without_logger(self):
+
+        @logged
+        def insert_rows():
+            return 3
+
+        with self.assertLogs(level='INFO') as logs:
+            self.assertEqual(insert_rows(), 3)
+        self.assertIn('3 rows', logs.output[-1])
+        self.assertGreaterEqual(metrics.stages['insert_rows'].rows, 3)
+
+    def test_endpoint(self):
+        response = app.test_client().get('/metrics')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        self.assertIn('mlops_peak_rss_bytes{process="app"}', response.get_data(as_text=True))
+
+
+def echo_job(cfg, kwargs, timings):
+    return {'echo': kwargs['model_id']}
+
+
+def crash_job(cfg, kwargs, timings):
+    os._exit(1)
+
+
+class TestJobManager(unittest.TestCase):
+
+    def test_submit_and_cancel(self):
+        manager = JobManager(workers=1, queue_size=1)
+        try:
+            first = manager.submit(echo_job, {}, {'model_id': 1})
+            second = manager.submit(echo_job, {}, {'model_id': 2})
+            self.assertTrue(manager.cancel(second.job_id))
+            third = manager.submit(echo_job, {}, {'model_id': 3})
+
+            self.assertEqual(first.future.result(timeout=60)['echo'], 1)
+            self.assertEqual(third.future.result(timeout=60)['echo'], 3)
+            self.assertSetEqual(set(first.future.result()), {'started', 'finished', 'timings', 'echo'})
+            self.assertListEqual([j['status'] for j in manager.list()], ['completed', 'cancelled', 'completed'])
+        finally:
+            manager.shutdown()
+
+    def test_recovers_from_crashed_worker(self):
+        manager = JobManager(workers=1, queue_size=None)
+        try:
+            crashed = manager.submit(crash_job, {}, {'model_id': 1})
+            queued = manager.submit(echo_job, {}, {'model_id': 2})
+            with self.assertRaises(Exception):
+                crashed.future.result(timeout=60)
+            after = manager.submit(echo_job, {}, {'model_id': 3})
+
+            self.assertEqual(crashed.status, 'failed')
+            self.assertEqual(after.future.result(timeout=60)['echo'], 3)
+            self.assertEqual(queued.future.result(timeout=60)['echo'], 2)
+            self.assertEqual(manager.running, 0)
+        finally:
+            manager.shutdown()
+
+
+def sleep_job(cfg, kwargs, timings):
+    time.sleep(kwargs['seconds'])
+    return {'slept': kwargs['seconds']}
+
+
+class TestJobServer(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        tests_path = os.path.dirname(os.path.abspath(__file__))
+        with unittest.mock.patch.dict(os.environ, {
+            'TRAINING_WORKERS': '1',
+            'TRAINING_QUEUE_SIZE': '1',
+            'METRICS_PATH': repr(self.directory),
+            'PYTHONPATH': os.pathsep.join(filter(None, [tests_path, os.environ.get('PYTHONPATH')]))
+        }):
+            self.address = start_server()
+        connect_server()
+
+    def tearDown(self):
+        stop_server()
+        shutil.rmtree(self.directory)
+
+    def test_jobs_over_socket(self):
+        manager = job_manager()
+        running = manager.enqueue(sleep_job, {}, {'model_id': 1, 'seconds': 1})
+        queued = manager.enqueue(echo_job, {}, {'model_id': 2})
+
+        self.assertIsNot(manager, jobs)
+        self.assertEqual(running['status'], 'running')
+        self.assertEqual(queued['status'], 'queued')
+        self.assertTrue(manager.cancel(queued['job_id']))
+        self.assertEqual(manager.describe(queued['job_id'])['status'], 'cancelled')
+        self.assertIsNone(manager.describe('missing'))
+        deadline = time.monotonic() + 60
+        while manager.describe(running['job_id'])['status'] == 'running' and time.monotonic() < deadline:
+            time.sleep(0.1)
+        self.assertEqual(manager.describe(running['job_id'])['slept'], 1)
+        self.assertListEqual([job['status'] for job in manager.list()], ['completed', 'cancelled'])
+
+        stop_server()
+        self.assertIs(job_manager(), jobs)
+        self.assertFalse(os.path.exists(self.address))
+
+    def test_queue_full_is_429(self):
+        job_manager().enqueue(sleep_job, {}, {'model_id': 1, 'seconds': 1})
+        job_manager().enqueue(sleep_job, {}, {'model_id': 2, 'seconds': 1})
+        response = app.test_client().post('/model_parameters/search')
+
+        self.assertEqual(response.status_code, 429)
+
+
+class ParserStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    fixtures = os.path.join(os.path.dirname(__file__), 'fixtures', 'parser')
+    routes = {
+        '/index.php?m=vpo': 'index.html',
+        '/_vpo/material.php?type=2&id=1': 'region_1.html',
+        '/_vpo/material.php?type=2&id=2': 'region_2.html',
+        '/_vpo/inst.php?id=1': 'inst_1.html',
+        '/_vpo/inst.php?id=2': 'inst_2.html',
+        '/_vpo/inst.php?id=3': 'inst_3.html',
+        '/_vpo/inst.php?id=1944': 'inst_1944.html'
+    }
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        self.server.clients.add(self.client_address)
+        if self.server.failures.get(self.path, 0):
+            self.server.failures[self.path] -= 1
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path not in self.routes:
+            self.send_error(404)
+            return
+        with open(os.path.join(self.fixtures, self.routes[self.path]), 'rb') as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestParser(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ParserStubHandler)
+        self.server.requests, self.server.clients, self.server.failures = [], set(), {'/_vpo/inst.php?id=2': 1}
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}/'
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.dir.cleanup()
+
+    def run_parser(self) -> pd.DataFrame:
+        directory = run_parser(self.base_url, os.path.join(self.dir.name, 'crawl'), workers=4, per_host=2, backoff=0)
+        return pd.concat([pd.read_parquet(path) for path in partitions(directory)]).set_index('university')
+
+    def test_crawl(self):
+        data = self.run_parser()
+
+        self.assertListEqual(list(data.index), ['University One', 'University Two', 'University Three'])
+        self.assertListEqual(list(data.inst_id), [1, 2, 3])
+        self.assertListEqual(list(data.columns)[-3:], ['Education', 'Research', 'Finance'])
+        self.assertListEqual(list(data.loc['University Two'])[1:],
+                             ['region 2', 'address 2', 'website 2', 'department 2', 'type 2', 'profile 2',
+                              '20.5', '21.5', '22.5'])
+        self.assertEqual(self.server.requests.count('/_vpo/inst.php?id=2'), 2)
+        self.assertLess(len(self.server.clients), len(self.server.requests))
+
+    def test_resume(self):
+        columns = ['Region', 'Address', 'Website', 'Department', 'Type', 'Profile', 'Education', 'Research', 'Finance']
+        ParquetSink(os.path.join(self.dir.name, 'crawl')).write('Region One', columns,
+                                                                [(1, 'University One', ['cached'] * 9)])
+        data = self.run_parser()
+
+        self.assertListEqual(list(data.loc['University One'])[1:], ['cached'] * 9)
+        self.assertNotIn('/_vpo/material.php?type=2&id=1', self.server.requests)
+        self.assertIn('/_vpo/inst.php?id=3', self.server.requests)
+
+    def test_import_crawl(self):
+        directory = run_parser(self.base_url, os.path.join(self.dir.name, 'crawl'), workers=4, backoff=0)
+        database = 'sqlite:///' + os.path.join(self.dir.name, 'db.sqlite')
+        DatabaseInitializer(database, directory, logging.getLogger('test')).init_db()
+
+        with DatabaseSession(database) as session:
+            rows = session.query(Data.id, Data.edu_index, Data.science_index, Data.inter_index, Data.fin_index)
+            info = session.query(Info.var_name, Info.var_description).order_by(Info.id).all()
+            self.assertListEqual([tuple(r) for r in rows.order_by(Data.id)],
+                                 [(1, 10.5, 11.5, 12.5, None), (2, 20.5, 21.5, 22.5, None),
+                                  (3, 30.5, 31.5, 32.5, None)])
+        self.assertListEqual([tuple(r) for r in info],
+                             [('edu_index', 'Education'), ('science_index', 'Research'), ('inter_index', 'Finance')])
+
+
+def test_university_data_backends(monkeypatch):
+    with open(os.path.join(ParserStubHandler.fixtures, 'inst_3.html'), 'rb') as f:
+        html = f.read()
+    expected = ['region 3', 'address 3', 'website 3', 'department 3', 'type 3', 'profile 3', '30.5', '31.5', '32.5']
+
+    assert get_university_data(html) == expected
+    monkeypatch.setattr(parser, 'lxml', None)
+    assert get_university_data(html) == expected
+
+
+@pytest.fixture(scope='module')
+def get_fixture_data():
+    df = pd.read_excel(os.path.join(os.path.dirname(__file__), '..', 'data', 'dataset', 'data.xlsx'), sheet_name='data')
     return df
 
 
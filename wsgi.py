@@ -0,0 +1,4 @@
+from app import app, startup
+from domain.config import get_settings
+
+startup(get_settings(), watch=False)